@@ -86,4 +86,11 @@ def create_app(config_name):
         app.register_blueprint(system_unit_bp, url_prefix='/api/system-unit')
         app.register_blueprint(healthcheck_bp, url_prefix='/healthcheck')
         app.register_blueprint(errors_bp)
+
+        from .utils.benchmark import benchmark_cli
+        from .utils.downsampling import saih_cli
+        from .utils.jobs import jobs_cli
+        app.cli.add_command(benchmark_cli)
+        app.cli.add_command(saih_cli)
+        app.cli.add_command(jobs_cli)
     return app
@@ -1,7 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 
 from ..models.demand_unit import DemandUnitModel, demand_units_schema
 from ..utils.geoutils import inflates_geometry
+from ..utils.plan_store import read_simulation_summary
+from .co2 import EMISSION_LAYERS
+from .hydro_economic import INCOME_LAYERS
 demand_unit_bp = Blueprint('demand-unit', __name__)
 
 
@@ -54,3 +57,33 @@ def get_by_position():
         return jsonify({'status': 200, 'data': values, 'ok': True})
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
+def indicator_layer(errors, name, layer, *args):
+    try:
+        return layer(*args)
+    except Exception as e:
+        errors[name] = str(e)
+        return None
+
+
+@demand_unit_bp.route('/get-simulation-indicators', methods=['GET'])
+def get_simulation_indicators():
+    line = request.args.get('line')
+    period = request.args.get('period')
+
+    try:
+        # Read planification or optimization demand unit summary once for every map layer
+        summary, period_factor = read_simulation_summary(
+            current_app.config['DATA_FOLDER'], line, period)
+
+        # A failing layer is returned as None with its error, the other layers are still shown
+        errors = {}
+        emissions = {category: indicator_layer(errors, f'emissions.{category}', layer, summary, period_factor)
+                     for category, layer in EMISSION_LAYERS.items()}
+        hydro_economic = {category: indicator_layer(errors, f'hydroEconomic.{category}', layer, summary, period_factor, line)
+                          for category, layer in INCOME_LAYERS.items()}
+
+        return jsonify({'status': 200, 'data': {'emissions': emissions, 'hydroEconomic': hydro_economic, 'errors': errors}, 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
@@ -5,6 +5,7 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify
 
 from app.models import line2
+from app.utils import streaming
 
 
 line2_bp = Blueprint('line2', __name__)
@@ -165,8 +166,19 @@ def get_simulation_products():
     simulation_range = data.get('simulation_range') if data and 'simulation_range' in data else 0
     aggregation = data.get('aggregation') if data and 'aggregation' in data else None
     window = data.get('window') if data and 'window' in data else None
+    format = data.get('format') if data and 'format' in data else None
+
+    if format != None and format not in streaming.FORMATS:
+        return jsonify({'status': 400, 'title': 'Error', 'detail': f'Unsupported format, it must be one of {", ".join(streaming.FORMATS)}.', 'ok': False}), 400
 
     if variables != None and start_date != None and end_date != None:
+        # Bulk exports are streamed record by record instead of loaded as a whole
+        if format != None:
+            try:
+                return streaming.stream_response(line2.stream_dfs0_products(variables, start_date, end_date, simulation_range, aggregation, window),
+                                                 ['_time', '_value', 'variable'], format)
+            except Exception as e:
+                return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
         status, result = line2.get_dfs0_products(variables, start_date, end_date, simulation_range, aggregation, window)
         if status:
             return jsonify({'status': 200, 'data': json.loads(result), 'ok': True})
@@ -1,11 +1,9 @@
 import os
 import json
-import psutil
-import logging
-from multiprocessing import Process
 from flask import Blueprint, request, jsonify, current_app, send_file
 
-from app.utils import planner
+from app.utils import planner, jobs
+from app.models.simulation_job import SimulationJobModel, simulation_jobs_schema
 from app.utils.compute_rec import getResources
 from app.utils.compute_rec_dem_anual import getDemandResources
 
@@ -15,7 +13,19 @@ line4_bp = Blueprint('line4', __name__)
 
 DATA_FOLDER = current_app.config['DATA_FOLDER']
 PLAN_FOLDER = DATA_FOLDER + '/L4/OUT/'
-PIDFILE = planner.PIDFILE
+
+
+def plan_files(monthly, daily, job):
+    # Files of the requested job, or of the last finished one if no job is given
+    if job is None:
+        return planner.last_plan_files(monthly, daily)
+    return jobs.job_files('planner', job)
+
+
+def percent_scenario(scenario):
+    # Scenario percentages are sent as %, the model takes them as factors
+    return {water_type: float(scenario[water_type]) / 100 for water_type in planner.SCENARIO_WATER_TYPES
+            if water_type in scenario}
 
 
 @line4_bp.route('/generate-plan', methods=['POST'])
@@ -39,24 +49,66 @@ def generate_plan():
         'monthly') == "true") if data is not None and 'monthly' in data else False
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
+    rolling = (request.args.get(
+        'rolling') == "true") if data is not None and 'rolling' in data else False
+
+    try:
+        job = jobs.submit('planner', {'superficial': superficial, 'subterranea': subterranea, 'reutilizada': reutilizada,
+                                      'trasvase': trasvase, 'desalada': desalada, 'monthly': monthly, 'daily': daily,
+                                      'rolling': rolling})
+        return jsonify({'status': 200, 'data': job.id, 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
-    if os.path.isfile(PIDFILE):
-        PID = int(open(PIDFILE).readline())
-        if psutil.pid_exists(PID):
-            return jsonify({'status': 202, 'title': 'Simulation already running',
-                            'detail': 'Simulation is already running. Please wait to finish to start a new one.', 'ok': False}), 202
-        else:
-            os.unlink(PIDFILE)
-            logging.warning('Last simulation may have terminated abnormally!')
-            # return jsonify({'status': 503, 'title': 'Simulation terminated abnormally',
-            #     'detail': 'Last simulation may have terminated abnormally, please retry.', 'ok': False}), 503
+
+@line4_bp.route('/generate-batch', methods=['POST'])
+def generate_batch():
+    data = request.get_json()
+    scenarios = data.get(
+        'scenarios') if data is not None and 'scenarios' in data else []
+    grid = data.get('grid') if data is not None and 'grid' in data else {}
+    data = request.args
+
+    monthly = (request.args.get(
+        'monthly') == "true") if data is not None and 'monthly' in data else False
+    daily = (request.args.get(
+        'daily') == "true") if data is not None and 'daily' in data else False
+
+    try:
+        batch = planner.batch_scenarios([percent_scenario(scenario) for scenario in scenarios],
+                                        {water_type: [float(value) / 100 for value in values]
+                                         for water_type, values in grid.items()})
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'status': 400, 'title': 'Bad Request', 'detail': str(e), 'ok': False}), 400
 
     try:
-        process_name = 'planner-monthly' if monthly else 'planner-daily'
-        planner_proc = Process(name=process_name, target=planner.generate_plan,
-                               args=(superficial, subterranea, reutilizada, trasvase, desalada, monthly, daily))
-        planner_proc.start()
-        return jsonify({'status': 200, 'data': planner_proc.pid, 'ok': True})
+        id = jobs.submit_batch(
+            'batch-scenario', planner.batch_params(batch, monthly, daily))
+        return jsonify({'status': 200, 'data': id, 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
+@line4_bp.route('/batch-comparison', methods=['GET'])
+def batch_comparison():
+    id = request.args.get('id')
+    try:
+        batch = jobs.get_batch(id)
+        if len(batch) == 0:
+            return jsonify({'status': 404, 'title': 'Error', 'detail': 'Batch not found', 'ok': False}), 404
+        failed = [job for job in batch if job.status == SimulationJobModel.FAILED]
+        if len(failed) > 0:
+            return jsonify({'status': 500, 'title': 'Error', 'detail': failed[0].error, 'ok': False}), 500
+        finished = [job for job in batch if job.status == SimulationJobModel.FINISHED]
+        if len(finished) < len(batch):
+            return jsonify({'status': 201, 'title': 'Still not ready',
+                            'detail': f'{len(finished)} of {len(batch)} scenarios simulated. Please try again in a moment.',
+                            'ok': True}), 201
+
+        params = json.loads(batch[0].params)
+        data = planner.batch_comparison([job.result_folder for job in batch], params['start'], params['end'],
+                                        max(job.finished for job in batch))
+        return jsonify({'status': 200, 'data': data, 'ok': True})
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
@@ -64,24 +116,42 @@ def generate_plan():
 @line4_bp.route('/check-plan-generated', methods=['GET'])
 def check_plan_generated():
     data = request.args
-    PID = int(request.args.get('id')
-              ) if data is not None and 'id' in data else False
+    id = request.args.get('id') if data is not None and 'id' in data else None
     try:
-        if PID and psutil.pid_exists(PID):
-            proc = psutil.Process(PID)
-            if proc.status() == 'running':
+        job = jobs.get_job(id) if id is not None else None
+        if job is not None:
+            if job.status in [SimulationJobModel.QUEUED, SimulationJobModel.RUNNING]:
                 return jsonify({'status': 201, 'title': 'Still not ready',
                                 'detail': 'Simulation is not finished yet. Please try again in a moment.', 'ok': True}), 201
-            elif proc.status() == 'zombie':
-                proc.kill()
+            elif job.status == SimulationJobModel.FAILED:
+                return jsonify({'status': 500, 'title': 'Error', 'detail': job.error, 'ok': False}), 500
 
-        if os.path.isfile(PIDFILE):
-            os.unlink(PIDFILE)
         return jsonify({'status': 200, 'ok': True})
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
 
+@line4_bp.route('/get-jobs', methods=['GET'])
+def get_jobs():
+    try:
+        data = simulation_jobs_schema.dump(jobs.get_jobs('planner'))
+        return jsonify({'status': 200, 'data': data, 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
+@line4_bp.route('/get-job', methods=['GET'])
+def get_job():
+    id = request.args.get('id')
+    try:
+        job = jobs.get_job(id)
+        if job is None or job.type != 'planner':
+            return jsonify({'status': 404, 'title': 'Error', 'detail': 'Job not found', 'ok': False}), 404
+        return jsonify({'status': 200, 'data': jobs.job_status(job), 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
 @line4_bp.route('/plan-config-data', methods=['GET'])
 def get_plan_config():
     data = request.args
@@ -89,15 +159,10 @@ def get_plan_config():
         'monthly') == "true") if data is not None and 'monthly' in data else False
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
-    if monthly:
-        if daily:
-            file = PLAN_FOLDER+"/SIMUL_M/last_daily_plan_data.json"
-        else:
-            file = PLAN_FOLDER+"/SIMUL_M/last_monthly_plan_data.json"
-    else:
-        file = PLAN_FOLDER+"/SIMUL_S/last_daily_plan_data.json"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = plan_files(monthly, daily, job)[1]
 
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
 
@@ -138,15 +203,10 @@ def table_data():
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
 
-    if monthly:
-        if daily:
-            file = PLAN_FOLDER+"/SIMUL_M/last_daily.csv"
-        else:
-            file = PLAN_FOLDER+"/SIMUL_M/last_monthly.csv"
-    else:
-        file = PLAN_FOLDER+"/SIMUL_S/last_daily.csv"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = plan_files(monthly, daily, job)[0]
 
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
 
@@ -171,15 +231,10 @@ def plot_data():
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
 
-    if monthly:
-        if daily:
-            file = PLAN_FOLDER+"/SIMUL_M/last_daily.csv"
-        else:
-            file = PLAN_FOLDER+"/SIMUL_M/last_monthly.csv"
-    else:
-        file = PLAN_FOLDER+"/SIMUL_S/last_daily.csv"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = plan_files(monthly, daily, job)[0]
 
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
 
@@ -202,16 +257,11 @@ def download_plan():
         'long') == "true") if data is not None and 'long' in data else False
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
+    job = request.args.get('job') if data is not None and 'job' in data else None
     try:
-        if long:
-            if daily:
-                file = PLAN_FOLDER+"/SIMUL_M/last_daily.csv"
-            else:
-                file = PLAN_FOLDER+"/SIMUL_M/last_monthly.csv"
-        else:
-            file = PLAN_FOLDER+"/SIMUL_S/last_daily.csv"
+        file = plan_files(long, daily, job)[0]
 
-        if not os.path.isfile(file):
+        if file is None or not os.path.isfile(file):
             return jsonify({'status': 204, 'data': [], 'ok': True}), 204
         return send_file(file, as_attachment=True, attachment_filename='plan.csv'), 200
     except Exception as e:
@@ -1,11 +1,9 @@
 import os
 import json
-import psutil
-import logging
-from multiprocessing import Process
 from flask import Blueprint, request, jsonify, current_app, send_file
 
-from app.utils import optimizer, planner
+from app.utils import optimizer, planner, jobs
+from app.models.simulation_job import SimulationJobModel, simulation_jobs_schema
 
 
 line5_bp = Blueprint('line5', __name__)
@@ -13,7 +11,13 @@ line5_bp = Blueprint('line5', __name__)
 DATA_FOLDER = current_app.config['DATA_FOLDER']
 PLAN_FOLDER = DATA_FOLDER + '/L4/OUT/'
 OPTIMIZER_FOLDER = DATA_FOLDER + '/L5/OUT/'
-PIDFILE = optimizer.PIDFILE
+
+
+def optimized_plan_files(monthly, daily, job):
+    # Files of the requested job, or of the last finished one if no job is given
+    if job is None:
+        return optimizer.last_plan_files(monthly, daily)
+    return jobs.job_files('optimizer', job)
 
 
 @line5_bp.route('/generate-optimized-plan', methods=['POST'])
@@ -43,23 +47,11 @@ def generate_plan():
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
     
-    if os.path.isfile(PIDFILE):
-        PID = int(open(PIDFILE).readline())
-        if psutil.pid_exists(PID):
-            return jsonify({'status': 202, 'title': 'Simulation already running', 
-                'detail': 'Simulation is already running. Please wait to finish to start a new one.', 'ok': False}), 202
-        else:
-            os.unlink(PIDFILE)
-            logging.warning('Last simulation may have terminated abnormally!')
-            # return jsonify({'status': 503, 'title': 'Simulation terminated abnormally', 
-            #     'detail': 'Last simulation may have terminated abnormally, please retry.', 'ok': False}), 503
-    
     try:
-        process_name = 'optimizer-monthly' if monthly else 'optimizer-daily'
-        optimizer_proc = Process(name=process_name, target=optimizer.generate_optimzied_plan, 
-                args=(superficial, subterranea, reutilizada, trasvase, desalada, waterDeficit, CO2impact, economicImpact, monthly, daily))
-        optimizer_proc.start()
-        return jsonify({'status': 200, 'data': optimizer_proc.pid, 'ok': True})
+        job = jobs.submit('optimizer', {'superficial': superficial, 'subterranea': subterranea, 'reutilizada': reutilizada,
+                                        'trasvase': trasvase, 'desalada': desalada, 'waterDeficit': waterDeficit, 'CO2impact': CO2impact,
+                                        'economicImpact': economicImpact, 'monthly': monthly, 'daily': daily})
+        return jsonify({'status': 200, 'data': job.id, 'ok': True})
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
@@ -67,22 +59,42 @@ def generate_plan():
 @line5_bp.route('/check-optimized-plan-generated', methods=['GET'])
 def check_optimized_plan_generated():
     data = request.args
-    PID = int(request.args.get('id')) if data is not None and 'id' in data else False
+    id = request.args.get('id') if data is not None and 'id' in data else None
     try:
-        if PID and psutil.pid_exists(PID):
-            proc = psutil.Process(PID)
-            if proc.status() == 'running':
+        job = jobs.get_job(id) if id is not None else None
+        if job is not None:
+            if job.status in [SimulationJobModel.QUEUED, SimulationJobModel.RUNNING]:
                 return jsonify({'status': 201, 'title': 'Still not ready', 
                     'detail': 'Simulation is not finished yet. Please try again in a moment.', 'ok': True}), 201
-            elif proc.status() == 'zombie':
-                proc.kill()
-        
-        if os.path.isfile(PIDFILE): os.unlink(PIDFILE)
+            elif job.status == SimulationJobModel.FAILED:
+                return jsonify({'status': 500, 'title': 'Error', 'detail': job.error, 'ok': False}), 500
+
         return jsonify({'status': 200, 'ok': True})
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
 
+@line5_bp.route('/get-jobs', methods=['GET'])
+def get_jobs():
+    try:
+        data = simulation_jobs_schema.dump(jobs.get_jobs('optimizer'))
+        return jsonify({'status': 200, 'data': data, 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
+@line5_bp.route('/get-job', methods=['GET'])
+def get_job():
+    id = request.args.get('id')
+    try:
+        job = jobs.get_job(id)
+        if job is None or job.type != 'optimizer':
+            return jsonify({'status': 404, 'title': 'Error', 'detail': 'Job not found', 'ok': False}), 404
+        return jsonify({'status': 200, 'data': jobs.job_status(job), 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
 @line5_bp.route('/optimized-plan-config-data', methods=['GET'])
 def get_optimized_plan_config():
     data = request.args
@@ -90,15 +102,10 @@ def get_optimized_plan_config():
         'monthly') == "true") if data is not None and 'monthly' in data else False
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
-    if monthly:
-        if daily:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_daily_optimized_plan_data.json"
-        else:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_monthly_optimized_plan_data.json"
-    else:
-        file = OPTIMIZER_FOLDER+"/SIMUL_S/last_daily_optimized_plan_data.json"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = optimized_plan_files(monthly, daily, job)[1]
     
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
     
@@ -121,15 +128,10 @@ def table_data():
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
     
-    if monthly:
-        if daily:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_daily.csv"
-        else:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_monthly.csv"
-    else:
-        file = OPTIMIZER_FOLDER+"SIMUL_S/last_daily.csv"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = optimized_plan_files(monthly, daily, job)[0]
     
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
     
@@ -154,25 +156,14 @@ def plot_data():
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
     
-    if monthly:
-        if daily:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_daily.csv"
-        else:
-            file = OPTIMIZER_FOLDER+"/SIMUL_M/last_monthly.csv"
-    else:
-        file = OPTIMIZER_FOLDER+"SIMUL_S/last_daily.csv"
+    job = request.args.get('job') if data is not None and 'job' in data else None
+    file = optimized_plan_files(monthly, daily, job)[0]
     
-    if not os.path.isfile(file):
+    if file is None or not os.path.isfile(file):
         # return jsonify({'status': 500, 'title': 'Error', 'detail': "No planification generated", 'ok': False}), 500
         return jsonify({'status': 202, 'title': 'Warning', 'detail': "No planification generated", 'ok': False}), 202
     
-    if monthly:
-        if daily:
-            old_plan_file = PLAN_FOLDER+"/SIMUL_M/last_daily.csv"
-        else:
-            old_plan_file = PLAN_FOLDER+"/SIMUL_M/last_monthly.csv"
-    else:
-        old_plan_file = PLAN_FOLDER+"/SIMUL_S/last_daily.csv"
+    old_plan_file = planner.last_plan_files(monthly, daily)[0]
     
     if not os.path.isfile(old_plan_file):
         old_plan_file = None
@@ -198,15 +189,10 @@ def download_plan():
         'long') == "true") if data is not None and 'long' in data else False
     daily = (request.args.get(
         'daily') == "true") if data is not None and 'daily' in data else False
+    job = request.args.get('job') if data is not None and 'job' in data else None
     try:
-        if long:
-            if daily:
-                file = OPTIMIZER_FOLDER+"/SIMUL_M/last_daily.csv"
-            else:
-                file = OPTIMIZER_FOLDER+"/SIMUL_M/last_monthly.csv"
-        else:
-            file = OPTIMIZER_FOLDER+"SIMUL_S/last_daily.csv"
-        if not os.path.isfile(file):
+        file = optimized_plan_files(long, daily, job)[0]
+        if file is None or not os.path.isfile(file):
             return jsonify({'status': 204, 'data': [], 'ok': True}), 204
         return send_file(file, as_attachment=True, attachment_filename='plan.csv'), 200
     except Exception as e:
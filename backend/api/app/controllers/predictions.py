@@ -6,10 +6,10 @@ import os
 import pandas as pd
 import json
 
-from app import influx_client
 from app.models.piezometry_value import PiezometerValue, piezometry_values_schema
 from app.models.variable import VariableModel
 from app.utils.odc_loader import load_geometry_stats
+from app.utils import flux
 from app.utils.geoutils import find_uda_stats, find_uda_stats_file, find_raster_file
 predictions_bp = Blueprint('predictions', __name__)
 OWS_URL = current_app.config['OWS_URL']
@@ -404,14 +404,13 @@ def get_data_from_odc(variable, forecasting_type):
         |> range(start: {start_time}) \
         |> filter(fn: (r) => r._measurement == "saih") \
         |> filter(fn: (r) => r._field == "value") \
-        |> filter(fn: (r) => r.variableCode == "{variable}") \
+        |> {flux.set_filter("variableCode", "variables")} \
         |> window(every: {agregate_window_width}) \
         |> {aggregation_function}() \
         |> duplicate(column: "_start", as: "_time") \
         |> keep(columns: ["_variableCode", "_time", "_value"])'
 
-    query_client = influx_client.query_api()
-    df_variables_data = query_client.query_data_frame(query)
+    df_variables_data = flux.query_data_frame(query, 'variables', [variable])
 
     return df_variables_data
 
@@ -1,9 +1,10 @@
 import os
 from flask import Blueprint, jsonify, current_app, request
-from datetime import datetime as dt, timedelta, date
+from datetime import timedelta, date
 import pandas as pd
 import numpy as np
 from app import influx_client
+from app.utils import flux
 import pickle as pkl
 import tensorflow as tf
 import json
@@ -82,32 +83,26 @@ def create_df(df, station, station_type, common_cols=COMMON_COLS):
 
 
 def query_data(column_names_dict, start, end):
+    # Hourly means of every variable of the station in a single query, pivoted by Influx to one column per variable
     query_client = influx_client.query_api()
-    df_query = pd.DataFrame()
-    for var in column_names_dict:
-        try:
-            query = f'from(bucket: "{BUCKET}") \
-                        |> range(start: time(v: "{start}"), stop: time(v: "{end}")) \
-                        |> filter(fn: (r) => r._measurement == "saih") \
-                        |> filter(fn: (r) => r._field == "value") \
-                        |> filter(fn: (r) => r.variableCode == "{var}") \
-                        |> keep(columns: ["_time", "_value", "variableCode"]) \
-                        |> aggregateWindow(every: 1h, fn: mean) \
-                        |> yield(name: "mean")'
-            result = query_client.query_data_frame(query)
-            df_query = pd.concat([df_query, result])
-        except Exception as e:
-            print(f"Error: {e}, var: {var}")
-    return df_query
-
-
-def pivot_df(df, column_names_dict):
-    df = df.copy()
-    df = df.rename(columns={"_time": "time", "_value": "value"})
-    df = df.pivot(index="time", columns="variableCode", values="value")
-    df = df.rename(columns=column_names_dict)
-    df.columns.name = None
-    df.index = df.index.tz_localize(None)
+    query = f'from(bucket: "{BUCKET}") \
+                |> range(start: time(v: params.start), stop: time(v: params.end)) \
+                |> filter(fn: (r) => r._measurement == "saih") \
+                |> filter(fn: (r) => r._field == "value") \
+                |> {flux.set_filter("variableCode", "variables")} \
+                |> keep(columns: ["_time", "_value", "variableCode"]) \
+                |> aggregateWindow(every: 1h, fn: mean) \
+                |> group() \
+                |> pivot(rowKey: ["_time"], columnKey: ["variableCode"], valueColumn: "_value") \
+                |> sort(columns: ["_time"])'
+    df = query_client.query_data_frame(query, params={'variables': list(column_names_dict), 'start': start, 'end': end})
+
+    if df.empty:
+        df = pd.DataFrame(columns=['_time'])
+    df = df.drop(columns=['result', 'table'], errors='ignore')
+    df = df.set_index(pd.DatetimeIndex(df.pop('_time'), name='time').tz_localize(None))
+    # Variables without data in the range are returned as empty columns
+    df = df.reindex(columns=list(column_names_dict)).rename(columns=column_names_dict)
     return df
 
 
@@ -269,10 +264,7 @@ def prediction():
         end = (today + timedelta(days=out_steps)
                ).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
-        df_query = query_data(column_names_dict, start, end)
-        dt.strptime(end, '%Y-%m-%dT%H:%M:%S.%fZ') - \
-            dt.strptime(start, '%Y-%m-%dT%H:%M:%S.%fZ')
-        df_query_pivot = pivot_df(df_query, column_names_dict)
+        df_query_pivot = query_data(column_names_dict, start, end)
 
         # clean outliers
         df_query_pivot_clean = clean_df(df_query_pivot)
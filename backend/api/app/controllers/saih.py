@@ -1,13 +1,30 @@
 from flask import Blueprint, request, jsonify, current_app
 import json
+import pandas as pd
 
 from app import influx_client
+from app.utils import flux, downsampling, streaming
 from app.models.control_point import ControlPointModel, control_points_schema
 from app.models.measurement_point import MeasurementPointModel, measurement_points_schema
 from app.models.variable import VariableModel, variables_schema
+from app.models.saih_last_value import SAIHLastValueModel
 
 saih_bp = Blueprint('saih', __name__)
 BUCKET = current_app.config['SAIH_BUCKET']
+# Age of the oldest value returned as the last value of a variable
+LAST_VALUES_DAYS = 60
+# Hours before a variable without values in the bucket is scanned again
+MISSING_VALUES_RECHECK_HOURS = 1
+
+_last_value_table_created = False
+
+
+def last_value_table():
+    # The last value table of deployments older than it is created on first use
+    global _last_value_table_created
+    if not _last_value_table_created:
+        SAIHLastValueModel.create_table()
+        _last_value_table_created = True
 
 
 @saih_bp.route('/get-variable-values', methods=['POST'])
@@ -24,32 +41,31 @@ def get_values():
         aggregation = data.get(
             'aggregation') if data and 'aggregation' in data else None
         window = data.get('window') if data and 'window' in data else None
+        format = data.get('format') if data and 'format' in data else None
+        # Exports return the raw values unless they ask for the resolution of the span
+        resolution = data.get('resolution') if data and 'resolution' in data else (
+            'raw' if format != None else 'auto')
 
-        if variables != None and start_date != None and end_date != None:
-            query_client = influx_client.query_api()
-
-            query_variables = ''
-            for index, variable_code in enumerate(variables):
-                query_variables += 'r["variableCode"] == "' + \
-                    variable_code + '"'
-                if (index < len(variables) - 1):
-                    query_variables += ' or '
-
-            query = f'from(bucket: "{BUCKET}") \
-                |> range(start: time(v: "{start_date}"), stop: time(v: "{end_date}")) \
-                |> filter(fn: (r) => r["_measurement"] == "saih") \
-                |> filter(fn: (r) => r["_field"] == "value") \
-                |> filter(fn: (r) => ' + query_variables + ')'
+        if format != None and format not in streaming.FORMATS:
+            return jsonify({'status': 400, 'title': 'Error', 'detail': f'Unsupported format, it must be one of {", ".join(streaming.FORMATS)}.', 'ok': False}), 400
+        if resolution not in downsampling.RESOLUTIONS:
+            return jsonify({'status': 400, 'title': 'Error', 'detail': f'Unsupported resolution, it must be one of {", ".join(downsampling.RESOLUTIONS)}.', 'ok': False}), 400
 
-            if aggregation != None and window != None:
-                query = f'{query} |> aggregateWindow(every: {window}, fn: {aggregation}, createEmpty: false)'
-
-            query = f'{query} |> keep(columns: ["_time", "_value", "variableCode"])'
+        if variables != None and start_date != None and end_date != None:
+            if resolution == 'raw':
+                # Raw values, only aggregated by a requested window
+                query = downsampling.values_query(BUCKET, 'value', window, aggregation)
+            else:
+                # Long spans are read from the pre-aggregated tiers of the bucket
+                query = downsampling.values_query(*downsampling.resolve(start_date, end_date, aggregation, window))
+            params = {'start_date': start_date, 'end_date': end_date}
 
-            df = query_client.query_data_frame(query)
+            # Bulk exports are streamed record by record instead of loaded as a whole
+            if format != None:
+                return streaming.stream_response(flux.query_stream(query, 'variables', variables, params),
+                                                 ['_time', '_value', 'variableCode'], format)
 
-            if not df.empty:
-                df.drop(columns=['result', 'table'], inplace=True)
+            df = flux.query_data_frame(query, 'variables', variables, params)
 
             return jsonify({'status': 200, 'data': json.loads(df.to_json(orient='records')), 'ok': True})
         else:
@@ -67,42 +83,76 @@ def get_last_values():
             isinstance(data['variables'], list) and len(data['variables']) > 0) else None
 
         if variables != None:
-            query_client = influx_client.query_api()
-
-            query_variables = ''
-            for index, variable_code in enumerate(variables):
-                query_variables += 'r["variableCode"] == "' + \
-                    variable_code + '"'
-                if (index < len(variables) - 1):
-                    query_variables += ' or '
-
-            query = f'from(bucket: "{BUCKET}") \
-                |> range(start: -60d) \
-                |> filter(fn: (r) => r["_measurement"] == "saih") \
-                |> filter(fn: (r) => r["_field"] == "value") \
-                |> filter(fn: (r) => ' + query_variables + ') \
-                |> keep(columns: ["_time", "_value", "variableCode"]) \
-                |> sort(columns: ["_time"], desc: true) \
-                |> first()'
-
-            df = query_client.query_data_frame(query)
-
-            if not df.empty:
-                df.drop(columns=['result', 'table'], inplace=True)
-
-            return jsonify({'status': 200, 'data': json.loads(df.to_json(orient='records')), 'ok': True})
+            # Last values are kept by the ingestor as it writes them, the bucket is only scanned for the variables
+            # missing in the table, which are then added to it. Variables the scan finds no value of are added
+            # without one, and only scanned again once their check expires
+            last_value_table()
+            last_values = SAIHLastValueModel.get_values(variables)
+            now = pd.Timestamp.now(tz='UTC')
+            since = now - pd.Timedelta(days=LAST_VALUES_DAYS)
+            recheck = now - pd.Timedelta(hours=MISSING_VALUES_RECHECK_HOURS)
+            values = [{'_time': int(last_value.time.timestamp() * 1000), '_value': last_value.value,
+                       'variableCode': last_value.variable_code}
+                      for last_value in last_values if last_value.time is not None and last_value.time >= since]
+
+            missing = list(set(variables) - {last_value.variable_code for last_value in last_values
+                                              if last_value.time is not None or last_value.checked >= recheck})
+            if missing:
+                query = f'from(bucket: "{BUCKET}") \
+                    |> range(start: -{LAST_VALUES_DAYS}d) \
+                    |> filter(fn: (r) => r["_measurement"] == "saih") \
+                    |> filter(fn: (r) => r["_field"] == "value") \
+                    |> {flux.set_filter("variableCode", "variables")} \
+                    |> keep(columns: ["_time", "_value", "variableCode"]) \
+                    |> sort(columns: ["_time"], desc: true) \
+                    |> first()'
+
+                df = flux.query_data_frame(query, 'variables', missing)
+                if not df.empty:
+                    SAIHLastValueModel.write_values([
+                        {'variable_code': row['variableCode'], 'time': row['_time'].to_pydatetime(), 'value': row['_value']}
+                        for row in df.to_dict(orient='records')])
+                    values += json.loads(df.to_json(orient='records'))
+                found = set(df['variableCode']) if not df.empty else set()
+                SAIHLastValueModel.write_missing(
+                    [variable for variable in missing if variable not in found], now.to_pydatetime())
+
+            return jsonify({'status': 200, 'data': values, 'ok': True})
         else:
             return jsonify({'status': 400, 'title': 'Error', 'detail': 'Missing query paramenters, you have to specify a list of variables.', 'ok': False}), 400
     except Exception as e:
         return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
 
 
+@saih_bp.route('/post-last-values', methods=['PUT'])
+def post_last_values():
+    data = request.get_json()
+    values = data.get('values') if data and 'values' in data and (
+        isinstance(data['values'], list) and len(data['values']) > 0) else None
+    if values == None:
+        return jsonify({'status': 400, 'title': 'Error', 'detail': 'Missing query paramenters, you have to specify a list of values.', 'ok': False}), 400
+    try:
+        last_value_table()
+        SAIHLastValueModel.write_values(values)
+        return jsonify({'status': 200, 'data': f'{len(values)} last values inserted/updated', 'ok': True})
+    except Exception as e:
+        return jsonify({'status': 500, 'title': 'Error', 'detail': str(e), 'ok': False}), 500
+
+
 @saih_bp.route('/get-last-timestamp', methods=['GET'])
 def get_last_timestamp():
     try:
         data = request.get_json()
         _bucket = data.get(
             'bucket') if 'bucket' in data and data['bucket'] != "" else BUCKET
+
+        # The newest of the last values of the SAIH variables, the bucket is only scanned while the table is empty
+        if _bucket == BUCKET:
+            last_value_table()
+            last_timestamp = SAIHLastValueModel.get_last_timestamp()
+            if last_timestamp != None:
+                return jsonify({'status': 200, 'data': last_timestamp.strftime('%Y-%m-%dT%H:%M:%S%z'), 'ok': True})
+
         query_client = influx_client.query_api()
 
         query = f'from(bucket: "{_bucket}") \
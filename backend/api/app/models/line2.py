@@ -9,7 +9,7 @@ from influxdb_client.client.write_api import SYNCHRONOUS
 
 from flask import current_app
 from app import influx_client
-from app.utils import geoutils
+from app.utils import geoutils, flux
 
 
 DATA_FOLDER = current_app.config['DATA_FOLDER']
@@ -123,35 +123,33 @@ def add_dfs0_products(file, interval):
         return False, f'Error writing \'{file}\' data for measurement \'{interval}\' in bucket \'{BUCKET}\': {str(e)}'
 
 
+def dfs0_products_query(start_date = None, end_date = None, interval = 0, aggregation = None, window = None):
+    measurement = 'SIMUL_S' if interval == 0 else 'SIMUL_M'
+    
+    query = f'from(bucket: "{BUCKET}") \
+        |> range(start: time(v: params.start_date), stop: time(v: params.end_date)) \
+        |> filter(fn: (r) => r["_measurement"] == "{measurement}") \
+        |> filter(fn: (r) => r["_field"] == "value") \
+        |> {flux.set_filter("variable", "variables")}'
+    
+    if aggregation != None and window != None:
+        query = f'{query} |> aggregateWindow(every: {window}, fn: {aggregation}, createEmpty: false)'
+    
+    query = f'{query} |> keep(columns: ["_time", "_value", "variable"])'
+    return query, {'start_date': start_date, 'end_date': end_date}
+
+
 def get_dfs0_products(variables = None, start_date = None, end_date = None, interval = 0, aggregation = None, window = None):
     try:
-        query_client = influx_client.query_api()
-        query_variables = ''
-        
-        for index, variable_code in enumerate(variables):
-            query_variables += 'r["variable"] == "' + \
-                variable_code + '"'
-            if (index < len(variables) - 1):
-                query_variables += ' or '
-        
-        measurement = 'SIMUL_S' if interval == 0 else 'SIMUL_M'
-        
-        query = f'from(bucket: "{BUCKET}") \
-            |> range(start: time(v: "{start_date}"), stop: time(v: "{end_date}")) \
-            |> filter(fn: (r) => r["_measurement"] == "{measurement}") \
-            |> filter(fn: (r) => r["_field"] == "value") \
-            |> filter(fn: (r) => ' + query_variables + ')'
-        
-        if aggregation != None and window != None:
-            query = f'{query} |> aggregateWindow(every: {window}, fn: {aggregation}, createEmpty: false)'
-        
-        query = f'{query} |> keep(columns: ["_time", "_value", "variable"])'
-        df = query_client.query_data_frame(query)
-        
-        if not df.empty:
-            df.drop(columns=['result', 'table'], inplace=True)
+        query, params = dfs0_products_query(start_date, end_date, interval, aggregation, window)
+        df = flux.query_data_frame(query, 'variables', variables, params)
         
         return True, df.to_json(orient='records')
     except Exception as e:
         return False, f'Error querying \'{BUCKET}\' bucket: {str(e)}'
 
+
+def stream_dfs0_products(variables = None, start_date = None, end_date = None, interval = 0, aggregation = None, window = None):
+    query, params = dfs0_products_query(start_date, end_date, interval, aggregation, window)
+    return flux.query_stream(query, 'variables', variables, params)
+
@@ -0,0 +1,55 @@
+from sqlalchemy import Column, DateTime, String, Float, func, text
+
+from app import db
+
+
+class SAIHLastValueModel(db.Model):
+    __tablename__ = 'saih_last_value'
+
+    # Document variables
+    variable_code = Column(String(), primary_key=True)
+    time = Column(DateTime(timezone=True))
+    value = Column(Float())
+    # Last scan of the bucket that found no value of the variable, which has no time nor value then
+    checked = Column(DateTime(timezone=True))
+
+    @staticmethod
+    def create_table():
+        SAIHLastValueModel.__table__.create(bind=db.engine, checkfirst=True)
+        # Tables created before variables without values were kept
+        with db.engine.begin() as conn:
+            conn.execute(
+                text('ALTER TABLE saih_last_value ADD COLUMN IF NOT EXISTS checked TIMESTAMP WITH TIME ZONE'))
+
+    @staticmethod
+    def get_values(variables):
+        return SAIHLastValueModel.query.filter(SAIHLastValueModel.variable_code.in_(variables)).all()
+
+    @staticmethod
+    def get_last_timestamp():
+        return db.session.query(func.max(SAIHLastValueModel.time)).scalar()
+
+    def write_values(values=None):
+        # A value only replaces the stored one if it is newer, so batches can be written in any order
+        query = ''' INSERT INTO public.saih_last_value (variable_code, time, value)
+                    VALUES(%(variable_code)s, %(time)s, %(value)s)
+                    ON CONFLICT ON CONSTRAINT saih_last_value_pkey
+                    DO UPDATE SET time = EXCLUDED.time, value = EXCLUDED.value
+                    WHERE saih_last_value.time IS NULL OR saih_last_value.time <= EXCLUDED.time; '''
+        if values:
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(query, values)
+        else:
+            raise Exception("No values specified")
+
+    def write_missing(variables, checked):
+        # Variables the bucket has no value of at `checked`, a value written later replaces them
+        query = ''' INSERT INTO public.saih_last_value (variable_code, checked)
+                    VALUES(%(variable_code)s, %(checked)s)
+                    ON CONFLICT ON CONSTRAINT saih_last_value_pkey
+                    DO UPDATE SET checked = EXCLUDED.checked
+                    WHERE saih_last_value.time IS NULL; '''
+        if variables:
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(query, [{'variable_code': variable, 'checked': checked}
+                                             for variable in variables])
@@ -0,0 +1,161 @@
+import uuid
+import json
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, Text, text
+from marshmallow import fields
+
+from app import db, ma
+
+
+# Lock shared by every simulation worker while it claims a queued job
+DISPATCH_LOCK = 4404
+
+
+class SimulationJobModel(db.Model):
+    __tablename__ = 'simulation_job'
+
+    # Document variables
+    id = Column(String(), primary_key=True)
+    type = Column(String())
+    status = Column(String())
+    params = Column(Text())
+    pid = Column(Integer())
+    result_folder = Column(String())
+    # Batch the job belongs to, jobs of a batch are queued together and compared once all of them finish
+    batch = Column(String())
+    error = Column(String())
+    created = Column(DateTime())
+    started = Column(DateTime())
+    finished = Column(DateTime())
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    @staticmethod
+    def create_table():
+        SimulationJobModel.__table__.create(bind=db.engine, checkfirst=True)
+        # Tables created before jobs had a batch
+        with db.engine.begin() as connection:
+            connection.execute(
+                text('ALTER TABLE simulation_job ADD COLUMN IF NOT EXISTS batch VARCHAR'))
+
+    @staticmethod
+    def create(type, params, result_folder):
+        session = db.create_scoped_session(
+            options={'expire_on_commit': False})
+        id = uuid.uuid4().hex
+        job = SimulationJobModel(id=id, type=type, status=SimulationJobModel.QUEUED, params=json.dumps(params),
+                                 result_folder=result_folder + id, created=datetime.now())
+        session.add(job)
+        session.commit()
+        session.close()
+        return job
+
+    @staticmethod
+    def create_batch(type, params, result_folder):
+        """Queue a job of `type` for every params of `params` under a new batch id and return it."""
+        session = db.create_scoped_session()
+        batch = uuid.uuid4().hex
+        for job_params in params:
+            id = uuid.uuid4().hex
+            session.add(SimulationJobModel(id=id, type=type, status=SimulationJobModel.QUEUED, params=json.dumps(job_params),
+                                           result_folder=result_folder + id, batch=batch, created=datetime.now()))
+        session.commit()
+        session.close()
+        return batch
+
+    @staticmethod
+    def get_job(id):
+        session = db.create_scoped_session()
+        result = session.query(SimulationJobModel).filter(
+            SimulationJobModel.id == id).first()
+        session.close()
+        return result
+
+    @staticmethod
+    def get_jobs(type, limit=50):
+        session = db.create_scoped_session()
+        results = session.query(SimulationJobModel).filter(SimulationJobModel.type == type).order_by(
+            SimulationJobModel.created.desc()).limit(limit).all()
+        session.close()
+        return results
+
+    @staticmethod
+    def get_batch(batch):
+        session = db.create_scoped_session()
+        results = session.query(SimulationJobModel).filter(SimulationJobModel.batch == batch).order_by(
+            SimulationJobModel.created).all()
+        session.close()
+        return results
+
+    @staticmethod
+    def get_queue_position(job):
+        session = db.create_scoped_session()
+        result = session.query(SimulationJobModel).filter(SimulationJobModel.status == SimulationJobModel.QUEUED,
+                                                          SimulationJobModel.created < job.created).count()
+        session.close()
+        return result
+
+    @staticmethod
+    def count_queued():
+        session = db.create_scoped_session()
+        result = session.query(SimulationJobModel).filter(
+            SimulationJobModel.status == SimulationJobModel.QUEUED).count()
+        session.close()
+        return result
+
+    @staticmethod
+    def claim_next(max_running, pid):
+        """Mark the oldest queued job as running in process `pid` if the pool has a free worker and return it."""
+        session = db.create_scoped_session(
+            options={'expire_on_commit': False})
+        # Serialize claims of every worker so the pool never runs more than max_running jobs
+        session.execute(text('SELECT pg_advisory_xact_lock(:lock)'), {
+                        'lock': DISPATCH_LOCK})
+        running = session.query(SimulationJobModel).filter(
+            SimulationJobModel.status == SimulationJobModel.RUNNING).count()
+        job = None
+        if running < max_running:
+            job = session.query(SimulationJobModel).filter(SimulationJobModel.status == SimulationJobModel.QUEUED).order_by(
+                SimulationJobModel.created).first()
+            if job is not None:
+                job.status = SimulationJobModel.RUNNING
+                job.started = datetime.now()
+                # Set with the claim, so the job is failed by reap() if its worker dies while running it
+                job.pid = pid
+        session.commit()
+        session.close()
+        return job
+
+    @staticmethod
+    def get_running():
+        session = db.create_scoped_session()
+        results = session.query(SimulationJobModel).filter(
+            SimulationJobModel.status == SimulationJobModel.RUNNING).all()
+        session.close()
+        return results
+
+    @staticmethod
+    def update(id, **values):
+        session = db.create_scoped_session()
+        session.query(SimulationJobModel).filter(
+            SimulationJobModel.id == id).update(values)
+        session.commit()
+        session.close()
+
+
+class SimulationJobSchema(ma.Schema):
+    class Meta:
+        fields = ('id', 'type', 'status', 'params', 'batch', 'error',
+                  'created', 'started', 'finished')
+
+    params = fields.Method('params_to_json')
+
+    def params_to_json(self, obj):
+        return json.loads(obj.params)
+
+
+simulation_job_schema = SimulationJobSchema()
+simulation_jobs_schema = SimulationJobSchema(many=True)
@@ -0,0 +1,94 @@
+import time
+import click
+import numpy as np
+from flask.cli import AppGroup
+
+from . import compute_rec, compute_rec_dem_anual, planner
+from . import modelo_L4_L5 as modelo
+
+
+# flask benchmark <command>: timings of the simulation stages on the data of this deployment
+benchmark_cli = AppGroup('benchmark', help='Measure the time of the simulation stages.')
+
+
+def timed(function, repeat):
+    # Wall times of `repeat` calls of `function` and the result of the last call
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def report(name, times):
+    click.echo(f'{name}: min {min(times):.3f}s, mean {sum(times) / len(times):.3f}s, '
+               f'max {max(times):.3f}s ({len(times)} runs)')
+
+
+@benchmark_cli.command('resources')
+@click.option('--repeat', default=3, show_default=True, help='Runs of every measure.')
+@click.option('--days', type=float, default=None, help='Simulation horizon in days.')
+@click.option('--seed', type=int, default=None, help='Seed of a random simulation horizon.')
+def resources(repeat, days, seed):
+    """Time the L4 resource summaries, computed from the inputs and served from the daily cache."""
+    simulation_days = compute_rec.simulationDays(days, seed)
+    click.echo(f'Horizon: {simulation_days:g} days')
+
+    times, computed = timed(lambda: compute_rec.computeResources(simulation_days), repeat)
+    report('getResources computed', times)
+    times, cached = timed(lambda: compute_rec.getResources(days, seed), repeat)
+    report('getResources cached', times)
+    # Computed and cached results only match if the computation is deterministic
+    if computed != cached:
+        raise click.ClickException('getResources is not deterministic, its result changed between runs')
+
+    times, computed = timed(compute_rec_dem_anual.computeDemandResources, repeat)
+    report('getDemandResources computed', times)
+    times, cached = timed(compute_rec_dem_anual.getDemandResources, repeat)
+    report('getDemandResources cached', times)
+    if computed != cached:
+        raise click.ClickException('getDemandResources is not deterministic, its result changed between runs')
+
+
+# Reference scenarios of the solver benchmark: name -> (monthly, daily) horizon of the plans
+REFERENCE_SCENARIOS = {
+    'daily 15 days': (False, True),
+    'monthly 7 months': (True, False)
+}
+
+
+@benchmark_cli.command('solvers')
+@click.option('--repeat', default=3, show_default=True, help='Runs of every measure.')
+@click.option('--solver', 'solvers', multiple=True, help='Solver to measure, every available solver by default.')
+def solvers(repeat, solvers):
+    """Time the reference L4 scenarios under every LP solver and compare their plans with the configured solver."""
+    reference_solver = modelo.ObtenerSolver(modelo.SIMULATION_TYPE_PLANNING)
+    solvers = list(solvers) or modelo.SolversDisponibles()
+    # Deltas are measured against the configured solver, which is run first
+    solvers = [reference_solver] + [solver for solver in solvers if solver != reference_solver]
+
+    for name, (monthly, daily) in REFERENCE_SCENARIOS.items():
+        simulation_step, start, end = planner.simulation_horizon(monthly, daily)
+        params = {'p_simulation_type': modelo.SIMULATION_TYPE_PLANNING, 'p_simulation_step': simulation_step,
+                  'p_date_init': start.strftime('%Y-%m-%d'), 'p_date_end': end.strftime('%Y-%m-%d')}
+        click.echo(f'Scenario {name}: {params["p_date_init"]} to {params["p_date_end"]}')
+
+        reference = None
+        for solver in solvers:
+            # The first run builds the network of the solver, the next ones reuse it
+            times, df = timed(lambda: modelo.Planificar_Optimizar_Suministros_a_Demandas(**params, p_solver=solver),
+                              repeat)
+            result = modelo.ObtenerPlantillaRed(simulation_step, params['p_date_init'], params['p_date_end'],
+                                                solver)['resultado_modelo']
+            report(f'  {solver} run', times)
+            click.echo(f'  {solver} solve: {1000 * result.solver_stats.get("lp_solve", np.nan) / result.timesteps:.3f}ms '
+                       f'per timestep ({result.timesteps} timesteps)')
+
+            if reference is None:
+                reference = df
+                continue
+            delta = df['flow'].to_numpy() - reference['flow'].to_numpy()
+            click.echo(f'  {solver} vs {reference_solver}: max flow delta {np.abs(delta).max():.6g}, '
+                       f'total flow delta {delta.sum():.6g}')
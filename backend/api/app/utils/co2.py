@@ -1,3 +1,6 @@
+import numpy as np
+import pandas as pd
+
 # Demand Unit CO2 emissions and removals
 demand_unit_CO2 = {
     "agriculture": {  # t CO2 / ha-año
@@ -71,70 +74,103 @@ water_CO2 = {
     "desalada": 4320000
 }
 
+# CO2 of each water origin type kW/m3 (used by plan plots and tables)
+water_CO2_m3 = {water_type: value / 1000000 for water_type, value in water_CO2.items()}
+
 # t CO2 / kW
 emission_factor = 0.000354
 
+# Static emissions of each demand type by hm3 supplied (t CO2 / hm3), UDA emissions are per unit
+demand_type_CO2 = {
+    "UDU": demand_unit_CO2["urban"]["emissions"],
+    "UDI": demand_unit_CO2["industry"]["emissions"],
+    "UDRG": demand_unit_CO2["golf"]["emissions"],
+    "AMBIENTAL": demand_unit_CO2["wetlands"]["removals"]
+}
+
+
+def water_volumes(df):
+    # Volume supplied to each row by every water origin type
+    flow = df['flow'].to_numpy(dtype=float)
+    return {water_type: flow * df['tipo_agua_' + water_type].to_numpy(dtype=float) for water_type in water_CO2}
+
+
+def water_emissions(volumes, water_CO2=water_CO2):
+    # t CO2 of the energy used to supply the given volumes of each water origin type
+    emissions = volumes["superficial"] * water_CO2["superficial"]
+    for water_type in ["subterranea", "reutilizada", "trasvase", "desalada"]:
+        emissions = emissions + (volumes[water_type] * water_CO2[water_type])
+    return emissions * emission_factor
+
+
+def demand_emissions(df, uda_emission):
+    """Static t CO2 of every row of a simulation frame and whether the row has a static emission.
+
+    uda_emission: Series of per unit UDA emissions indexed by demand unit code.
+    """
+    codes = df['demanda_mi_id']
+    types = df['tipo_demanda_nombre']
+    flow = df['flow'].to_numpy(dtype=float)
+    is_uda = (types == "UDA").to_numpy()
+    is_udi = (types == "UDI").to_numpy()
+
+    factor = np.array(types.map({type: factor for type, factor in demand_type_CO2.items()
+                                 if type != "UDI"}), dtype=float)
+    factor[is_udi] = codes[is_udi].map(demand_type_CO2["UDI"]).to_numpy(dtype=float)
+    other_emissions = np.where(np.isnan(factor), 0.0, factor * flow)
+
+    emissions = np.where(is_uda, codes.map(uda_emission).to_numpy(dtype=float), other_emissions)
+    has_emissions = np.where(is_uda, codes.isin(uda_emission.index).to_numpy(), True)
+    return emissions, has_emissions
+
+
+def total_emissions(water, demand, has_demand):
+    # Rows without static emission only account for the water they receive
+    return np.where(has_demand, demand + water, water)
+
+
+def calculate_emissions(df, demand_factor):
+    """Add demand, water and total t CO2 columns to a demand unit frame.
+
+    demand_factor: t CO2 per hm3 supplied, a single value or one value per row.
+    """
+    df['demand'] = df['flow'].to_numpy(dtype=float) * demand_factor
+    df['water'] = water_emissions(water_volumes(df))
+    df['total'] = df['demand'] + df['water']
+    return df
+
 
 def calculate_agriculture_emissions(demands_crops, demands_water_df, period):
-    emissions = []
-    for demand_crops in demands_crops:
-        demand_crops_emission = 0
-        for key, value in demand_crops.items():
-            if key in demand_unit_CO2["agriculture"]["emissions"]:
-                if key != "demand_unit_code":
-                    demand_crops_emission += (demand_unit_CO2["agriculture"]["emissions"][key] + demand_unit_CO2["agriculture"]
-                                              ["emissions"]["sistema_riego"] + demand_unit_CO2["agriculture"]["removals"][key]) * value / period
-
-        demand_water_emission = 0
-        demand_water_df = demands_water_df[demands_water_df[
-            'demand_unit_code'] == demand_crops['demand_unit_code']]
-        if demand_water_df.shape[0] > 0:
-            demand_water_emission = demand_water_df['flow'] * (demand_water_df['tipo_agua_superficial'] * water_CO2['superficial'] + demand_water_df['tipo_agua_subterranea'] * water_CO2['subterranea'] +
-                                                               demand_water_df['tipo_agua_reutilizada'] * water_CO2['reutilizada'] + demand_water_df['tipo_agua_trasvase'] * water_CO2['trasvase'] + demand_water_df['tipo_agua_desalada'] * water_CO2['desalada']) * emission_factor
-        emissions.append(
-            {"code": demand_crops["demand_unit_code"], "total": demand_crops_emission + demand_water_emission.iloc[0], "demand": demand_crops_emission, "water": demand_water_emission.iloc[0]})
-    return emissions
+    crops_df = pd.DataFrame(demands_crops, columns=[
+        'demand_unit_code'] + list(demand_unit_CO2["agriculture"]["removals"]))
 
+    # Crop emissions and removals of each demand unit
+    demand_emission = np.zeros(crops_df.shape[0])
+    for crop, removals in demand_unit_CO2["agriculture"]["removals"].items():
+        demand_emission = demand_emission + (demand_unit_CO2["agriculture"]["emissions"][crop] + demand_unit_CO2["agriculture"]
+                                             ["emissions"]["sistema_riego"] + removals) * crops_df[crop].fillna(0).to_numpy(dtype=float) / period
 
-def calculate_urban_emissions(udu_simulation_df):
-    udu_simulation_df['demand'] = udu_simulation_df.apply(
-        lambda x: x['flow'] * demand_unit_CO2["urban"]["emissions"], axis=1)
-    udu_simulation_df['water'] = udu_simulation_df.apply(lambda x: x['flow'] * (x['tipo_agua_superficial'] * water_CO2['superficial'] + x['tipo_agua_subterranea'] * water_CO2['subterranea'] +
-                                                                                x['tipo_agua_reutilizada'] * water_CO2['reutilizada'] + x['tipo_agua_trasvase'] * water_CO2['trasvase'] + x['tipo_agua_desalada'] * water_CO2['desalada']) * emission_factor, axis=1)
-    udu_simulation_df['total'] = udu_simulation_df.apply(
-        lambda x: x['demand'] + x['water'], axis=1)
+    # Emissions of the water supplied to each demand unit, 0 if it is not in the simulation
+    demands_water_df = demands_water_df.drop_duplicates('demand_unit_code').set_index('demand_unit_code')
+    water_emission = pd.Series(water_emissions(water_volumes(demands_water_df)), index=demands_water_df.index)
+    water_emission = crops_df['demand_unit_code'].map(water_emission).fillna(0).to_numpy(dtype=float)
 
-    return udu_simulation_df
+    return [{"code": code, "total": float(demand + water), "demand": float(demand), "water": float(water)}
+            for code, demand, water in zip(crops_df['demand_unit_code'], demand_emission, water_emission)]
 
 
-def calculate_industry_emissions(udi_simulation_df):
-    udi_simulation_df['demand'] = udi_simulation_df.apply(
-        lambda x: x['flow'] * demand_unit_CO2["industry"]["emissions"][x['code']], axis=1)
-    udi_simulation_df['water'] = udi_simulation_df.apply(lambda x: x['flow'] * (x['tipo_agua_superficial'] * water_CO2['superficial'] + x['tipo_agua_subterranea'] * water_CO2['subterranea'] +
-                                                                                x['tipo_agua_reutilizada'] * water_CO2['reutilizada'] + x['tipo_agua_trasvase'] * water_CO2['trasvase'] + x['tipo_agua_desalada'] * water_CO2['desalada']) * emission_factor, axis=1)
-    udi_simulation_df['total'] = udi_simulation_df.apply(
-        lambda x: x['demand'] + x['water'], axis=1)
+def calculate_urban_emissions(udu_simulation_df):
+    return calculate_emissions(udu_simulation_df, demand_unit_CO2["urban"]["emissions"])
 
-    return udi_simulation_df
 
+def calculate_industry_emissions(udi_simulation_df):
+    return calculate_emissions(udi_simulation_df, udi_simulation_df['code'].map(
+        demand_unit_CO2["industry"]["emissions"]).to_numpy(dtype=float))
 
-def calculate_golf_emissions(udrg_simulation_df):
-    udrg_simulation_df['demand'] = udrg_simulation_df.apply(
-        lambda x: x['flow'] * demand_unit_CO2['golf']['emissions'], axis=1)
-    udrg_simulation_df['water'] = udrg_simulation_df.apply(lambda x: x['flow'] * (x['tipo_agua_superficial'] * water_CO2['superficial'] + x['tipo_agua_subterranea'] * water_CO2['subterranea'] +
-                                                                                  x['tipo_agua_reutilizada'] * water_CO2['reutilizada'] + x['tipo_agua_trasvase'] * water_CO2['trasvase'] + x['tipo_agua_desalada'] * water_CO2['desalada']) * emission_factor, axis=1)
-    udrg_simulation_df['total'] = udrg_simulation_df.apply(
-        lambda x: x['demand'] + x['water'], axis=1)
 
-    return udrg_simulation_df
+def calculate_golf_emissions(udrg_simulation_df):
+    return calculate_emissions(udrg_simulation_df, demand_unit_CO2['golf']['emissions'])
 
 
 def calculate_wetland_emissions(wetland_simulation_df):
-    wetland_simulation_df['demand'] = wetland_simulation_df.apply(
-        lambda x: x['flow'] * demand_unit_CO2['wetlands']['removals'], axis=1)
-    wetland_simulation_df['water'] = wetland_simulation_df.apply(lambda x: x['flow'] * (x['tipo_agua_superficial'] * water_CO2['superficial'] + x['tipo_agua_subterranea'] * water_CO2['subterranea'] +
-                                                                                        x['tipo_agua_reutilizada'] * water_CO2['reutilizada'] + x['tipo_agua_trasvase'] * water_CO2['trasvase'] + x['tipo_agua_desalada'] * water_CO2['desalada']) * emission_factor, axis=1)
-    wetland_simulation_df['total'] = wetland_simulation_df.apply(
-        lambda x: x['demand'] + x['water'], axis=1)
-
-    return wetland_simulation_df
+    return calculate_emissions(wetland_simulation_df, demand_unit_CO2['wetlands']['removals'])
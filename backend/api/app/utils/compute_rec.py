@@ -8,6 +8,7 @@
 
 # Import libraries
 import sys
+import glob
 import time
 import pandas as pd
 import numpy as np
@@ -16,6 +17,8 @@ import json
 from operator import add
 from flask import current_app
 
+from . import model_inputs
+
 
 # Define constants
 
@@ -141,25 +144,52 @@ CAMPO_FECHA_YYYY_MM = 'fecha_yyyy_mm'
 CAMPO_VALOR = 'valor'
 MINIMUM_SIMULATION_DAYS = 15
 
+# Horizonte de simulación por defecto (días) y límites del horizonte aleatorio (con semilla)
+SIMULATION_DAYS_DEFAULT = N_MESES_YEAR_ESTANDAR * N_DIAS_MES_ESTANDAR
+RANDOM_SIMULATION_DAYS_LOW = 10
+RANDOM_SIMULATION_DAYS_HIGH = 400
+
 
 '''
 Main code
 '''
 
 
-def getResources():
+def inputFiles():
+    # Every file read to compute the resources: configuration, physical data and daily inflow series
+    return [CONFIG_FILE, PHYSICAL_DATA_FILE] + \
+        sorted(glob.glob(PARAMETROS_APORTACIONES_DIRECTORIO_DIARIO + '*.csv'))
+
+
+def simulationDays(p_simulation_days=None, p_seed=None):
+    # Fixed horizon by default; a seed draws a random horizon repeatably
+    if p_simulation_days is not None:
+        return float(p_simulation_days)
+    if p_seed is not None:
+        return float(np.random.default_rng(p_seed).uniform(low=RANDOM_SIMULATION_DAYS_LOW, high=RANDOM_SIMULATION_DAYS_HIGH))
+    return float(SIMULATION_DAYS_DEFAULT)
+
+
+def getResources(p_simulation_days=None, p_seed=None):
+    # Depends only on today's date, the horizon and the input files, so it is computed once per day and input version
+    simulation_days = simulationDays(p_simulation_days, p_seed)
+    return model_inputs.daily_result(f'resources_{simulation_days:g}', inputFiles(),
+                                     lambda: computeResources(simulation_days))
+
+
+def computeResources(p_simulation_days=SIMULATION_DAYS_DEFAULT):
 
     # 1. First, open config and input files
 
     # 1.1 Open CONFIG FILES file
-    xl_cf = pd.ExcelFile(CONFIG_FILE)
+    xl_cf = model_inputs.Workbook(CONFIG_FILE)
 
     # 1.1.1 Get config data for file 'IN_physical_data_file'
     df_config_pdf = xl_cf.parse(
         sheet_name=CF_SHEET_IN_FILE_physical_data_file, header=CFSIFpdf_HEADER)
 
     # 1.1.2 Open IN_physical_data_file_path (phsycical data and elements' initialisation data file)
-    xl_pdf = pd.ExcelFile(PHYSICAL_DATA_FILE)
+    xl_pdf = model_inputs.Workbook(PHYSICAL_DATA_FILE)
 
     # Aportaciones
     df_pdf_aportaciones = xl_pdf.parse(
@@ -193,7 +223,7 @@ def getResources():
     # IMPORTANTE: Se limita el tiempo máximo de simulación a (N_MESES_YEAR_ESTANDAR=12) x (N_DIAS_MES_ESTANDAR=30) días,
     # lo que equivale a 360 días de tiempo.
     # También, se limita el tiempo mìmimo de simulación a 15 dias (MINIMUM_SIMULATION_DAYS)
-    simulation_days = np.random.uniform(low=10, high=400, size=1)[0]
+    simulation_days = p_simulation_days
     date_end_simulation = (pd.to_datetime(
         date_init_today) + timedelta(days=simulation_days)).strftime('%Y-%m-%d')
     n_simulation_steps = (pd.to_datetime(
@@ -251,7 +281,7 @@ def getResources():
             str(columna_en_archivo_aportaciones) + '.csv'
 
         # Abrir archivo para obtener todos los datos
-        df_values_aportacion_diario_all = pd.read_csv(file_name_aportaciones)
+        df_values_aportacion_diario_all = model_inputs.read_series(file_name_aportaciones)
 
         # Obtener los datos del periodo de interés (1 año desde hoy)
         df_values_aportacion_diario_1_year = df_values_aportacion_diario_all[
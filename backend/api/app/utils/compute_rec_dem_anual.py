@@ -8,6 +8,7 @@
 
 # Import libraries
 import sys
+import glob
 import time
 import pandas as pd
 import numpy as np
@@ -16,6 +17,8 @@ import json
 from operator import add
 from flask import current_app
 
+from . import model_inputs
+
 
 # Define constants
 
@@ -171,19 +174,30 @@ Main code
 '''
 
 
+def inputFiles():
+    # Every file read to compute the resources: configuration, physical data and daily inflow series
+    return [CONFIG_FILE, PHYSICAL_DATA_FILE, RECURSOS_DEMANDAS_RESUMEN_DATA_FILE] + \
+        sorted(glob.glob(PARAMETROS_APORTACIONES_DIRECTORIO_DIARIO + '*.csv'))
+
+
 def getDemandResources():
+    # Depends only on today's date and the input files, so it is computed once per day and input version
+    return model_inputs.daily_result('demand_resources', inputFiles(), computeDemandResources)
+
+
+def computeDemandResources():
 
     # 1. First, open config and input files
 
     # 1.1 Open CONFIG FILES file
-    xl_cf = pd.ExcelFile(CONFIG_FILE)
+    xl_cf = model_inputs.Workbook(CONFIG_FILE)
 
     # 1.1.1 Get config data for file 'IN_physical_data_file'
     df_config_pdf = xl_cf.parse(
         sheet_name=CF_SHEET_IN_FILE_physical_data_file, header=CFSIFpdf_HEADER)
 
     # 1.1.2 Open IN_physical_data_file_path (phsycical data and elements' initialisation data file)
-    xl_pdf = pd.ExcelFile(PHYSICAL_DATA_FILE)
+    xl_pdf = model_inputs.Workbook(PHYSICAL_DATA_FILE)
 
     # Aportaciones
     df_pdf_aportaciones = xl_pdf.parse(
@@ -206,7 +220,7 @@ def getDemandResources():
         sheet_name=CF_SHEET_IN_FILE_recursos_demandas_file, header=CFSIFrdf_HEADER)
 
     # 1.2.2 Open file RECURSOS_DEMANDAS_RESUMEN_DATA_FILE
-    xl_prf = pd.ExcelFile(RECURSOS_DEMANDAS_RESUMEN_DATA_FILE)
+    xl_prf = model_inputs.Workbook(RECURSOS_DEMANDAS_RESUMEN_DATA_FILE)
 
     # Recursos
     df_prf_recursos = xl_prf.parse(sheet_name=df_config_rdf[CFSIFrdf_sheet_recursos].iloc[0],
@@ -298,7 +312,7 @@ def getDemandResources():
             str(columna_en_archivo_aportaciones) + '.csv'
 
         # Abrir archivo para obtener todos los datos
-        df_values_aportacion_diario_all = pd.read_csv(file_name_aportaciones)
+        df_values_aportacion_diario_all = model_inputs.read_series(file_name_aportaciones)
 
         # Obtener los datos del periodo de interés (1 año desde hoy)
         df_values_aportacion_diario_1_year = \
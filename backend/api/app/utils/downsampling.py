@@ -0,0 +1,222 @@
+import re
+import time
+import click
+import pandas as pd
+from datetime import timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from influxdb_client import TaskCreateRequest
+
+from app import influx_client
+from . import flux
+
+
+BUCKET = current_app.config['SAIH_BUCKET']
+# Points per variable of a query whose caller did not choose an aggregation window
+POINT_BUDGET = current_app.config['SAIH_POINT_BUDGET']
+
+# Interval between two raw SAIH measurements
+RAW_INTERVAL = timedelta(minutes=5)
+
+# Pre-aggregated tiers of the SAIH bucket, finest first: window -> (approximate length, task period, span
+# recomputed by every task run to take in late data)
+TIERS = {
+    '1h': (timedelta(hours=1), '1h', '2d'),
+    '1d': (timedelta(days=1), '1h', '2d'),
+    '1mo': (timedelta(days=30), '1d', '1mo')
+}
+# Resolutions of a query of SAIH values: the one resolve picks for the span, or the raw values
+RESOLUTIONS = ['auto', 'raw']
+# Aggregations stored by every tier, each one as a field
+AGGREGATIONS = ['mean', 'sum', 'min', 'max']
+# Packages of the task scripts, imported before any other statement
+TASK_IMPORTS = 'import "date"\nimport "experimental"\n'
+
+# Seconds between two checks of the tier buckets available to the queries
+TIERS_CHECK_INTERVAL = 600
+
+# Tier buckets available in this process and time of their last check
+_available_tiers = None
+_tiers_checked = 0.0
+
+# flask saih <command>: maintenance of the SAIH buckets
+saih_cli = AppGroup('saih', help='Maintain the SAIH buckets.')
+
+
+def tier_bucket(window):
+    return f'{BUCKET}_{window}'
+
+
+def duration(window):
+    # Length of a Flux duration literal such as 90m or 1d12h, None for calendar durations (mo, y)
+    parts = re.findall(r'(\d+)(w|d|h|m|s)', window)
+    if not parts or ''.join(value + unit for value, unit in parts) != window:
+        return None
+    units = {'w': 'weeks', 'd': 'days', 'h': 'hours', 'm': 'minutes', 's': 'seconds'}
+    return sum((timedelta(**{units[unit]: int(value)}) for value, unit in parts), timedelta())
+
+
+def task_name(window):
+    return f'{tier_bucket(window)} downsampling'
+
+
+def coverage_description(window, since):
+    # The description of a tier bucket records the time since which the bucket holds every window, each one stamped
+    # with its start
+    return f'Aggregations of {BUCKET} by {window} stamped at the window start since {since.isoformat()}'
+
+
+def coverage(bucket):
+    # Buckets written before the windows were stamped with their start are of unknown coverage
+    match = re.search(r' stamped at the window start since (\S+)$', bucket.description or '')
+    return pd.Timestamp(match.group(1)) if match else None
+
+
+def utc(date):
+    date = pd.Timestamp(date)
+    return date.tz_localize('UTC') if date.tzinfo is None else date
+
+
+def available_tiers():
+    """Tiers that can be read and the time since which each one holds every window. A tier is only read while
+    the task filling its bucket is active and its last run succeeded, and buckets of unknown coverage are not read."""
+    global _available_tiers, _tiers_checked
+    if _available_tiers is None or time.monotonic() - _tiers_checked >= TIERS_CHECK_INTERVAL:
+        buckets_api = influx_client.buckets_api()
+        tasks_api = influx_client.tasks_api()
+        _available_tiers = {}
+        for window in TIERS:
+            bucket = buckets_api.find_bucket_by_name(tier_bucket(window))
+            tasks = tasks_api.find_tasks(name=task_name(window))
+            if bucket and coverage(bucket) is not None and tasks and tasks[0].status == 'active' \
+                    and tasks[0].last_run_status == 'success':
+                _available_tiers[window] = coverage(bucket)
+        _tiers_checked = time.monotonic()
+    return _available_tiers
+
+
+def resolve(start_date, end_date, aggregation=None, window=None):
+    """Bucket, field, aggregation window and function of a query of SAIH values between two dates.
+
+    A requested window is read from the coarsest tier that holds it, re-aggregated when the window is a multiple
+    of the tier (only for sum, min and max: a mean of means is not the mean). Without a window, spans over the
+    point budget are aggregated to the finest tier that fits in it. Tier rows are stamped with the start of their
+    window, so tier reads are always aggregated again by the window to stamp them with its stop, as aggregateWindow
+    stamps the windows of the raw values. The window is None when no aggregation is left to Influx."""
+    # Only the tiers that hold the whole requested range
+    tiers = [tier for tier, since in available_tiers().items() if since <= utc(start_date)]
+    if window is not None and aggregation is not None:
+        if aggregation in AGGREGATIONS:
+            if window in tiers:
+                return tier_bucket(window), aggregation, window, aggregation
+            if aggregation != 'mean':
+                for tier in reversed(tiers):
+                    if divides(tier, window):
+                        return tier_bucket(tier), aggregation, window, aggregation
+        return BUCKET, 'value', window, aggregation
+
+    span = pd.Timestamp(end_date) - pd.Timestamp(start_date)
+    if span / RAW_INTERVAL <= POINT_BUDGET:
+        return BUCKET, 'value', None, None
+    aggregation = aggregation if aggregation in AGGREGATIONS else 'mean'
+    window = next((tier for tier in TIERS if span / TIERS[tier][0] <= POINT_BUDGET), list(TIERS)[-1])
+    if window in tiers:
+        return tier_bucket(window), aggregation, window, aggregation
+    return BUCKET, 'value', window, aggregation
+
+
+def values_query(bucket, field, window=None, aggregation=None):
+    """Flux of the SAIH values of the `variables` parameter from `start_date` to `end_date`, read as resolved by
+    resolve."""
+    query = f'from(bucket: "{bucket}") \
+        |> range(start: time(v: params.start_date), stop: time(v: params.end_date)) \
+        |> filter(fn: (r) => r["_measurement"] == "saih") \
+        |> filter(fn: (r) => r["_field"] == "{field}") \
+        |> {flux.set_filter("variableCode", "variables")}'
+
+    if window is not None:
+        query = f'{query} |> aggregateWindow(every: {window}, fn: {aggregation}, createEmpty: false)'
+
+    return f'{query} |> keep(columns: ["_time", "_value", "variableCode"])'
+
+
+def divides(tier, window):
+    # Whether every window of `window` is made of whole windows of `tier`
+    if tier == '1mo':
+        return re.fullmatch(r'\d+mo', window) is not None
+    tier_duration, window_duration = duration(tier), duration(window)
+    return window_duration is not None and window_duration % tier_duration == timedelta()
+
+
+def aggregation_script(window, start, stop='now()'):
+    # Flux writing the aggregations of the SAIH values from `start` to `stop` to the bucket of the `window` tier, every
+    # window stamped with its start so that a range of the tier only reads the windows starting in it
+    script = f'''data = from(bucket: "{BUCKET}")
+    |> range(start: {start}, stop: {stop})
+    |> filter(fn: (r) => r["_measurement"] == "saih" and r["_field"] == "value")
+'''
+    for aggregation in AGGREGATIONS:
+        script += f'''
+data
+    |> aggregateWindow(every: {window}, fn: {aggregation}, timeSrc: "_start", createEmpty: false)
+    |> set(key: "_field", value: "{aggregation}")
+    |> to(bucket: "{tier_bucket(window)}")
+'''
+    return script
+
+
+@saih_cli.command('tiers')
+@click.option('--backfill-since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Aggregate the values since this date, for tiers created after the data.')
+def tiers(backfill_since):
+    """Create or update the buckets and Influx tasks of the pre-aggregated SAIH tiers."""
+    buckets_api = influx_client.buckets_api()
+    tasks_api = influx_client.tasks_api()
+    for window, (_, every, lookback) in TIERS.items():
+        bucket = buckets_api.find_bucket_by_name(tier_bucket(window))
+        if not bucket:
+            # A new bucket holds the windows aggregated by the task from now on
+            buckets_api.create_bucket(bucket_name=tier_bucket(window), org=influx_client.org,
+                                      description=coverage_description(window, pd.Timestamp.now(tz='UTC')))
+            click.echo(f'Bucket {tier_bucket(window)} created')
+
+        # Every run recomputes the whole windows of the last `lookback`, the current one included
+        name = task_name(window)
+        flux = f'{TASK_IMPORTS}\noption task = {{name: "{name}", every: {every}}}\n\n' + aggregation_script(
+            window, f'experimental.subDuration(d: {lookback}, from: date.truncate(t: now(), unit: {window}))')
+        tasks = tasks_api.find_tasks(name=name)
+        if tasks:
+            tasks[0].flux = flux
+            tasks_api.update_task(tasks[0])
+            click.echo(f'Task {name} updated')
+        else:
+            tasks_api.create_task(task_create_request=TaskCreateRequest(
+                flux=flux, org=influx_client.org, status='active', description=f'Aggregations of {BUCKET} by {window}'))
+            click.echo(f'Task {name} created')
+
+        if bucket and coverage(bucket) is None:
+            # Windows stamped with their stop are deleted once the task stamps them with their start, the bucket
+            # then holds the windows the task writes from now on
+            now = pd.Timestamp.now(tz='UTC')
+            influx_client.delete_api().delete(start='1970-01-01T00:00:00Z', stop=now.isoformat(),
+                                              predicate='_measurement="saih"', bucket=tier_bucket(window),
+                                              org=influx_client.org)
+            bucket.description = coverage_description(window, now)
+            buckets_api.update_bucket(bucket)
+            click.echo(f'Bucket {tier_bucket(window)} emptied of windows stamped with their stop')
+
+        if backfill_since is not None:
+            # Year by year from the start of the month, to keep every query within the Influx timeout
+            # and to only write whole windows
+            query_api = influx_client.query_api()
+            since = start = pd.Timestamp(backfill_since, tz='UTC').replace(day=1)
+            while start < pd.Timestamp.now(tz='UTC'):
+                stop = start + pd.DateOffset(years=1)
+                query_api.query(aggregation_script(window, f'time(v: "{start.isoformat()}")',
+                                                   f'time(v: "{stop.isoformat()}")'))
+                start = stop
+            bucket = buckets_api.find_bucket_by_name(tier_bucket(window))
+            if coverage(bucket) is None or since < coverage(bucket):
+                bucket.description = coverage_description(window, since)
+                buckets_api.update_bucket(bucket)
+            click.echo(f'Tier {window} aggregated since {backfill_since:%Y-%m-%d}')
@@ -0,0 +1,46 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+from app import influx_client
+
+
+CHUNK_SIZE = current_app.config['INFLUX_QUERY_CHUNK_SIZE']
+QUERY_WORKERS = current_app.config['INFLUX_QUERY_WORKERS']
+
+
+def set_filter(column, param):
+    """Flux filter of the rows whose `column` is one of the values of the array parameter `param`."""
+    return f'filter(fn: (r) => contains(value: r["{column}"], set: params.{param}))'
+
+
+def query_data_frame(query, set_param, values, params=None):
+    """Data frame of the Flux `query` for `values`, passed to the query as the array parameter `set_param`
+    along with `params`. Large selections are split in chunks queried in parallel and their results merged."""
+    chunks = [values[i:i + CHUNK_SIZE] for i in range(0, len(values), CHUNK_SIZE)] or [values]
+    query_client = influx_client.query_api()
+
+    def query_chunk(chunk):
+        df = query_client.query_data_frame(query, params={**(params or {}), set_param: chunk})
+        # Tables with different columns are returned as a list of data frames
+        return pd.concat(df, ignore_index=True) if isinstance(df, list) else df
+
+    if len(chunks) == 1:
+        dfs = [query_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(QUERY_WORKERS, len(chunks))) as executor:
+            dfs = list(executor.map(query_chunk, chunks))
+
+    df = pd.concat(dfs, ignore_index=True)
+    if not df.empty:
+        df.drop(columns=['result', 'table'], inplace=True)
+    return df
+
+
+def query_stream(query, set_param, values, params=None):
+    """Values of the records of the same query as query_data_frame, one record at a time: chunks are queried
+    one after the other and their records are never held in memory."""
+    query_client = influx_client.query_api()
+    for i in range(0, len(values), CHUNK_SIZE):
+        for record in query_client.query_stream(query, params={**(params or {}), set_param: values[i:i + CHUNK_SIZE]}):
+            yield record.values
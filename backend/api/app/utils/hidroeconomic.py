@@ -1,101 +1,142 @@
-
+import threading
 import numpy as np
+import pandas as pd
 
-from ..models.demand_unit import DemandUnitModel, demand_units_schema
+from ..models.demand_unit import DemandUnitModel
+from .plan_store import file_signature
 
 WATER_COST = {'tipo_agua_superficial': 3000, 'tipo_agua_subterranea': 250000,
               'tipo_agua_reutilizada': 0, 'tipo_agua_trasvase': 150000, 'tipo_agua_desalada': 600000}
 
+WETLAND_COST = 915  # € ha / year
+
+# Per-process cache of income curves: (file, unit column, x column) -> (file signature, knots)
+_knots = {}
+_knots_lock = threading.Lock()
+
+
+def interpolation_knots(file, unit_column, x_column):
+    """Return the piecewise-linear income curve of every unit in `file` as {unit: (x, cost)}.
+
+    Curves are parsed once and reused until the file changes.
+    """
+    key = (file, unit_column, x_column)
+    signature = file_signature(file)
+    with _knots_lock:
+        cached = _knots.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    table = pd.read_csv(file)
+    knots = {unit: (group[x_column].to_numpy(dtype=float), group['cost'].to_numpy(dtype=float))
+             for unit, group in table.groupby(unit_column, sort=False)}
+    with _knots_lock:
+        _knots[key] = (signature, knots)
+    return knots
+
+
+def interpolate(units, x, knots):
+    # Evaluate every row on the curve of its own unit, NaN for units without curve
+    result = np.full(len(x), np.nan)
+    for unit, rows in pd.Series(units).groupby(units).indices.items():
+        if unit in knots:
+            result[rows] = np.interp(x[rows], *knots[unit])
+    return result
+
+
+def last_knot(units, knots):
+    # Largest x of the curve of every row unit, NaN for units without curve
+    return np.array([knots[unit][0][-1] if unit in knots else np.nan for unit in units], dtype=float)
+
+
+def wetland_surfaces():
+    # Surface (ha) of every wetland, loaded with a single query
+    return {wetland.code: wetland.surface for wetland in DemandUnitModel.get_values('wetland')}
+
+
+def water_cost(df):
+    return df['flow'].to_numpy(dtype=float) * (df['tipo_agua_superficial'].to_numpy(dtype=float) * WATER_COST['tipo_agua_superficial'] + df['tipo_agua_subterranea'].to_numpy(dtype=float) * WATER_COST['tipo_agua_subterranea'] + df['tipo_agua_reutilizada'].to_numpy(dtype=float)
+                                               * WATER_COST['tipo_agua_reutilizada'] + df['tipo_agua_trasvase'].to_numpy(dtype=float) * WATER_COST['tipo_agua_trasvase'] + df['tipo_agua_desalada'].to_numpy(dtype=float) * WATER_COST['tipo_agua_desalada'])
 
-def compute(x, uda_hidroeconomic, udi_hidroeconomic, monthly):
+
+def compute_income(df, uda_economic_file, udi_economic_file, monthly):
+    """Hydro-economic income of every row of a simulation frame, NaN for demand types without income model."""
     period_factor = 12 if monthly else 365
-    if x['tipo_demanda_nombre'] == "UDA":
-        return calculate_agriculture_income(x, uda_hidroeconomic[uda_hidroeconomic["uda"] == x["demanda_mi_id"]], period_factor)
-    if x['tipo_demanda_nombre'] == "UDRG":
-        return calculate_golf_income(x)
-    if x['tipo_demanda_nombre'] == "UDU":
-        return calculate_urban_income(x)
-    if x['tipo_demanda_nombre'] == "HUMEDAL":
-        return calculate_wetland_income(x)
-    if x['tipo_demanda_nombre'] == "UDI":
-        return calculate_industrial_income(x, udi_hidroeconomic[udi_hidroeconomic["udi"] == x["demanda_mi_id"]], period_factor)
+    types = df['tipo_demanda_nombre'].to_numpy()
+    income = np.full(df.shape[0], np.nan)
 
+    for type, calculate_income in [('UDA', calculate_agriculture_income), ('UDI', calculate_industrial_income)]:
+        rows = types == type
+        if rows.any():
+            economic_file = uda_economic_file if type == 'UDA' else udi_economic_file
+            unit_column, x_column = ('uda', 'hm3') if type == 'UDA' else ('udi', 'proportion')
+            income[rows] = calculate_income(
+                df[rows], interpolation_knots(economic_file, unit_column, x_column), period_factor)
 
-def calculate_agriculture_income(x, hydro_economic_df, period_factor, IPC=1.141):
-    if x['flow'] == 0 or hydro_economic_df.shape[0] == 0 or x['init_max_flow'] == 0:
-        return 0
+    rows = types == 'UDRG'
+    income[rows] = calculate_golf_income(df[rows])
+    rows = types == 'UDU'
+    income[rows] = calculate_urban_income(df[rows])
+    rows = types == 'HUMEDAL'
+    if rows.any():
+        income[rows] = calculate_wetland_income(df[rows], wetland_surfaces(), period_factor)
+    return income
 
-    water_demand = (x['flow'] / x['init_max_flow']) * \
-        hydro_economic_df.iloc[-1]['hm3']
-    water_demand_income = np.interp(
-        [water_demand], hydro_economic_df['hm3'], hydro_economic_df['cost'])[0] * IPC / period_factor
 
-    # Get water cost
-    water_cost = x['flow'] * (x['tipo_agua_superficial'] * WATER_COST['tipo_agua_superficial'] + x['tipo_agua_subterranea'] * WATER_COST['tipo_agua_subterranea'] + x['tipo_agua_reutilizada']
-                              * WATER_COST['tipo_agua_reutilizada'] + x['tipo_agua_trasvase'] * WATER_COST['tipo_agua_trasvase'] + x['tipo_agua_desalada'] * WATER_COST['tipo_agua_desalada'])
+def calculate_agriculture_income(df, knots, period_factor, IPC=1.141):
+    units = df['demanda_mi_id'].to_numpy()
+    flow = df['flow'].to_numpy(dtype=float)
+    init_max_flow = df['init_max_flow'].to_numpy(dtype=float)
 
-    return water_demand_income - water_cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        water_demand = (flow / init_max_flow) * last_knot(units, knots)
+    water_demand_income = interpolate(units, water_demand, knots) * IPC / period_factor
 
+    no_income = (flow == 0) | ~pd.Series(units).isin(list(knots)).to_numpy() | (init_max_flow == 0)
+    return np.where(no_income, 0.0, water_demand_income - water_cost(df))
 
-def calculate_golf_income(x, IPC=1.362):
-    # Water demand income - We need to convert the flow from hm3 to m3 so we multiply by 1000000
-    water_demand_income = x['flow'] * 1000000 * 9.3 * IPC
-    # Water cost
-    water_cost = x['flow'] * (x['tipo_agua_superficial'] * WATER_COST['tipo_agua_superficial'] + x['tipo_agua_subterranea'] * WATER_COST['tipo_agua_subterranea'] + x['tipo_agua_reutilizada']
-                              * WATER_COST['tipo_agua_reutilizada'] + x['tipo_agua_trasvase'] * WATER_COST['tipo_agua_trasvase'] + x['tipo_agua_desalada'] * WATER_COST['tipo_agua_desalada'])
 
-    return water_demand_income - water_cost
+def calculate_golf_income(df, IPC=1.362):
+    # Water demand income - We need to convert the flow from hm3 to m3 so we multiply by 1000000
+    water_demand_income = df['flow'].to_numpy(dtype=float) * 1000000 * 9.3 * IPC
+    return water_demand_income - water_cost(df)
 
 
-def calculate_urban_income(x, IPC=1.061):
+def calculate_urban_income(df, IPC=1.061):
     e = -0.15
     P = 3.16 * 1000000  # We need to convert from € / m3 to  € / hm3 so we multiply by 1000000
-    D = x['init_max_flow']  # D is a demand
-    Q = x['flow']  # Q is a suministred flow
-    
-    
+    D = df['init_max_flow'].to_numpy(dtype=float)  # D is a demand
+    Q = df['flow'].to_numpy(dtype=float)  # Q is a suministred flow
+
     # Water demand income
-    water_demand_income = 0
-    if D != 0 and Q != 0:
-        water_demand_income = P * (e - 1) / e * Q + 0.5 * P / e / D * Q ** 2 * IPC
-
-    # Water cost
-    water_cost = x['flow'] * (x['tipo_agua_superficial'] * WATER_COST['tipo_agua_superficial'] + x['tipo_agua_subterranea'] * WATER_COST['tipo_agua_subterranea'] + x['tipo_agua_reutilizada']
-                              * WATER_COST['tipo_agua_reutilizada'] + x['tipo_agua_trasvase'] * WATER_COST['tipo_agua_trasvase'] + x['tipo_agua_desalada'] * WATER_COST['tipo_agua_desalada'])
-
-    return water_demand_income - water_cost
-
-
-def calculate_industrial_income(x, hydro_economic_df, period_factor):
-    # Water cost
-    water_cost = x['flow'] * (x['tipo_agua_superficial'] * WATER_COST['tipo_agua_superficial'] + x['tipo_agua_subterranea'] * WATER_COST['tipo_agua_subterranea'] + x['tipo_agua_reutilizada']
-                              * WATER_COST['tipo_agua_reutilizada'] + x['tipo_agua_trasvase'] * WATER_COST['tipo_agua_trasvase'] + x['tipo_agua_desalada'] * WATER_COST['tipo_agua_desalada'])
-
-    if x['demanda_mi_id'] == 'UDI07':
-        ipc = 1.088
-        # Water demand income
-        water_demand_income = x['flow'] * 0.68548718 * 1000 * 1000000 * ipc
-        return water_demand_income - water_cost
-    else:
-        if x['flow'] == 0 or hydro_economic_df.shape[0] == 0:
-            return 0
-        ipc = 1.141
-        water_demand_income = 0
-        # Water demand income
-        if x['init_max_flow'] != 0:
-            water_demand_income = np.interp(
-                [x['flow'] / x['init_max_flow']], hydro_economic_df['proportion'], hydro_economic_df['cost'])[0] * ipc / period_factor
-
-        return water_demand_income - water_cost
-
-
-def calculate_wetland_income(x, period_factor, IPC=1.21):
-    wetlands = demand_units_schema.dump(
-        DemandUnitModel.get_values('wetland', x['demanda_mi_id']))
-    # Calculate income
-    cost = 915  # € ha / year
-    ipc = 1.21
+    with np.errstate(divide='ignore', invalid='ignore'):
+        water_demand_income = np.where((D != 0) & (Q != 0),
+                                       P * (e - 1) / e * Q + 0.5 * P / e / D * Q ** 2 * IPC, 0.0)
+
+    return water_demand_income - water_cost(df)
+
 
-    for wetland in wetlands:
-        return cost * wetland['surface'] * IPC / period_factor
-    return 0
+def calculate_industrial_income(df, knots, period_factor):
+    units = df['demanda_mi_id'].to_numpy()
+    flow = df['flow'].to_numpy(dtype=float)
+    init_max_flow = df['init_max_flow'].to_numpy(dtype=float)
+    cost = water_cost(df)
+
+    # UDI07 income is proportional to the supplied flow
+    ipc = 1.088
+    udi07_income = flow * 0.68548718 * 1000 * 1000000 * ipc - cost
+
+    ipc = 1.141
+    with np.errstate(divide='ignore', invalid='ignore'):
+        water_demand_income = np.where(init_max_flow != 0, interpolate(
+            units, flow / init_max_flow, knots) * ipc / period_factor, 0.0)
+    no_income = (flow == 0) | ~pd.Series(units).isin(list(knots)).to_numpy()
+    income = np.where(no_income, 0.0, water_demand_income - cost)
+
+    return np.where(units == 'UDI07', udi07_income, income)
+
+
+def calculate_wetland_income(df, wetlands, period_factor, IPC=1.21):
+    # Calculate income
+    surface = df['demanda_mi_id'].map(wetlands).to_numpy(dtype=float)
+    return np.where(np.isnan(surface), 0.0, WETLAND_COST * surface * IPC / period_factor)
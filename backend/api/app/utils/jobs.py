@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import click
+import psutil
+import signal
+import logging
+from datetime import datetime
+from multiprocessing import Process
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from ..models.simulation_job import SimulationJobModel, simulation_job_schema
+from . import planner, optimizer, progress
+from .plan_store import JOB_PLAN_FILE, JOB_PLAN_DATA_FILE, JOB_PROGRESS_FILE
+
+
+MAX_WORKERS = current_app.config['SIMULATION_WORKERS']
+WORKER_IDLE_TIMEOUT = current_app.config['SIMULATION_WORKER_IDLE_TIMEOUT']
+# Memory ceiling of every worker in bytes, 0 for no ceiling
+WORKER_MEMORY_LIMIT = current_app.config['SIMULATION_WORKER_MEMORY_LIMIT'] * 1024 * 1024
+
+# Seconds between two checks of the queue, by the pool and by its idle workers
+WORKER_POLL_INTERVAL = 1
+
+# Simulation run by every job type and folder where the results of its jobs are kept
+JOB_TYPES = {
+    'planner': (planner.generate_plan, planner.PLAN_FOLDER + 'jobs/'),
+    'batch-scenario': (planner.generate_batch_scenario, planner.PLAN_FOLDER + 'batches/'),
+    'optimizer': (optimizer.generate_optimzied_plan, optimizer.OPTIMIZED_PLAN_FOLDER + 'jobs/')
+}
+
+# Job table is created on first use in databases initialized before it existed
+_table_created = False
+
+# flask jobs <command>: the simulation worker pool, run as its own service
+jobs_cli = AppGroup('jobs', help='Run the simulation jobs.')
+
+
+def job_table():
+    global _table_created
+    if not _table_created:
+        SimulationJobModel.create_table()
+        _table_created = True
+
+
+def submit(type, params):
+    """Queue a simulation job, the worker service runs it as soon as its pool has a free worker."""
+    job_table()
+    return SimulationJobModel.create(type, params, JOB_TYPES[type][1])
+
+
+def submit_batch(type, params):
+    """Queue a job of `type` for every params of `params` under a batch id and return it, the pool runs the
+    jobs of the batch side by side."""
+    job_table()
+    return SimulationJobModel.create_batch(type, params, JOB_TYPES[type][1])
+
+
+@jobs_cli.command('worker')
+def worker():
+    """Run the queued simulation jobs on a pool of up to SIMULATION_WORKERS processes.
+
+    A single worker service runs per database: the jobs it finds running when it starts were left by a
+    previous one and are failed."""
+    job_table()
+    for job in SimulationJobModel.get_running():
+        fail(job, 'Simulation interrupted by a restart of the worker service')
+    # Workers are stopped with the service
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    workers = {}
+    click.echo(f'Simulation worker pool of {MAX_WORKERS} workers started')
+    try:
+        while True:
+            reap(workers)
+            dispatch(workers)
+            time.sleep(WORKER_POLL_INTERVAL)
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+def new_workers(queued, idle, workers):
+    # Idle workers take the first queued jobs, new workers only take the slots of the pool left free
+    return max(0, min(queued - idle, MAX_WORKERS - workers))
+
+
+def dispatch(workers):
+    """Start a worker for every queued job the idle workers of the pool do not take.
+
+    workers: processes of the pool by pid."""
+    busy = {job.pid for job in SimulationJobModel.get_running()}
+    idle = len([pid for pid in workers if pid not in busy])
+    for _ in range(new_workers(SimulationJobModel.count_queued(), idle, len(workers))):
+        # A new worker must fit in the free memory of the host; queued jobs wait for the running workers otherwise
+        if WORKER_MEMORY_LIMIT and psutil.virtual_memory().available < WORKER_MEMORY_LIMIT and busy:
+            return
+        process = Process(name='simulation-worker', target=work)
+        process.start()
+        workers[process.pid] = process
+
+
+def reap(workers):
+    # Join the workers that exited and fail the jobs left running by the ones that died
+    dead = [pid for pid, process in workers.items() if not process.is_alive()]
+    for pid in dead:
+        workers.pop(pid).join()
+    if dead:
+        for job in SimulationJobModel.get_running():
+            if job.pid in dead:
+                fail(job, 'Simulation terminated abnormally')
+
+
+def fail(job, error):
+    logging.warning(f'{job.type} job {job.id} failed: {error}')
+    SimulationJobModel.update(job.id, status=SimulationJobModel.FAILED, error=error, finished=datetime.now())
+
+
+def work():
+    # Connections inherited from the pool can not be shared with the forked worker
+    db.engine.dispose()
+    # An idle worker keeps the networks and inputs loaded by its last jobs, so the next job of the
+    # same horizon (usually the optimization of the plan just generated) only runs the solver again
+    deadline = time.monotonic() + WORKER_IDLE_TIMEOUT
+    while time.monotonic() < deadline:
+        job = SimulationJobModel.claim_next(MAX_WORKERS, os.getpid())
+        if job is None:
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+        run(job)
+        # A worker over its memory ceiling gives its memory back to the host instead of taking more jobs
+        if WORKER_MEMORY_LIMIT and psutil.Process().memory_info().rss > WORKER_MEMORY_LIMIT:
+            return
+        deadline = time.monotonic() + WORKER_IDLE_TIMEOUT
+
+
+def run(job):
+    simulation, _ = JOB_TYPES[job.type]
+    progress.start(job.result_folder + JOB_PROGRESS_FILE, WORKER_MEMORY_LIMIT or None)
+    try:
+        simulation(**json.loads(job.params), result_folder=job.result_folder)
+        SimulationJobModel.update(
+            job.id, status=SimulationJobModel.FINISHED, finished=datetime.now())
+    except Exception as e:
+        logging.error(f'An error occurred running {job.type} job {job.id}: {e}')
+        SimulationJobModel.update(job.id, status=SimulationJobModel.FAILED,
+                                  error=str(e), finished=datetime.now())
+    finally:
+        progress.finish()
+
+
+def get_job(id):
+    job_table()
+    return SimulationJobModel.get_job(id)
+
+
+def get_batch(batch):
+    job_table()
+    return SimulationJobModel.get_batch(batch)
+
+
+def get_jobs(type):
+    job_table()
+    return SimulationJobModel.get_jobs(type)
+
+
+def job_status(job):
+    status = simulation_job_schema.dump(job)
+    status['position'] = SimulationJobModel.get_queue_position(
+        job) if job.status == SimulationJobModel.QUEUED else 0
+    status['progress'] = progress.read(job.result_folder + JOB_PROGRESS_FILE)
+    return status
+
+
+def job_files(type, id):
+    """Plan and plan data files of job `id`, None if there is no such job of `type`."""
+    job = SimulationJobModel.get_job(id)
+    if job is None or job.type != type:
+        return None, None
+    return job.result_folder + JOB_PLAN_FILE, job.result_folder + JOB_PLAN_DATA_FILE
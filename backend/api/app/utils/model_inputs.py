@@ -0,0 +1,179 @@
+import os
+import glob
+import pickle
+import hashlib
+import threading
+from copy import deepcopy
+from datetime import date, datetime
+import pandas as pd
+from flask import current_app
+
+from .plan_store import file_signature
+
+
+DATA_FOLDER = current_app.config['DATA_FOLDER']
+SNAPSHOT_FOLDER = DATA_FOLDER + '/L4/Model/COMPILED/'
+
+# Per-process cache of input file hashes: path -> (file signature, sha1)
+_hashes = {}
+# Per-process cache of loaded snapshots: snapshot file -> snapshot
+_snapshots = {}
+# Per-process cache of daily results: name -> {'day', 'hash', 'result'}
+_daily_results = {}
+_lock = threading.Lock()
+
+
+def compute_hash(file):
+    if not os.path.isfile(file):
+        return None
+    h = hashlib.sha1()
+    with open(file, 'rb') as file:
+        chunk = 0
+        while chunk != b'':
+            chunk = file.read(1024)
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_hash(file):
+    # Files are only hashed again when they change
+    if not os.path.isfile(file):
+        return None
+    signature = file_signature(file)
+    with _lock:
+        cached = _hashes.get(file)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    h = compute_hash(file)
+    with _lock:
+        _hashes[file] = (signature, h)
+    return h
+
+
+def relative_path(file):
+    return os.path.relpath(os.path.normpath(file), os.path.normpath(DATA_FOLDER))
+
+
+def snapshot_file(source):
+    return SNAPSHOT_FOLDER + relative_path(source).replace(os.sep, '__') + '.pkl'
+
+
+def sources_hash(sources):
+    h = hashlib.sha1()
+    for file in sources:
+        h.update(f'{os.path.basename(file)}:{file_hash(file)};'.encode())
+    return h.hexdigest()
+
+
+def load_snapshot(source, sources):
+    """Compiled snapshot of `source` ({'manifest': ..., 'tables': {...}}), empty if any of `sources` changed."""
+    file = snapshot_file(source)
+    h = sources_hash(sources)
+    with _lock:
+        snapshot = _snapshots.get(file)
+    if snapshot is not None and snapshot['manifest']['hash'] == h:
+        return snapshot
+    try:
+        with open(file, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        snapshot = None
+    if snapshot is None or snapshot['manifest']['hash'] != h:
+        snapshot = {'manifest': {'source': relative_path(source), 'hash': h,
+                                 'sources': [relative_path(file) for file in sources],
+                                 'tables': [], 'compiled': None},
+                    'tables': {}}
+    with _lock:
+        _snapshots[file] = snapshot
+    return snapshot
+
+
+def write_snapshot(source, snapshot):
+    snapshot['manifest']['tables'] = [str(key) for key in snapshot['tables']]
+    snapshot['manifest']['compiled'] = datetime.now().isoformat()
+    write_pickle(snapshot_file(source), snapshot)
+
+
+def write_pickle(file, data):
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmp_file = f'{file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, file)
+
+
+class Workbook:
+    """Drop-in for pd.ExcelFile: every sheet is parsed once and then read from the compiled snapshot
+    until the workbook changes."""
+
+    def __init__(self, file):
+        self.file = file
+        self._excel = None
+
+    def parse(self, sheet_name, header=0):
+        snapshot = load_snapshot(self.file, [self.file])
+        key = (sheet_name, int(header))
+        df = snapshot['tables'].get(key)
+        if df is None:
+            # Excel is only opened when a sheet is missing from the snapshot
+            if self._excel is None:
+                self._excel = pd.ExcelFile(self.file)
+            df = self._excel.parse(sheet_name=sheet_name, header=header)
+            with _lock:
+                snapshot['tables'][key] = df
+            write_snapshot(self.file, snapshot)
+        # Callers modify the sheets they read
+        return df.copy()
+
+    def derived(self, key, compute):
+        """Table computed by `compute` from the sheets of the workbook, stored under `key` in the compiled
+        snapshot until the workbook changes."""
+        snapshot = load_snapshot(self.file, [self.file])
+        table = snapshot['tables'].get(key)
+        if table is None:
+            table = compute()
+            with _lock:
+                snapshot['tables'][key] = table
+            write_snapshot(self.file, snapshot)
+        return deepcopy(table)
+
+
+def read_series(file):
+    """Inflow series CSV `file`, read from the compiled snapshot of every CSV in its folder."""
+    folder = os.path.dirname(file)
+    sources = sorted(glob.glob(folder + '/*.csv'))
+    snapshot = load_snapshot(folder, sources)
+    if sources and not snapshot['tables']:
+        with _lock:
+            snapshot['tables'].update({os.path.basename(source): pd.read_csv(source)
+                                       for source in sources})
+        write_snapshot(folder, snapshot)
+    df = snapshot['tables'].get(os.path.basename(file))
+    if df is None:
+        return pd.read_csv(file)
+    return df.copy()
+
+
+def daily_result(name, sources, compute):
+    """Result of `compute()` for today, computed once per day and version of `sources`.
+
+    The result is kept on disk so every API worker and simulation process shares it.
+    """
+    day = date.today().isoformat()
+    h = sources_hash(sources)
+    with _lock:
+        cached = _daily_results.get(name)
+    if cached is None or cached['day'] != day or cached['hash'] != h:
+        file = SNAPSHOT_FOLDER + 'daily/' + name + '.pkl'
+        try:
+            with open(file, 'rb') as f:
+                cached = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            cached = None
+        if cached is None or cached['day'] != day or cached['hash'] != h:
+            cached = {'day': day, 'hash': h, 'result': compute()}
+            write_pickle(file, cached)
+        with _lock:
+            _daily_results[name] = cached
+    # Callers may modify the result
+    return deepcopy(cached['result'])
@@ -18,8 +18,14 @@
 #####################
 
 # General
+import os
 import sys
+import glob
+import shutil
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from flask import current_app
 
 # Maths operations
@@ -36,16 +42,19 @@ import numpy as np
 # pywr
 from pywr.core import Timestepper, Model, Link, Storage, Input, Output, MultiSplitLink, LossLink
 from pywr.recorders import NumpyArrayNodeRecorder, NumpyArrayStorageRecorder, MinimumVolumeStorageRecorder, \
-                           DeficitFrequencyNodeRecorder
+                           DeficitFrequencyNodeRecorder, Recorder
                            
-from pywr.parameters import load_parameter, MonthlyProfileParameter, DailyProfileParameter
+from pywr.parameters import load_parameter, MonthlyProfileParameter, DailyProfileParameter, ConstantParameter, \
+                            AggregatedParameter
 
 from sklearn.preprocessing import MinMaxScaler
 
 # Import auxiliary functions .py file
 from . import compute_rec as my_aux_file
+from . import model_inputs
+from . import progress
 
-# from pywr import solvers
+from pywr.solvers import solver_registry
 
 
 DATA_FOLDER = current_app.config['DATA_FOLDER']
@@ -86,6 +95,8 @@ PHYSICAL_DATA_FILE =  DATA_FOLDER + '/L4/Model/IN/OUT_SEGU.FIS_to_dataframe.xlsx
 RECURSOS_DEMANDAS_RESUMEN_DATA_FILE =  DATA_FOLDER + '/L4/Model/IN/resumen_recursos_demandas_usos_PHDS1521.xlsx'
 EXCEPTIONS_FILE =  DATA_FOLDER + '/L4/OUT/exceptions_file.xlsx'
 RESULTS_ALL_FILE = DATA_FOLDER + '/L4/OUT/results_file.xlsx'
+# Directorio donde cada proceso vuelca los resultados de cada tipo de nodo mientras calcula el resto
+RESULTS_SPILL_FOLDER = DATA_FOLDER + '/L4/OUT/spill/'
 
 
 ### SHEET and COLUMNS FOR tpa_to_dataframe_file, physical_data_file, recursos_demandas_file, exceptions_file and out_file
@@ -480,6 +491,10 @@ N_MESES_YEAR_ESTANDAR = 12 # Generic constant
 N_DIAS_MES_ESTANDAR = 30 # Generic constant
 N_DIAS_YEAR_ESTANDAR = 366 # Generic constant
 
+# Perfiles diarios de 366 valores: los meses impares tienen 31 días y los pares 30; mes de cada día del perfil
+DIAS_MES_PERFIL_DIARIO = np.array([31, 30] * (N_MESES_YEAR_ESTANDAR // 2))
+MES_DIA_PERFIL_DIARIO = np.repeat(np.arange(N_MESES_YEAR_ESTANDAR), DIAS_MES_PERFIL_DIARIO)
+
 #### DIRECTORIO DE SALIDA DE ARCHIVOS .csv DE APORTACIONES
 PARAMETROS_APORTACIONES_DIRECTORIO_MENSUAL = DATA_FOLDER + '/L4/Model/PARAMETROS/APORTACIONES/MENSUAL/'
 PARAMETROS_APORTACIONES_DIRECTORIO_DIARIO = DATA_FOLDER + '/L4/Model/PARAMETROS/APORTACIONES/DIARIO/'
@@ -506,6 +521,10 @@ PARAM_NOMBRE_demanda_retorno_values_DIARIO = 'PARAM_demanda_retorno_values_DIARI
 PARAM_NOMBRE_recarga_acuifero_values_MENSUAL = 'PARAM_recarga_acuifero_values_MENSUAL_'
 PARAM_NOMBRE_recarga_acuifero_values_DIARIO = 'PARAM_recarga_acuifero_values_DIARIO_'
 
+#### Constantes para definición de parámetros de los factores multiplicadores de los tipos de agua del escenario
+PARAM_NOMBRE_factor_escenario = 'PARAM_factor_escenario_'
+FACTOR_ESCENARIO_subterranea_diario = 'subterranea_diario'
+
 # ------------------------- #
 
 # Constantes de pasos de simulación
@@ -516,6 +535,15 @@ SIMULATION_STEP_PASO_MENSUAL = 2
 SIMULATION_TYPE_PLANNING = 1
 SIMULATION_TYPE_OPTIMISATION = 2
 
+# Solver de pywr de cada tipo de simulación, establecido en la configuración de la API
+SOLVERS_SIMULACION = {SIMULATION_TYPE_PLANNING: current_app.config['PLANNING_SOLVER'], \
+                      SIMULATION_TYPE_OPTIMISATION: current_app.config['OPTIMISATION_SOLVER']}
+
+# ------------------------- #
+
+# Orden en el que se reparten los recursos de cada tipo de agua entre las demandas
+TIPOS_AGUA_ORDEN_REPARTO = ['reutilizada', 'superficial', 'trasvase', 'subterranea', 'desalada']
+
 # ------------------------- #
 
 # Constantes para la gestión de costes
@@ -581,6 +609,40 @@ def CheckIfDemandTypeUsesWaterType(p_strDemand_type, p_strWater_type, p_df_pdf_d
 
 
 
+#******************************************************************************************************
+# FUNCTION: RepartirRecursosADemandas(p_init_max_flow, p_lst_recursos)
+#
+# DESCRIPTION: Repartir los recursos disponibles de cada tipo de agua entre las demandas, por orden de filas
+#              (prioridad). Los tipos de agua se reparten uno detrás de otro; cada demanda recibe de cada tipo de agua
+#              lo que le falta para cubrir su demanda, mientras quede recurso de ese tipo tras servir a las anteriores.
+#              Cada tipo de agua se reparte de una vez sobre todas las filas (arrays de NumPy).
+# ARGUMENTS:
+#	p_init_max_flow: array con la demanda de cada fila
+#	p_lst_recursos: lista de tuplas (recurso disponible, array de booleanos de las filas que usan el tipo de agua),
+#                   en el orden de reparto de los tipos de agua
+# RETURNS: array con el caudal asignado a cada fila y lista de arrays con lo asignado de cada tipo de agua.
+#******************************************************************************************************
+def RepartirRecursosADemandas(p_init_max_flow, p_lst_recursos):
+    
+    flow = np.zeros(len(p_init_max_flow))
+    lst_q_asignado = []
+    for recurso, arr_usa_tipo_agua in p_lst_recursos:
+        # Lo que le falta a cada demanda que usa este tipo de agua
+        q_pendiente = np.where(arr_usa_tipo_agua & (flow < p_init_max_flow), p_init_max_flow - flow, 0.0)
+        
+        # Recurso que queda para cada demanda después de servir a las anteriores
+        q_restante = recurso - np.concatenate(([0.0], np.cumsum(q_pendiente)[:-1]))
+        q_asignado = np.where(q_restante > 0.0, np.minimum(q_pendiente, q_restante), 0.0)
+        
+        flow += q_asignado
+        lst_q_asignado.append(q_asignado)
+    
+    # Return
+    return(flow, lst_q_asignado)
+#-------------------------------------------------------------------------------------------------------------------/
+
+
+
 #******************************************************************************************************
 # FUNCTION: MyErrorHandling(p_error_messages, p_error_code, p_terminate_y_n=True)
 #
@@ -1194,61 +1256,105 @@ def InicializarAcuifero_con_datos_SIMGES(p_acuifero, p_df_pdf_acuiferos, p_simul
             
     return (p_acuifero)
 
+
+# Función auxiliar para obtener los archivos de entrada del modelo: configuración, datos físicos, red hidrológica
+# y series de aportaciones.
+def ArchivosDeEntrada():
+    return ([CONFIG_FILE, PHYSICAL_DATA_FILE, HYDROLOGICAL_NETWORK_DATA_FILE] + \
+            sorted(glob.glob(PARAMETROS_APORTACIONES_DIRECTORIO_MENSUAL + '*.csv')) + \
+            sorted(glob.glob(PARAMETROS_APORTACIONES_DIRECTORIO_DIARIO + '*.csv')))
+
+
+# Función auxiliar para aplicar un factor multiplicador del escenario a un parámetro de perfil (mensual o diario).
+# Si no hay factor, se devuelve el propio parámetro.
+def CrearParametroEscalado(p_model, p_parametro, p_factor):
+    if (p_factor is None): return (p_parametro)
+    return (AggregatedParameter(p_model, [p_parametro, p_factor], agg_func='product'))
+
+
+# Función auxiliar para obtener los nombres de los solvers de pywr disponibles en esta instalación
+# (sin el solver 'null', que no resuelve el problema).
+def SolversDisponibles():
+    return ([solver.name for solver in solver_registry if (solver.name != 'null')])
+
+
+# Función auxiliar para obtener el solver de una simulación: el indicado o, si no se indica, el configurado
+# para su tipo de simulación.
+def ObtenerSolver(p_simulation_type, p_solver=None):
+    solver = p_solver if (p_solver is not None) else SOLVERS_SIMULACION[p_simulation_type]
+    if (solver not in SolversDisponibles()):
+        raise ValueError(f"Solver '{solver}' no disponible; solvers disponibles: {', '.join(SolversDisponibles())}")
+    return (solver)
+
+
+# Función auxiliar para obtener los perfiles mensuales (12 valores) y diarios (366 valores) de todos los elementos
+# de una columna de los datos físicos con 12 valores mensuales separados por espacios. El valor diario de cada mes es
+# su valor mensual repartido entre sus días (ver DIAS_MES_PERFIL_DIARIO); los elementos sin valores tienen un perfil
+# de 0.0. Los perfiles se guardan con los datos físicos compilados, de forma que solo se calculan cuando cambian.
+# RETURNS: matrices (elementos x 12) y (elementos x 366).
+def PerfilesMensualesYDiarios(p_xl_pdf, p_serie_valores_12):
+    lst_valores = ['' if (valores != valores) else valores for valores in p_serie_valores_12]
+    clave = ('perfiles', p_serie_valores_12.name, \
+             hashlib.sha1('\n'.join(lst_valores).encode()).hexdigest())
+    
+    def CalcularPerfiles():
+        mat_mensual = np.zeros((len(lst_valores), N_MESES_YEAR_ESTANDAR))
+        lst_con_valores = [i for i in range(len(lst_valores)) if (lst_valores[i] != '')]
+        valores = np.array(' '.join([lst_valores[i] for i in lst_con_valores]).split(), dtype=np.float64)
+        if (valores.size != len(lst_con_valores) * N_MESES_YEAR_ESTANDAR):
+            raise ValueError("La columna '%s' de los datos físicos no tiene %d valores mensuales por elemento" % \
+                             (p_serie_valores_12.name, N_MESES_YEAR_ESTANDAR))
+        mat_mensual[lst_con_valores] = valores.reshape(-1, N_MESES_YEAR_ESTANDAR)
+        mat_diario = mat_mensual[:, MES_DIA_PERFIL_DIARIO] / DIAS_MES_PERFIL_DIARIO[MES_DIA_PERFIL_DIARIO]
+        return (mat_mensual, mat_diario)
+    
+    return (p_xl_pdf.derived(clave, CalcularPerfiles))
+
+
+# Recorder auxiliar que publica, al final de cada paso de tiempo, el número de pasos simulados de la red.
+class RecorderProgreso(Recorder):
+    def after(self):
+        progress.step(self.model.timestepper.current.index + 1, len(self.model.timestepper))
+
 #######################
 # MAIN FUNCTION	      #
 #######################
 
 
+# Límite de memoria (MB) de cada proceso de simulación (0: sin límite). Con límite, los resultados de cada tipo de
+# nodo se vuelcan a disco en cuanto se calculan y cada proceso mantiene una única red en memoria.
+LIMITE_MEMORIA_SIMULACION = current_app.config['SIMULATION_WORKER_MEMORY_LIMIT']
+
+# Plantillas de red construidas en este proceso: (paso, fechas, solver, hash de los archivos de entrada) -> plantilla.
+# Simular un escenario modifica el modelo de su plantilla, por lo que las simulaciones de un proceso se ejecutan
+# de una en una.
+N_PLANTILLAS_RED_MAX = 1 if (LIMITE_MEMORIA_SIMULACION > 0) else 4
+_plantillas_red = OrderedDict()
+_plantillas_red_lock = threading.RLock()
+
+
 #******************************************************************************************************
-# FUNCTION: Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_step, p_date_init, p_date_end, \
-#                                                       p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
-#                                                       p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
-#                                                       p_percent_agua_desalada=1.0, \
-#                                                       p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0)
+# FUNCTION: ConstruirPlantillaRed(p_simulation_step, p_date_init, p_date_end, p_solver)
 #
-# DESCRIPTION: Realizar la planificación u optimización de suministros a demandas de la CHS.
+# DESCRIPTION: Construir la red hidrológica de pywr (parámetros, nodos, conexiones, recorders y timestepper) para un
+#              paso y periodo de simulación. La red no depende del escenario (factores multiplicadores de los tipos de
+#              agua y pesos de la optimización); el escenario se aplica después con AplicarEscenario().
 # ARGUMENTS:
-# 	p_simulation_type: valor entero que indica si es PLANIFICACION (1) u OPTIMIZACION (2)
 #	p_simulation_step: valor entero que indica si es DIARIO (1) o MENSUAL (2)
 # 	p_date_init: string de fecha de inicio de simulación en formato '%Y-%m-%d'
 # 	p_date_end: string de fecha de fin de simulación en formato '%Y-%m-%d'
-#   p_percent_agua_superficial: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
-#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
-#                               hasta un máximo del 150% de agua superficial disponible.
-#   p_percent_agua_subterranea: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
-#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
-#                               hasta un máximo del 150% de agua superficial disponible.
-#   p_percent_agua_reutilizada: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
-#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
-#                               hasta un máximo del 150% de agua superficial disponible.
-#   p_percent_agua_trasvase:    % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
-#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
-#                               hasta un máximo del 150% de agua superficial disponible.
-#   p_percent_agua_desalada:    % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
-#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
-#                               hasta un máximo del 150% de agua superficial disponible.
-#   p_weight_deficit:  valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la minimización del déficit
-#                      en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit, p_peso_co2 y
-#                      p_peso_economic debe ser 1.0.
-#   p_weight_co2:      valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la minimización del co2
-#                      en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit, p_peso_co2 y
-#                      p_peso_economic debe ser 1.0.
-#   p_weight_economic: valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la maximización del balance
-#                      económico en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit,
-#                      p_peso_co2 y p_peso_economic debe ser 1.0.
-#
+# 	p_solver: nombre del solver de pywr con el que se resuelve el modelo (ver SolversDisponibles())
+# RETURNS: diccionario (plantilla) con el modelo y los elementos de la red necesarios para aplicar escenarios
+#          y guardar los resultados.
 #******************************************************************************************************
-def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_step, p_date_init='', p_date_end='', \
-                                                p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
-                                                p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
-                                                p_percent_agua_desalada=1.0, \
-                                                p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0):
+def ConstruirPlantillaRed(p_simulation_step, p_date_init='', p_date_end='', p_solver='glpk'):
+    
     
-
-
     # 1. First, open config and input files
+    progress.phase('inputs')
+    
     ## 1.1 Open CONFIG FILES file
-    xl_cf = pd.ExcelFile(CONFIG_FILE)
+    xl_cf = model_inputs.Workbook(CONFIG_FILE)
     
     
     ### 1.2.1 Get config data for file 'IN_tpa_to_dataframe_file'
@@ -1256,7 +1362,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     
     ### 1.2.2 Open IN_tpa_to_dataframe_file_path, that is, TPA TO DATAFRAME FILE (HYDROLOGICAL NETWORK FILE)
-    xl_tpatdff = pd.ExcelFile(HYDROLOGICAL_NETWORK_DATA_FILE)
+    xl_tpatdff = model_inputs.Workbook(HYDROLOGICAL_NETWORK_DATA_FILE)
     df_tpatdff = xl_tpatdff.parse(sheet_name=df_config_tpatdff[CFSIFtdf_sheet].iloc[0], header=df_config_tpatdff[CFSIFtdf_header].iloc[0])
     
     
@@ -1265,7 +1371,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     
     ## 1.3.2 Open IN_physical_data_file_path (phsycical data and elements' initialisation data file)
-    xl_pdf = pd.ExcelFile(PHYSICAL_DATA_FILE)
+    xl_pdf = model_inputs.Workbook(PHYSICAL_DATA_FILE)
     
     # (1) General data
     df_pdf = xl_pdf.parse(sheet_name=df_config_pdf[CFSIFpdf_sheet_datos_generales].iloc[0], header=df_config_pdf[CFSIFpdf_header_general].iloc[0])
@@ -1299,6 +1405,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
         
     # 2. Now, we start to create the hydrological model
+    progress.phase('network')
     
     
     ## 2.1 create a model (including an empty network)
@@ -1317,8 +1424,17 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     # + solvers.CythonLPSolveSolver.name: 'lpsolve'
     # + solvers.NullSolver.name: 'null'
     
-    # Por tanto, creamos el modelo pasándole el parámetro solver:
-    model = Model(solver='glpk')
+    # Por tanto, creamos el modelo pasándole el parámetro solver (configurable para cada tipo de simulación):
+    model = Model(solver=p_solver)
+    
+    
+    ## Factores multiplicadores de los tipos de agua del escenario (p_percent_agua_*).
+    ## Se crean con valor 1.0 y AplicarEscenario() les da el valor de cada escenario, de forma que
+    ## la red se construye una única vez para todos los escenarios con el mismo paso y periodo de simulación.
+    dic_FACTORES_ESCENARIO = {}
+    for tipo_agua in [CFRDR_col_superficial, CFRDR_col_subterranea, CFRDR_col_reutilizada, CFRDR_col_trasvase, \
+                      CFRDR_col_desalada, FACTOR_ESCENARIO_subterranea_diario]:
+        dic_FACTORES_ESCENARIO[tipo_agua] = ConstantParameter(model, 1.0, name=PARAM_NOMBRE_factor_escenario + tipo_agua)
     
     
     ## Create the needed parameters
@@ -1330,6 +1446,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     dic_PARAMS_EMBALSES_vol_min_diario = {} # Crear diccionario de parámetros de volumen mínimo diario para embalses
     dic_PARAMS_EMBALSES_vol_max_diario = {} # Crear diccionario de parámetros de volumen máximo diario para embalses
     
+    # Perfiles mensuales y diarios de todos los elementos, calculados de una vez (ver PerfilesMensualesYDiarios())
+    (mat_PARAMS_EMBALSES_vol_min_mensual, mat_PARAMS_EMBALSES_vol_min_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_embalses[CFSDE_col_v_min_mensual_12_vals])
+    (mat_PARAMS_EMBALSES_vol_max_mensual, mat_PARAMS_EMBALSES_vol_max_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_embalses[CFSDE_col_v_max_mensual_12_vals])
+    lst_nombres_embalses = df_pdf_embalses[CFSDE_col_nombre].str.replace('"', '', regex=False).tolist()
     # Run for loop
     for i in range(df_pdf_embalses.shape[0]):
         # Determinamos el nombre del embalse
@@ -1337,20 +1457,13 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         nombre_embalse = df_pdf_embalses[CFSDE_col_nombre].iloc[i].replace('"', '')
         
         # (1.1) Empezamos con los parámetros de volumen mínimo mensual para embalses:
-        values_str_mensual = df_pdf_embalses[CFSDE_col_v_min_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_EMBALSES_vol_min_mensual[i]
                 
         # Creamos el parámetro       
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_vol_min_values_MENSUAL + nombre_embalse
         dic_PARAMS_EMBALSES_vol_min_mensual[parametro.name] = parametro
         
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_embalse])
-        if (i == 0): df_PARAMS_EMBALSES_vol_min_mensual = df_temp
-        else: df_PARAMS_EMBALSES_vol_min_mensual = pd.concat([df_PARAMS_EMBALSES_vol_min_mensual.reset_index(drop=True), \
-                                                              df_temp.reset_index(drop=True)], axis=1)
             
         # (1.2) Lo replicamos para el paso diario
         # NOTA importante sobre "DailyProfileParameter":
@@ -1360,54 +1473,32 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Lo que haremos es lo siguiente:
         # + Para los meses impares, generaremos 31 valores.
         # + Para los meses pares, generaremos 30 valores
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
+        values_list_diario = mat_PARAMS_EMBALSES_vol_min_diario[i]
     
         # Creamos el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_vol_min_values_DIARIO + nombre_embalse
         dic_PARAMS_EMBALSES_vol_min_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_embalse])
-        if (i == 0): df_PARAMS_EMBALSES_vol_min_diario = df_temp
-        else: df_PARAMS_EMBALSES_vol_min_diario = pd.concat([df_PARAMS_EMBALSES_vol_min_diario.reset_index(drop=True), \
-                                                             df_temp.reset_index(drop=True)], axis=1)    
         # (2.1) Seguimos con los parámetros de volumen máximo mensual para embalses:
-        values_str_mensual = df_pdf_embalses[CFSDE_col_v_max_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_EMBALSES_vol_max_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_vol_max_values_MENSUAL + nombre_embalse
         dic_PARAMS_EMBALSES_vol_max_mensual[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_embalse])
-        if (i == 0): df_PARAMS_EMBALSES_vol_max_mensual = df_temp
-        else: df_PARAMS_EMBALSES_vol_max_mensual = pd.concat([df_PARAMS_EMBALSES_vol_max_mensual.reset_index(drop=True), \
-                                                              df_temp.reset_index(drop=True)], axis=1)    
         # (2.2) Lo replicamos para el paso diario
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
+        values_list_diario = mat_PARAMS_EMBALSES_vol_max_diario[i]
     
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_vol_max_values_DIARIO + nombre_embalse
         dic_PARAMS_EMBALSES_vol_max_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_embalse])
-        if (i == 0): df_PARAMS_EMBALSES_vol_max_diario = df_temp
-        else: df_PARAMS_EMBALSES_vol_max_diario = pd.concat([df_PARAMS_EMBALSES_vol_max_diario.reset_index(drop=True), \
-                                                             df_temp.reset_index(drop=True)], axis=1)
+    
+    df_PARAMS_EMBALSES_vol_min_mensual = pd.DataFrame(mat_PARAMS_EMBALSES_vol_min_mensual.T, columns=lst_nombres_embalses)
+    df_PARAMS_EMBALSES_vol_min_diario = pd.DataFrame(mat_PARAMS_EMBALSES_vol_min_diario.T, columns=lst_nombres_embalses)
+    df_PARAMS_EMBALSES_vol_max_mensual = pd.DataFrame(mat_PARAMS_EMBALSES_vol_max_mensual.T, columns=lst_nombres_embalses)
+    df_PARAMS_EMBALSES_vol_max_diario = pd.DataFrame(mat_PARAMS_EMBALSES_vol_max_diario.T, columns=lst_nombres_embalses)
     
     ### (2) Parámetros para aportaciones (mensual)
     dic_PARAMS_APORTACIONES_mensual = {} # Crear diccionario de parámetros de aportaciones mensual
@@ -1415,6 +1506,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     ### Parámetros para aportaciones (diario)
     dic_PARAMS_APORTACIONES_diario = {} # Crear diccionario de parámetros de aportaciones diario
     
+    lst_COSTES_extra_altos_APORTACIONES = [] # Columnas de df_COSTES_extra_altos_APORTACIONES, se unen al final del bucle
     # Run for loop
     for i in range(df_pdf_aportaciones.shape[0]):
         # Determinamos el nombre de la aportación
@@ -1430,7 +1522,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
                                          str(columna_en_archivo_aportaciones) + '.csv'
     
         # Abrir archivo para obtener todos los datos
-        df_values_aportacion_mensual_all = pd.read_csv(file_name_aportaciones_mensual)
+        df_values_aportacion_mensual_all = model_inputs.read_series(file_name_aportaciones_mensual)
     
         # Obtener los datos del periodo de interés (1 año desde hoy)
         # Primero, definimos las fechas (1 año a partir de p_date_init)
@@ -1453,7 +1545,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
                                         str(columna_en_archivo_aportaciones) + '.csv'
     
         # Abrir archivo para obtener todos los datos
-        df_values_aportacion_diario_all = pd.read_csv(file_name_aportaciones_diario)
+        df_values_aportacion_diario_all = model_inputs.read_series(file_name_aportaciones_diario)
     
         # Obtener los datos del periodo de interés (1 año desde hoy)
         # Ya hemos definido las fechas antes
@@ -1466,37 +1558,20 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Pasamos los valores a una lista
         values_list_diario = df_values_aportacion_diario_1_year[ARCHIVO_CSV_APORTACIONES_CAMPO_VALOR].values
     
-        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-        # aguas utilizar más o menos agua subterránea (p_percent_agua_superficial)
-        # Comprobamos el tipo de aportación
-        if (df_pdf_aportaciones[CFSDA_col_tipo_aportacion].iloc[i] == CFRDR_col_superficial):    
-            # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-            # aguas utilizar más o menos agua superficial (p_percent_agua_superficial)
-            values_list_mensual = list(map((p_percent_agua_superficial).__mul__, values_list_mensual))    
-            values_list_diario = list(map((p_percent_agua_superficial).__mul__, values_list_diario))    
-    
-        # Comprobamos el tipo de aportación
-        if (df_pdf_aportaciones[CFSDA_col_tipo_aportacion].iloc[i] == CFRDR_col_trasvase):    
-            # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-            # aguas utilizar más o menos agua superficial (p_percent_agua_trasvase)
-            values_list_mensual = list(map((p_percent_agua_trasvase).__mul__, values_list_mensual))    
-            values_list_diario = list(map((p_percent_agua_trasvase).__mul__, values_list_diario))    
-    
-        # Comprobamos el tipo de aportación
-        if (df_pdf_aportaciones[CFSDA_col_tipo_aportacion].iloc[i] == CFRDR_col_desalada):     
-            # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-            # aguas utilizar más o menos agua desalada (p_percent_agua_desalada)
-            values_list_mensual = list(map((p_percent_agua_desalada).__mul__, values_list_mensual))    
-            values_list_diario = list(map((p_percent_agua_desalada).__mul__, values_list_diario))    
-    
-        # Creamos los parámetros tras aplicar el factor multiplicador
+        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de
+        # aguas utilizar más o menos agua superficial, del trasvase o desalada según el tipo de aportación
+        # (p_percent_agua_superficial, p_percent_agua_trasvase y p_percent_agua_desalada).
+        # El factor es un parámetro de la red cuyo valor establece AplicarEscenario() en cada escenario.
+        factor_escenario = dic_FACTORES_ESCENARIO.get(df_pdf_aportaciones[CFSDA_col_tipo_aportacion].iloc[i])
+
+        # Creamos los parámetros con el factor multiplicador
         # Parámetro para valores mensuales
-        parametro = MonthlyProfileParameter(model, values_list_mensual)
+        parametro = CrearParametroEscalado(model, MonthlyProfileParameter(model, values_list_mensual), factor_escenario)
         parametro.name = PARAM_NOMBRE_aportaciones_MENSUAL + nombre_aportacion
         dic_PARAMS_APORTACIONES_mensual[parametro.name] = parametro
         
         # Parámetro para valores diarios
-        parametro = DailyProfileParameter(model, values_list_diario)
+        parametro = CrearParametroEscalado(model, DailyProfileParameter(model, values_list_diario), factor_escenario)
         parametro.name = PARAM_NOMBRE_aportaciones_DIARIO + nombre_aportacion
         dic_PARAMS_APORTACIONES_diario[parametro.name] = parametro    
         
@@ -1505,14 +1580,14 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Primero, definimos el valor del coste sumar:
         coste = 0 # Valor por defecto a sumar
         # Hay que leer el archivo de aportaciones
-        df_all_values_element = pd.read_csv(file_name_aportaciones_mensual)
+        df_all_values_element = model_inputs.read_series(file_name_aportaciones_mensual)
         if (df_all_values_element[ARCHIVO_CSV_APORTACIONES_CAMPO_VALOR].sum()==0): coste = COSTE_EXTRA_ALTO_1000000
         
         # Ahora, guardamos el valor en un df
         df_temp = pd.DataFrame([coste], columns = [nombre_aportacion])
-        if (i == 0): df_COSTES_extra_altos_APORTACIONES = df_temp
-        else: df_COSTES_extra_altos_APORTACIONES = pd.concat([df_COSTES_extra_altos_APORTACIONES.reset_index(drop=True), \
-                                                              df_temp.reset_index(drop=True)], axis=1)
+        lst_COSTES_extra_altos_APORTACIONES.append(df_temp)
+    
+    df_COSTES_extra_altos_APORTACIONES = pd.concat(lst_COSTES_extra_altos_APORTACIONES, axis=1)
     
     
     ### (3) Parámetros para demandas (mensual)
@@ -1521,6 +1596,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     ### Parámetros para demandas (diario)
     dic_PARAMS_DEMANDAS_diario = {} # Crear diccionario de parámetros de caudal diario para demandas
     
+    lst_COSTES_extra_altos_DEMANDAS = [] # Columnas de df_COSTES_extra_altos_DEMANDAS, se unen al final del bucle
+    # Perfiles mensuales y diarios de todos los elementos, calculados de una vez (ver PerfilesMensualesYDiarios())
+    (mat_PARAMS_DEMANDAS_mensual, mat_PARAMS_DEMANDAS_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_demandas[CFSDD_col_demanda_mensual_12_vals])
+    lst_nombres_demandas = df_pdf_demandas[CFSDD_col_nombre].str.replace('"', '', regex=False).tolist()
     # Run for loop
     for i in range(df_pdf_demandas.shape[0]):
         # Determinamos el nombre de la demanda
@@ -1528,18 +1607,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         nombre_demanda = df_pdf_demandas[CFSDD_col_nombre].iloc[i].replace('"', '')
     
         # (1.1) Empezamos con los parámetros de caudal de demanda mensual para demandas:
-        values_str_mensual = df_pdf_demandas[CFSDD_col_demanda_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_DEMANDAS_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_demanda_values_MENSUAL + nombre_demanda
         dic_PARAMS_DEMANDAS_mensual[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_demanda])
-        if (i == 0): df_PARAMS_DEMANDAS_mensual = df_temp
-        else: df_PARAMS_DEMANDAS_mensual = pd.concat([df_PARAMS_DEMANDAS_mensual.reset_index(drop=True), \
-                                                      df_temp.reset_index(drop=True)], axis=1)
         # (1.2) Lo replicamos para el paso diario
         # NOTA importante sobre "DailyProfileParameter":
         # "An annual profile consisting of daily values.
@@ -1548,23 +1620,13 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Lo que haremos es lo siguiente:
         # + Para los meses impares, generaremos 31 valores.
         # + Para los meses pares, generaremos 30 valores
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera 
+        values_list_diario = mat_PARAMS_DEMANDAS_diario[i]
         
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_demanda_values_DIARIO + nombre_demanda
         dic_PARAMS_DEMANDAS_diario[parametro.name] = parametro
         
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_demanda])
-        if (i == 0): df_PARAMS_DEMANDAS_diario = df_temp
-        else: df_PARAMS_DEMANDAS_diario = pd.concat([df_PARAMS_DEMANDAS_diario.reset_index(drop=True), \
-                                                     df_temp.reset_index(drop=True)], axis=1)
             
         
         # NOVEDAD: creamos un df para crear unos costes muy altos en aquellos casos en los que la seroe completa de la 
@@ -1575,9 +1637,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         
         # Ahora, guardamos el valor en un df
         df_temp = pd.DataFrame([coste], columns = [nombre_demanda])
-        if (i == 0): df_COSTES_extra_altos_DEMANDAS = df_temp
-        else: df_COSTES_extra_altos_DEMANDAS = pd.concat([df_COSTES_extra_altos_DEMANDAS.reset_index(drop=True), \
-                                                          df_temp.reset_index(drop=True)], axis=1)        
+        lst_COSTES_extra_altos_DEMANDAS.append(df_temp)
+    
+    df_PARAMS_DEMANDAS_mensual = pd.DataFrame(mat_PARAMS_DEMANDAS_mensual.T, columns=lst_nombres_demandas)
+    df_PARAMS_DEMANDAS_diario = pd.DataFrame(mat_PARAMS_DEMANDAS_diario.T, columns=lst_nombres_demandas)
+    df_COSTES_extra_altos_DEMANDAS = pd.concat(lst_COSTES_extra_altos_DEMANDAS, axis=1)
     
     
     ### (5) Parámetros para conducciones1 (mensual)
@@ -1588,6 +1652,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     dic_PARAMS_CONDUCCIONES1_q_min_diario = {} # Crear diccionario de parámetros de caudal mínimo diario para conducciones1
     dic_PARAMS_CONDUCCIONES1_q_max_diario = {} # Crear diccionario de parámetros de caudal máximo diario para conducciones1
     
+    lst_COSTES_extra_altos_CONDUCCIONES1 = [] # Columnas de df_COSTES_extra_altos_CONDUCCIONES1, se unen al final del bucle
+    # Perfiles mensuales y diarios de todos los elementos, calculados de una vez (ver PerfilesMensualesYDiarios())
+    (mat_PARAMS_CONDUCCIONES1_q_min_mensual, mat_PARAMS_CONDUCCIONES1_q_min_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_conducciones1[CFSDC1_col_qmin_mensual_12_vals])
+    (mat_PARAMS_CONDUCCIONES1_q_max_mensual, mat_PARAMS_CONDUCCIONES1_q_max_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_conducciones1[CFSDC1_col_qmax_mensual_12_vals])
+    lst_nombres_conducciones1 = df_pdf_conducciones1[CFSDC1_col_nombre].str.replace('"', '', regex=False).tolist()
     # Run for loop
     for i in range(df_pdf_conducciones1.shape[0]):
         # Determinamos el nombre de la conduccion1
@@ -1595,18 +1664,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         nombre_conduccion1 = df_pdf_conducciones1[CFSDC1_col_nombre].iloc[i].replace('"', '')
     
         # (1.1) Empezamos con los parámetros de caudal mínimo mensual para conducciones1:
-        values_str_mensual = df_pdf_conducciones1[CFSDC1_col_qmin_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_CONDUCCIONES1_q_min_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_q_min_values_MENSUAL + nombre_conduccion1
         dic_PARAMS_CONDUCCIONES1_q_min_mensual[parametro.name] = parametro
         
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_conduccion1])
-        if (i == 0): df_PARAMS_CONDUCCIONES1_q_min_mensual = df_temp
-        else: df_PARAMS_CONDUCCIONES1_q_min_mensual = pd.concat([df_PARAMS_CONDUCCIONES1_q_min_mensual.reset_index(drop=True), \
-                                                                 df_temp.reset_index(drop=True)], axis=1)
         # (1.2) Lo replicamos para el paso diario
         # NOTA importante sobre "DailyProfileParameter":
         # "An annual profile consisting of daily values.
@@ -1615,56 +1677,29 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Lo que haremos es lo siguiente:
         # + Para los meses impares, generaremos 31 valores.
         # + Para los meses pares, generaremos 30 valores
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
+        values_list_diario = mat_PARAMS_CONDUCCIONES1_q_min_diario[i]
         
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_q_min_values_DIARIO + nombre_conduccion1
         dic_PARAMS_CONDUCCIONES1_q_min_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_conduccion1])
-        if (i == 0): df_PARAMS_CONDUCCIONES1_q_min_diario = df_temp
-        else: df_PARAMS_CONDUCCIONES1_q_min_diario = pd.concat([df_PARAMS_CONDUCCIONES1_q_min_diario.reset_index(drop=True), \
-                                                                df_temp.reset_index(drop=True)], axis=1)
         
         # (2.1) Seguimos con los parámetros de caudal máximo mensual para conducciones1:
-        values_str_mensual = df_pdf_conducciones1[CFSDC1_col_qmax_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_CONDUCCIONES1_q_max_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_q_max_values_MENSUAL + nombre_conduccion1
         dic_PARAMS_CONDUCCIONES1_q_max_mensual[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_conduccion1])
-        if (i == 0): df_PARAMS_CONDUCCIONES1_q_max_mensual = df_temp
-        else: df_PARAMS_CONDUCCIONES1_q_max_mensual = pd.concat([df_PARAMS_CONDUCCIONES1_q_max_mensual.reset_index(drop=True), \
-                                                                 df_temp.reset_index(drop=True)], axis=1)
         
         # (2.2) Lo replicamos para el paso diario
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
+        values_list_diario = mat_PARAMS_CONDUCCIONES1_q_max_diario[i]
     
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_q_max_values_DIARIO + nombre_conduccion1
         dic_PARAMS_CONDUCCIONES1_q_max_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_conduccion1])
-        if (i == 0): df_PARAMS_CONDUCCIONES1_q_max_diario = df_temp
-        else: df_PARAMS_CONDUCCIONES1_q_max_diario = pd.concat([df_PARAMS_CONDUCCIONES1_q_max_diario.reset_index(drop=True), \
-                                                                df_temp.reset_index(drop=True)], axis=1)
             
         # NOVEDAD: creamos un df para crear unos costes muy altos en aquellos casos en los que la seroe completa de la 
         # aportación es 0; estos costes, se sumarán después del cálculo de los costes tras el anális de rutas.
@@ -1674,9 +1709,13 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         
         # Ahora, guardamos el valor en un df
         df_temp = pd.DataFrame([coste], columns = [nombre_conduccion1])
-        if (i == 0): df_COSTES_extra_altos_CONDUCCIONES1 = df_temp
-        else: df_COSTES_extra_altos_CONDUCCIONES1 = pd.concat([df_COSTES_extra_altos_CONDUCCIONES1.reset_index(drop=True), \
-                                                               df_temp.reset_index(drop=True)], axis=1)                
+        lst_COSTES_extra_altos_CONDUCCIONES1.append(df_temp)
+    
+    df_PARAMS_CONDUCCIONES1_q_min_mensual = pd.DataFrame(mat_PARAMS_CONDUCCIONES1_q_min_mensual.T, columns=lst_nombres_conducciones1)
+    df_PARAMS_CONDUCCIONES1_q_min_diario = pd.DataFrame(mat_PARAMS_CONDUCCIONES1_q_min_diario.T, columns=lst_nombres_conducciones1)
+    df_PARAMS_CONDUCCIONES1_q_max_mensual = pd.DataFrame(mat_PARAMS_CONDUCCIONES1_q_max_mensual.T, columns=lst_nombres_conducciones1)
+    df_PARAMS_CONDUCCIONES1_q_max_diario = pd.DataFrame(mat_PARAMS_CONDUCCIONES1_q_max_diario.T, columns=lst_nombres_conducciones1)
+    df_COSTES_extra_altos_CONDUCCIONES1 = pd.concat(lst_COSTES_extra_altos_CONDUCCIONES1, axis=1)
     
     
     ### (6) Parámetros para conducciones3 (mensual)
@@ -1687,6 +1726,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     dic_PARAMS_CONDUCCIONES3_q_min_diario = {} # Crear diccionario de parámetros de caudal mínimo diario para conducciones3
     dic_PARAMS_CONDUCCIONES3_q_max_diario = {} # Crear diccionario de parámetros de caudal máximo diario para conducciones3
     
+    lst_COSTES_extra_altos_CONDUCCIONES3 = [] # Columnas de df_COSTES_extra_altos_CONDUCCIONES3, se unen al final del bucle
+    # Perfiles mensuales y diarios de todos los elementos, calculados de una vez (ver PerfilesMensualesYDiarios())
+    (mat_PARAMS_CONDUCCIONES3_q_min_mensual, mat_PARAMS_CONDUCCIONES3_q_min_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_conducciones3[CFSDC3_col_qmin_mensual_12_vals])
+    (mat_PARAMS_CONDUCCIONES3_q_max_mensual, mat_PARAMS_CONDUCCIONES3_q_max_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_conducciones3[CFSDC3_col_qmax_mensual_12_vals])
+    lst_nombres_conducciones3 = df_pdf_conducciones3[CFSDC3_col_nombre].str.replace('"', '', regex=False).tolist()
     # Run for loop
     for i in range(df_pdf_conducciones3.shape[0]):
         # Determinamos el nombre de la conduccion3
@@ -1694,18 +1738,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         nombre_conduccion3 = df_pdf_conducciones3[CFSDC3_col_nombre].iloc[i].replace('"', '')
     
         # (1.1) Empezamos con los parámetros de caudal mínimo mensual para conducciones3:
-        values_str_mensual = df_pdf_conducciones3[CFSDC3_col_qmin_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_CONDUCCIONES3_q_min_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_q_min_values_MENSUAL + nombre_conduccion3
         dic_PARAMS_CONDUCCIONES3_q_min_mensual[parametro.name] = parametro
             
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_conduccion3])
-        if (i == 0): df_PARAMS_CONDUCCIONES3_q_min_mensual = df_temp
-        else: df_PARAMS_CONDUCCIONES3_q_min_mensual = pd.concat([df_PARAMS_CONDUCCIONES3_q_min_mensual.reset_index(drop=True), \
-                                                                 df_temp.reset_index(drop=True)], axis=1)
         
         # (1.2) Lo replicamos para el paso diario
         # NOTA importante sobre "DailyProfileParameter":
@@ -1715,56 +1752,29 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Lo que haremos es lo siguiente:
         # + Para los meses impares, generaremos 31 valores.
         # + Para los meses pares, generaremos 30 valores
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
+        values_list_diario = mat_PARAMS_CONDUCCIONES3_q_min_diario[i]
         
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_q_min_values_DIARIO + nombre_conduccion3
         dic_PARAMS_CONDUCCIONES3_q_min_diario[parametro.name] = parametro
         
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_conduccion3])
-        if (i == 0): df_PARAMS_CONDUCCIONES3_q_min_diario = df_temp
-        else: df_PARAMS_CONDUCCIONES3_q_min_diario = pd.concat([df_PARAMS_CONDUCCIONES3_q_min_diario.reset_index(drop=True), \
-                                                                df_temp.reset_index(drop=True)], axis=1)
         
         # (2.1) Seguimos con los parámetros de caudal máximo mensual para conducciones3:
-        values_str_mensual = df_pdf_conducciones3[CFSDC3_col_qmax_mensual_12_vals].iloc[i]
-        values_list_mensual = [float(j) for j in values_str_mensual.split()]
+        values_list_mensual = mat_PARAMS_CONDUCCIONES3_q_max_mensual[i]
         parametro = MonthlyProfileParameter(model, values_list_mensual)
         parametro.name = PARAM_NOMBRE_q_max_values_MENSUAL + nombre_conduccion3
         dic_PARAMS_CONDUCCIONES3_q_max_mensual[parametro.name] = parametro
         
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_conduccion3])
-        if (i == 0): df_PARAMS_CONDUCCIONES3_q_max_mensual = df_temp
-        else: df_PARAMS_CONDUCCIONES3_q_max_mensual = pd.concat([df_PARAMS_CONDUCCIONES3_q_max_mensual.reset_index(drop=True), \
-                                                                 df_temp.reset_index(drop=True)], axis=1)
         
         # (2.2) Lo replicamos para el paso diario
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera  
+        values_list_diario = mat_PARAMS_CONDUCCIONES3_q_max_diario[i]
     
         # Ahora, crear el parámetro
         parametro = DailyProfileParameter(model, values_list_diario)
         parametro.name = PARAM_NOMBRE_q_max_values_DIARIO + nombre_conduccion3
         dic_PARAMS_CONDUCCIONES3_q_max_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_conduccion3])
-        if (i == 0): df_PARAMS_CONDUCCIONES3_q_max_diario = df_temp
-        else: df_PARAMS_CONDUCCIONES3_q_max_diario = pd.concat([df_PARAMS_CONDUCCIONES3_q_max_diario.reset_index(drop=True), \
-                                                                df_temp.reset_index(drop=True)], axis=1)
             
         # NOVEDAD: creamos un df para crear unos costes muy altos en aquellos casos en los que la seroe completa de la 
         # aportación es 0; estos costes, se sumarán después del cálculo de los costes tras el anális de rutas.
@@ -1774,9 +1784,13 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         
         # Ahora, guardamos el valor en un df
         df_temp = pd.DataFrame([coste], columns = [nombre_conduccion3])
-        if (i == 0): df_COSTES_extra_altos_CONDUCCIONES3 = df_temp
-        else: df_COSTES_extra_altos_CONDUCCIONES3 = pd.concat([df_COSTES_extra_altos_CONDUCCIONES3.reset_index(drop=True), \
-                                                               df_temp.reset_index(drop=True)], axis=1)                        
+        lst_COSTES_extra_altos_CONDUCCIONES3.append(df_temp)
+    
+    df_PARAMS_CONDUCCIONES3_q_min_mensual = pd.DataFrame(mat_PARAMS_CONDUCCIONES3_q_min_mensual.T, columns=lst_nombres_conducciones3)
+    df_PARAMS_CONDUCCIONES3_q_min_diario = pd.DataFrame(mat_PARAMS_CONDUCCIONES3_q_min_diario.T, columns=lst_nombres_conducciones3)
+    df_PARAMS_CONDUCCIONES3_q_max_mensual = pd.DataFrame(mat_PARAMS_CONDUCCIONES3_q_max_mensual.T, columns=lst_nombres_conducciones3)
+    df_PARAMS_CONDUCCIONES3_q_max_diario = pd.DataFrame(mat_PARAMS_CONDUCCIONES3_q_max_diario.T, columns=lst_nombres_conducciones3)
+    df_COSTES_extra_altos_CONDUCCIONES3 = pd.concat(lst_COSTES_extra_altos_CONDUCCIONES3, axis=1)
     
     
     ### (8) Parámetros para Retornos <---> Input + Output
@@ -1787,6 +1801,9 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     #### Parámetros para retornos (diario)
     dic_PARAMS_RETORNOS_demanda_diario = {} # Crear diccionario de parámetros de demanda diaria para retornos
     
+    lst_PARAMS_RETORNOS_demanda_mensual = [] # Columnas de df_PARAMS_RETORNOS_demanda_mensual, se unen al final del bucle
+    lst_PARAMS_RETORNOS_demanda_diario = [] # Columnas de df_PARAMS_RETORNOS_demanda_diario, se unen al final del bucle
+    lst_COSTES_extra_altos_RETORNOS = [] # Columnas de df_COSTES_extra_altos_RETORNOS, se unen al final del bucle
     # Run for loop
     for i in range(df_pdf_retornos.shape[0]):
         # A continuación, comprobar si es un destino de alguna toma de demanda.
@@ -1832,32 +1849,28 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Ahora, crear los parámetros, si procede
         if (df_demandas_a_considerar.shape[0] > 0):
 
-            # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-            # aguas utilzar más o menos agua reutilizada (p_percent_agua_reutilizada)
-            values_list_mensual = list(map((p_percent_agua_reutilizada).__mul__, values_list_mensual))    
-            values_list_diario = list(map((p_percent_agua_reutilizada).__mul__, values_list_diario))    
+            # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de
+            # aguas utilzar más o menos agua reutilizada (p_percent_agua_reutilizada).
+            # El factor es un parámetro de la red cuyo valor establece AplicarEscenario() en cada escenario.
+            factor_escenario = dic_FACTORES_ESCENARIO[CFRDR_col_reutilizada]
 
             # Crear los parámetros (MENSUAL)
-            parametro = MonthlyProfileParameter(model, values_list_mensual)
+            parametro = CrearParametroEscalado(model, MonthlyProfileParameter(model, values_list_mensual), factor_escenario)
             parametro.name = PARAM_NOMBRE_demanda_retorno_values_MENSUAL + nombre_retorno
             dic_PARAMS_RETORNOS_demanda_mensual[parametro.name] = parametro
     
             # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
             df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_retorno])
-            if (i == 0): df_PARAMS_RETORNOS_demanda_mensual = df_temp
-            else: df_PARAMS_RETORNOS_demanda_mensual = pd.concat([df_PARAMS_RETORNOS_demanda_mensual.reset_index(drop=True), \
-                                                                  df_temp.reset_index(drop=True)], axis=1)
+            lst_PARAMS_RETORNOS_demanda_mensual.append(df_temp)
     
             # Crear los parámetros (DIARIO)
-            parametro = DailyProfileParameter(model, values_list_diario)
+            parametro = CrearParametroEscalado(model, DailyProfileParameter(model, values_list_diario), factor_escenario)
             parametro.name = PARAM_NOMBRE_demanda_retorno_values_DIARIO + nombre_retorno
             dic_PARAMS_RETORNOS_demanda_diario[parametro.name] = parametro
     
             # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
             df_temp = pd.DataFrame(values_list_diario, columns = [nombre_retorno])
-            if (i == 0): df_PARAMS_RETORNOS_demanda_diario = df_temp
-            else: df_PARAMS_RETORNOS_demanda_diario = pd.concat([df_PARAMS_RETORNOS_demanda_diario.reset_index(drop=True), \
-                                                                 df_temp.reset_index(drop=True)], axis=1)
+            lst_PARAMS_RETORNOS_demanda_diario.append(df_temp)
                         
             # NOVEDAD: creamos un df para crear unos costes muy altos en aquellos casos en los que la serie completa de la 
             # aportación sea 0; estos costes, se sumarán después del cálculo de los costes tras el anális de rutas.
@@ -1867,9 +1880,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
             # Ahora, guardamos el valor en un df
             df_temp = pd.DataFrame([coste], columns = [nombre_retorno])
-            if (i == 0): df_COSTES_extra_altos_RETORNOS = df_temp
-            else: df_COSTES_extra_altos_RETORNOS = pd.concat([df_COSTES_extra_altos_RETORNOS.reset_index(drop=True), \
-                                                              df_temp.reset_index(drop=True)], axis=1)                                    
+            lst_COSTES_extra_altos_RETORNOS.append(df_temp)
+    
+    df_PARAMS_RETORNOS_demanda_mensual = pd.concat(lst_PARAMS_RETORNOS_demanda_mensual, axis=1)
+    df_PARAMS_RETORNOS_demanda_diario = pd.concat(lst_PARAMS_RETORNOS_demanda_diario, axis=1)
+    df_COSTES_extra_altos_RETORNOS = pd.concat(lst_COSTES_extra_altos_RETORNOS, axis=1)
     
     
     ### (9) Parámetros para acuíferos (mensual)
@@ -1878,6 +1893,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     ### Parámetros para acuíferos (diario)
     dic_PARAMS_ACUIFEROS_recarga_diario = {} # Crear diccionario de parámetros de volumen de recarga diario para acuiferos
     
+    lst_COSTES_extra_altos_ACUIFEROS = [] # Columnas de df_COSTES_extra_altos_ACUIFEROS, se unen al final del bucle
+    # Perfiles mensuales y diarios de todos los elementos, calculados de una vez (ver PerfilesMensualesYDiarios())
+    (mat_PARAMS_ACUIFEROS_recarga_mensual, mat_PARAMS_ACUIFEROS_recarga_diario) = PerfilesMensualesYDiarios(xl_pdf, df_pdf_acuiferos[CFSDAC_col_recarga_mensual_12_vals])
+    lst_nombres_acuiferos = df_pdf_acuiferos[CFSDAC_col_nombre].str.replace('"', '', regex=False).tolist()
     # Run for loop
     for i in range(df_pdf_acuiferos.shape[0]):
         # Determinamos el nombre del acuifero
@@ -1885,30 +1904,17 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         nombre_acuifero = df_pdf_acuiferos[CFSDAC_col_nombre].iloc[i].replace('"', '')
     
         # (1.1) Empezamos con los parámetros de volumen de recarga mensual para acuiferos:
-        values_str_mensual = df_pdf_acuiferos[CFSDAC_col_recarga_mensual_12_vals].iloc[i]
-        if (values_str_mensual != values_str_mensual): # Hay casos en los que no se define la recarga, por tanto, 
-                                                       # hay que considerarlo (NOTA: esta forma de hacer el if() es una forma
-                                                       # de saber si un valor es NaN.
-            # Creamos un una lista de [0.0] 12 veces
-            values_list_mensual = [0.0] * 12
-        else:
-            values_list_mensual = [float(j) for j in values_str_mensual.split()]
-
-        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-        # aguas utilzar más o menos agua subterránea (p_percent_agua_subterranea)
-        values_list_mensual = list(map((p_percent_agua_subterranea).__mul__, values_list_mensual))    
-
-        # Creamos el parámetro tras aplicar el factor multiplicador
-        parametro = MonthlyProfileParameter(model, values_list_mensual)
+        # NOTA: hay casos en los que no se define la recarga; su perfil es 0.0 (ver PerfilesMensualesYDiarios()).
+        values_list_mensual = mat_PARAMS_ACUIFEROS_recarga_mensual[i]
+
+        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de
+        # aguas utilzar más o menos agua subterránea (p_percent_agua_subterranea).
+        # El factor es un parámetro de la red cuyo valor establece AplicarEscenario() en cada escenario.
+        parametro = CrearParametroEscalado(model, MonthlyProfileParameter(model, values_list_mensual), \
+                                           dic_FACTORES_ESCENARIO[CFRDR_col_subterranea])
         parametro.name = PARAM_NOMBRE_recarga_acuifero_values_MENSUAL + nombre_acuifero
         dic_PARAMS_ACUIFEROS_recarga_mensual[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_mensual, columns = [nombre_acuifero])
-        if (i == 0): df_PARAMS_ACUIFEROS_recarga_mensual = df_temp
-        else: df_PARAMS_ACUIFEROS_recarga_mensual = pd.concat([df_PARAMS_ACUIFEROS_recarga_mensual.reset_index(drop=True), \
-                                                               df_temp.reset_index(drop=True)], axis=1)
         # (1.2) Lo replicamos para el paso diario
         # NOTA importante sobre "DailyProfileParameter":
         # "An annual profile consisting of daily values.
@@ -1917,27 +1923,17 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         # Lo que haremos es lo siguiente:
         # + Para los meses impares, generaremos 31 valores.
         # + Para los meses pares, generaremos 30 valores
-        for j in range(len(values_list_mensual)):
-            if (((j+1)%2) == 1): valores_diarios_temp = [values_list_mensual[j]/31] * 31
-            else: valores_diarios_temp = [values_list_mensual[j]/30] * 30
-            if (j == 0): values_list_diario = valores_diarios_temp
-            else: values_list_diario = values_list_diario + valores_diarios_temp # Concatena la segunda lista a la primera
-        
-        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de 
-        # aguas utilzar más o menos agua subterránea (p_percent_agua_subterranea)
-        values_list_diario = list(map((p_percent_agua_subterranea).__mul__, values_list_diario))                
-
-        # Creamos el parámetro tras aplicar el factor multiplicador
-        parametro = DailyProfileParameter(model, values_list_diario)
+        values_list_diario = mat_PARAMS_ACUIFEROS_recarga_diario[i]
+        
+        # Reqisito de la aplicación de L4/L5 de la plataforma: aplicar el factor multiplicador de
+        # aguas utilzar más o menos agua subterránea (p_percent_agua_subterranea).
+        # NOTA: la recarga diaria se obtiene de la recarga mensual ya escalada y se vuelve a escalar,
+        # por lo que su factor es (p_percent_agua_subterranea * p_percent_agua_subterranea).
+        parametro = CrearParametroEscalado(model, DailyProfileParameter(model, values_list_diario), \
+                                           dic_FACTORES_ESCENARIO[FACTOR_ESCENARIO_subterranea_diario])
         parametro.name = PARAM_NOMBRE_recarga_acuifero_values_DIARIO + nombre_acuifero
         dic_PARAMS_ACUIFEROS_recarga_diario[parametro.name] = parametro
     
-        # Adicionalmente, guardamos los parámetros en un df que necesitaremos en la parte guardado de los resultados
-        # NOTA: al nombre del elemento, le quitamos las comillas.
-        df_temp = pd.DataFrame(values_list_diario, columns = [nombre_acuifero])
-        if (i == 0): df_PARAMS_ACUIFEROS_recarga_diario = df_temp
-        else: df_PARAMS_ACUIFEROS_recarga_diario = pd.concat([df_PARAMS_ACUIFEROS_recarga_diario.reset_index(drop=True), \
-                                                              df_temp.reset_index(drop=True)], axis=1)
                         
         # NOVEDAD: creamos un df para crear unos costes muy altos en aquellos casos en los que la seroe completa de la 
         # aportación es 0; estos costes, se sumarán después del cálculo de los costes tras el anális de rutas.
@@ -1947,9 +1943,11 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
         # Ahora, guardamos el valor en un df
         df_temp = pd.DataFrame([coste], columns = [nombre_acuifero])
-        if (i == 0): df_COSTES_extra_altos_ACUIFEROS = df_temp
-        else: df_COSTES_extra_altos_ACUIFEROS = pd.concat([df_COSTES_extra_altos_ACUIFEROS.reset_index(drop=True), \
-                                                           df_temp.reset_index(drop=True)], axis=1)                                            
+        lst_COSTES_extra_altos_ACUIFEROS.append(df_temp)
+    
+    df_PARAMS_ACUIFEROS_recarga_mensual = pd.DataFrame(mat_PARAMS_ACUIFEROS_recarga_mensual.T, columns=lst_nombres_acuiferos)
+    df_PARAMS_ACUIFEROS_recarga_diario = pd.DataFrame(mat_PARAMS_ACUIFEROS_recarga_diario.T, columns=lst_nombres_acuiferos)
+    df_COSTES_extra_altos_ACUIFEROS = pd.concat(lst_COSTES_extra_altos_ACUIFEROS, axis=1)
     
     
     ## 2.2 Create nodes and edges. We start with nodes, in the following order and mapping
@@ -2069,6 +2067,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     ### (3) Demanda <---> Output
     df_demandas = df_tpatdff[df_tpatdff[g_col_tipo_elemento_nombre]=='Demanda'] # Crear dataframe de demandas
     dic_demandas = {} # Crear diccionario de demandas
+    dic_demandas_costes = {} # Crear diccionario de datos para el coste de las demandas
 
     # Run for loop
     for i in range(df_demandas.shape[0]):
@@ -2081,17 +2080,12 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             demanda = InicializarDemanda_con_datos_SIMGES(demanda, df_pdf_demandas, p_simulation_step, \
                                                           dic_PARAMS_DEMANDAS_mensual, dic_PARAMS_DEMANDAS_diario)
     
-            # Si se va a utilizar el nuevo cálculo de costes, inicializamos este valor en base a la prioridad
-            # del tipo de demanda
+            # Si se va a utilizar el nuevo cálculo de costes, guardamos la prioridad del tipo de demanda y sus
+            # impactos de co2 y económico; AplicarEscenario() calcula con ellos el coste de cada escenario
             if (bln_Nuevo_calculo_costes == True):
-                demanda.cost = df_demandas[g_col_prioridad_tipo_demanda].iloc[i]
-                if (p_simulation_type == SIMULATION_TYPE_OPTIMISATION):
-                    demanda.cost *= p_peso_deficit
-                    demanda.cost += (df_demandas[g_col_impacto_co2_demanda].iloc[i] * p_peso_co2)
-                    demanda.cost += (df_demandas[g_col_impacto_econ_demanda].iloc[i] * p_peso_economic)
-                    
-                # Convertimos el coste a valor entero
-                demanda.cost = int(demanda.cost)
+                dic_demandas_costes[demanda.name] = (df_demandas[g_col_prioridad_tipo_demanda].iloc[i], \
+                                                     df_demandas[g_col_impacto_co2_demanda].iloc[i], \
+                                                     df_demandas[g_col_impacto_econ_demanda].iloc[i])
 
         # Actualizar deccionario de demandas
         dic_demandas[demanda.name]=demanda
@@ -2926,158 +2920,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     ---------------------------------------------------------------------
     '''
     
-        
-    # IMPORTANTE: para que el agua pueda fluir por las rutas que llegan hasta su destino, principalmente las demandas
-    # es necesario que la suma total de los costes de la ruta que llega hasta dicha demanda sea < 0.
-    #
-    # (a) Con el fin de asegurar que posibles valores positivos impidan que el agua llegue a su destino (demanda), determinamos
-    # el valor máximo del coste de entre todas las posibles rutas que terminen en una demanda (g_max_coste_ruta_demandas).
-    # Así, al establecer el coste (beneficio) de las demandas, su valor base deberá ser (-g_max_coste_ruta_demandas-1).
-    #
-    # En nuesta red, hay otras 3 posibles salidas secundarias:
-    #
-    # (b) El nodo de tipo Nudo y nombre "Nudo Final". Se trata de un nudo al cual irán a parar todos los flujos
-    # que salgan o escapen del sistema (esto es, que no se incorporen al mismo), y al que normalmente se le asignará el número
-    # conceptual 0. Esto no significa que su identificador único de nodo sea 0; de hecho, en el ejemplo de la red hidrológica
-    # del modelo SIMGES del PHDS1521, su identificador único es 106. Este indicador se define en el archivo de configuración
-    # definido en la constante CONFIG_FILE, mediante el contenido de la columna CFSIFtdf_col_nombre_nodo_final.
-    # A este nodo, una vez que se haya establecido el coste de todos los nodos a los que haya asignar un coste, le asignaremos
-    # el valor máximo del coste de entre todas las posibles rutas que terminen en  este "Nodo Final" - 1.
-    # Es decir: (-g_max_coste_ruta_nodo_final-1).
-    #
-    # (c) El nodo artificial que hemos generado por el momento para llevar todos los retornos: se trata del nodo "g_retorno_global".
-    # A este nodo, una vez que se haya establecido el coste de todos los nodos a los que haya asignar un coste, le asignaremos
-    # el valor máximo del coste de entre todas las posibles rutas que terminen en  este nodo "g_retorno_global" - 1.
-    # Es decir: (-g_max_coste_ruta_nodo_retorno_global-1).
-    #
-    # (d) Los elementos / nodos de retorno de tipo Output. Se tratan los nodos en los que se registrarán los valores retornados que,
-    # idealmente, tendrían que coincidir con las series que vayamos a definir para los elementos / nodos de retorno de tipo Input.
-    # Con el fin de asegurar que posibles valores positivos impidan que el agua llegue a su destino (retorno_output), determinamos
-    # el valor máximo del coste de entre todas las posibles rutas que terminen en un retorno (g_max_coste_ruta_retorno_output).
-    # Así, al establecer el coste (beneficio) de los retornos, su valor base deberá ser (-g_max_coste_ruta_retornos_output-1).
-    
-    
-    ## (a) Empezamos por calcular g_max_coste_ruta_demandas
-    
-    coste_ruta = 0                     # Inicialización
-    g_max_coste_ruta_demandas = np.inf # Inicialización
-    
-    # Lanzamos la búsqueda del valor g_max_coste_ruta_demandas
-    for nodo in dic_demandas:
-        mi_nodo = dic_demandas[nodo].parent
-        if (mi_nodo == None): mi_nodo = dic_demandas[nodo]
-        coste_ruta, g_max_coste_ruta_demandas = CalculateModelLargestCost(mi_nodo, coste_ruta, g_max_coste_ruta_demandas)
-            
-    # Ahora, para cada demanda, asignamos el valor (-g_max_coste_ruta_demandas-1) en su coste
-    if (g_max_coste_ruta_demandas >= 0): coste = (-g_max_coste_ruta_demandas-1)*10
-    
-    # TEMPORAL: dejamos los costes de las demandas como están
-    #for nodo in dic_demandas:
-    #    dic_demandas[nodo].cost = coste
-    
-    ## (b) Continuamos calculando g_max_coste_ruta_nodo_final
-    
-    coste_ruta = 0                        # Inicialización
-    g_max_coste_ruta_nodo_final = np.inf  # Inicialización
-    
-    '''
-    ### Determinamos el nodo "Nudo Final"
-    g_ID_nodo_final = df_tpatdff[g_col_elemento_id][df_tpatdff[g_col_elemento_nombre]==g_nombre_nodo_final].values[0]
-    g_nodo_final = dic_nudos[str(g_ID_nodo_final)]
-    
-    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_final
-    coste_ruta, g_max_coste_ruta_nodo_final = CalculateModelLargestCost(g_nodo_final, coste_ruta, g_max_coste_ruta_nodo_final)
-    '''
-    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_final
-    coste_ruta, g_max_coste_ruta_nodo_final = CalculateModelLargestCost(g_nudo_final, coste_ruta, g_max_coste_ruta_nodo_final)    
-    
-    # Ahora, para g_nudo_final, asignamos el valor (-g_max_coste_ruta_nodo_final-1) en su coste
-    # if (g_max_coste_ruta_nodo_final >= 0): coste = -g_max_coste_ruta_nodo_final-1
-    if (g_max_coste_ruta_nodo_final <= 0): coste = -g_max_coste_ruta_nodo_final
-    coste += COSTE_EXTRA_ALTO_1000000
-    g_nudo_final.cost = coste
-    
-    ## (c) Calculamos g_max_coste_ruta_nodo_retorno_global
-    
-    coste_ruta = 0                                 # Inicialización
-    g_max_coste_ruta_nodo_retorno_global = np.inf  # Inicialización
-    
-    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_retorno_global
-    coste_ruta, g_max_coste_ruta_nodo_retorno_global = CalculateModelLargestCost(g_retorno_global, coste_ruta, g_max_coste_ruta_nodo_retorno_global)    
-    
-    # Ahora, para g_retorno_global, asignamos el valor (-g_max_coste_ruta_nodo_final-1) en su coste
-    # if (g_max_coste_ruta_nodo_retorno_global >= 0): coste = -g_max_coste_ruta_nodo_retorno_global-1
-    if (g_max_coste_ruta_nodo_retorno_global <= 0): coste = -g_max_coste_ruta_nodo_retorno_global
-    coste += COSTE_EXTRA_ALTO_1000000
-    g_retorno_global.cost = coste
-        
-    ## (d) Calculamos g_max_coste_ruta_retornos_output
-    
-    coste_ruta = 0                            # Inicialización
-    g_max_coste_ruta_retornos_output = np.inf # Inicialización
-    
-    # Lanzamos la búsqueda del valor g_max_coste_ruta_retornos_output
-    for nodo in dic_retornos_output:
-        mi_nodo = dic_retornos_output[nodo].parent
-        if (mi_nodo == None): mi_nodo = dic_retornos_output[nodo]
-        coste_ruta, g_max_coste_ruta_retornos_output = CalculateModelLargestCost(mi_nodo, coste_ruta, g_max_coste_ruta_retornos_output)
-    
-    # Ahora, para cada rertorno_output, asignamos el valor (-g_max_coste_ruta_demandas-1) en su coste
-    if (g_max_coste_ruta_retornos_output >= 0): coste = -g_max_coste_ruta_retornos_output-1
-    for nodo in dic_retornos_output:
-        dic_retornos_output[nodo].cost = coste
-        
-        # Igual el valor en su equivaente  retorno_input
-        nodo_retorno_input = IgualarValoresInicializacionRetornos_con_datos_SIMGES(dic_retornos_output[nodo], dic_retornos_input)
-    
-    # Nueva gestión de costes; para aquellos casos en los que el valor de "max_flow" de una entrada o una salida es 0
-    # par toda la serie de valores, el coste se pone a un valor muy alto (COSTE_EXTRA_ALTO_1000000)
-    # Elementos a los que añadir los costes: 
-    #+ APORTACIONES, DEMANDAS, CONDUCCIONES1, CONDUCCIONES3, RETORNOS_INPUT, RETORNOS_OUTPUT, ACUIFEROS
-    
-    # APORTACIONES
-    if (df_COSTES_extra_altos_APORTACIONES.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                              # son 0, no ejecutamos el for.
-        for aportacion in dic_aportaciones:
-            dic_aportaciones[aportacion].cost += df_COSTES_extra_altos_APORTACIONES[dic_aportaciones[aportacion].comment][0]
-    
-    # DEMANDAS
-    if (df_COSTES_extra_altos_DEMANDAS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                          # son 0, no ejecutamos el for.
-        for demanda in dic_demandas:
-            dic_demandas[demanda].cost += df_COSTES_extra_altos_DEMANDAS[dic_demandas[demanda].comment][0]
-    
-    # CONDUCCIONES1
-    if (df_COSTES_extra_altos_CONDUCCIONES1.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                               # son 0, no ejecutamos el for.
-        for conduccion1 in dic_conducciones1:
-            dic_conducciones1[conduccion1].cost += df_COSTES_extra_altos_CONDUCCIONES1[dic_conducciones1[conduccion1].comment][0]
-        
-    # CONDUCCIONES3
-    if (df_COSTES_extra_altos_CONDUCCIONES3.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                               # son 0, no ejecutamos el for.
-        for conduccion3 in dic_conducciones3:
-            dic_conducciones3[conduccion3].cost += df_COSTES_extra_altos_CONDUCCIONES3[dic_conducciones3[conduccion3].comment][0]
-    
-    # RETORNOS_INPUT y RETORNOS_OUTPUT
-    if (df_COSTES_extra_altos_RETORNOS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                          # son 0, no ejecutamos el for.
-        for retorno_input in dic_retornos_input:
-            dic_retornos_input[retorno_input].cost += df_COSTES_extra_altos_RETORNOS[dic_retornos_input[retorno_input].comment][0]
-            dic_retornos_output[retorno_input.replace('_input', '_output')].cost += df_COSTES_extra_altos_RETORNOS[dic_retornos_input[retorno_input].comment][0]
-    else:
-        for retorno_input in dic_retornos_input:
-            dic_retornos_input[retorno_input].cost += BENEFICIO_EXTRA_ALTO_1000000
-    #         dic_retornos_output[retorno_input.replace('_input', '_output')].cost += BENEFICIO_EXTRA_ALTO_1000000
-    
-    # ACUIFEROS
-    if (df_COSTES_extra_altos_ACUIFEROS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
-                                                          # son 0, no ejecutamos el for.
-        for acuifero in dic_acuiferos:
-            dic_acuiferos[acuifero].cost += df_COSTES_extra_altos_ACUIFEROS[dic_acuiferos[acuifero].comment][0]    
-    
-    
-    # In order to capture the output from the model we need to use recorders.
+            # In order to capture the output from the model we need to use recorders.
     
     # Recorders for (0) Nudo <---> Link
     # NOTA: el nodo cuyo nombre es "Nudo Final", debe ser creado como Output.
@@ -3087,6 +2930,9 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     recorder_g_nudo_final_flow = NumpyArrayNodeRecorder(model, g_nudo_final)  # Flow recorder 
     # This class stores FLOW for each time-step of a simulation
     
+    # Recorder del progreso de la simulación (pasos de tiempo simulados)
+    RecorderProgreso(model)
+    
     # Recorders for (1) Embalse <---> Storage
     recorder_embalses_volume = {} # Volume recorder
     recorder_embalses_min_volume = {} # Min volume recorder
@@ -3252,11 +3098,496 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         simul_end_month_of_year = model.timestepper.end.timetuple().tm_mon
     
     
+    # Guardamos los costes de los nodos a los que AplicarEscenario() asigna costes, para partir siempre de ellos
+    lst_costes_base = []
+    for dic_nodos in [dic_aportaciones, dic_demandas, dic_conducciones1, dic_conducciones3, dic_retornos_input, \
+                      dic_retornos_output, dic_acuiferos]:
+        for nodo in dic_nodos:
+            lst_costes_base.append((dic_nodos[nodo], dic_nodos[nodo].cost))
+    lst_costes_base.append((g_nudo_final, g_nudo_final.cost))
+    lst_costes_base.append((g_retorno_global, g_retorno_global.cost))
+    
+    # Guardamos el volumen inicial de los embalses y su volumen máximo, para partir siempre de ellos cuando
+    # AplicarVolumenesIniciales() inicia una simulación con los volúmenes de otra anterior
+    lst_volumenes_base = []
+    for embalse in dic_embalses:
+        df_embalse = df_pdf_embalses[df_pdf_embalses[CFSDE_col_nombre] == '"' + dic_embalses[embalse].comment + '"']
+        if (df_embalse.shape[0] == 0): continue
+        vol_max = max([float(j) for j in df_embalse[CFSDE_col_v_max_mensual_12_vals].values[0].split()])
+        lst_volumenes_base.append((embalse, dic_embalses[embalse], dic_embalses[embalse].initial_volume, \
+                                   dic_embalses[embalse].initial_volume_pc, vol_max))
+    
+    # Plantilla de la red
+    plantilla = {
+        'df_PARAMS_ACUIFEROS_recarga_diario': df_PARAMS_ACUIFEROS_recarga_diario,
+        'df_PARAMS_ACUIFEROS_recarga_mensual': df_PARAMS_ACUIFEROS_recarga_mensual,
+        'df_PARAMS_CONDUCCIONES1_q_max_diario': df_PARAMS_CONDUCCIONES1_q_max_diario,
+        'df_PARAMS_CONDUCCIONES1_q_max_mensual': df_PARAMS_CONDUCCIONES1_q_max_mensual,
+        'df_PARAMS_CONDUCCIONES1_q_min_diario': df_PARAMS_CONDUCCIONES1_q_min_diario,
+        'df_PARAMS_CONDUCCIONES1_q_min_mensual': df_PARAMS_CONDUCCIONES1_q_min_mensual,
+        'df_PARAMS_CONDUCCIONES3_q_max_diario': df_PARAMS_CONDUCCIONES3_q_max_diario,
+        'df_PARAMS_CONDUCCIONES3_q_max_mensual': df_PARAMS_CONDUCCIONES3_q_max_mensual,
+        'df_PARAMS_CONDUCCIONES3_q_min_diario': df_PARAMS_CONDUCCIONES3_q_min_diario,
+        'df_PARAMS_CONDUCCIONES3_q_min_mensual': df_PARAMS_CONDUCCIONES3_q_min_mensual,
+        'df_PARAMS_DEMANDAS_diario': df_PARAMS_DEMANDAS_diario,
+        'df_PARAMS_DEMANDAS_mensual': df_PARAMS_DEMANDAS_mensual,
+        'df_PARAMS_EMBALSES_vol_max_diario': df_PARAMS_EMBALSES_vol_max_diario,
+        'df_PARAMS_EMBALSES_vol_max_mensual': df_PARAMS_EMBALSES_vol_max_mensual,
+        'df_PARAMS_EMBALSES_vol_min_diario': df_PARAMS_EMBALSES_vol_min_diario,
+        'df_PARAMS_EMBALSES_vol_min_mensual': df_PARAMS_EMBALSES_vol_min_mensual,
+        'df_PARAMS_RETORNOS_demanda_diario': df_PARAMS_RETORNOS_demanda_diario,
+        'df_PARAMS_RETORNOS_demanda_mensual': df_PARAMS_RETORNOS_demanda_mensual,
+        'df_aportaciones': df_aportaciones,
+        'df_demandas': df_demandas,
+        'df_pdf_aportaciones': df_pdf_aportaciones,
+        'df_pdf_demandas': df_pdf_demandas,
+        'df_tomas': df_tomas,
+        'dic_acuiferos': dic_acuiferos,
+        'dic_aportaciones': dic_aportaciones,
+        'dic_bombeos': dic_bombeos,
+        'dic_conducciones1': dic_conducciones1,
+        'dic_conducciones3': dic_conducciones3,
+        'dic_demandas': dic_demandas,
+        'dic_embalses': dic_embalses,
+        'dic_retornos_input': dic_retornos_input,
+        'dic_retornos_output': dic_retornos_output,
+        'dic_tomas': dic_tomas,
+        'g_col_coste_tipo_agua_toma_euro_por_m3': g_col_coste_tipo_agua_toma_euro_por_m3,
+        'g_col_demanda_mi_id': g_col_demanda_mi_id,
+        'g_col_demanda_tipo': g_col_demanda_tipo,
+        'g_col_demanda_tipo_nombre': g_col_demanda_tipo_nombre,
+        'g_col_elemento_id': g_col_elemento_id,
+        'g_col_prioridad_tipo_agua_toma': g_col_prioridad_tipo_agua_toma,
+        'g_col_prioridad_tipo_demanda': g_col_prioridad_tipo_demanda,
+        'g_col_tipo_agua_toma': g_col_tipo_agua_toma,
+        'g_col_tipo_aportacion': g_col_tipo_aportacion,
+        'g_nudo_final': g_nudo_final,
+        'g_retorno_global': g_retorno_global,
+        'model': model,
+        'p_date_end': p_date_end,
+        'p_date_init': p_date_init,
+        'recorder_acuiferos_flow': recorder_acuiferos_flow,
+        'recorder_aportaciones_flow': recorder_aportaciones_flow,
+        'recorder_bombeos_flow': recorder_bombeos_flow,
+        'recorder_conducciones1_flow': recorder_conducciones1_flow,
+        'recorder_conducciones3_flow': recorder_conducciones3_flow,
+        'recorder_demandas_flow': recorder_demandas_flow,
+        'recorder_demandas_flow_deficit_frequency': recorder_demandas_flow_deficit_frequency,
+        'recorder_embalses_flow': recorder_embalses_flow,
+        'recorder_embalses_min_volume': recorder_embalses_min_volume,
+        'recorder_embalses_volume': recorder_embalses_volume,
+        'recorder_g_nudo_final_flow': recorder_g_nudo_final_flow,
+        'recorder_retorno_global_flow': recorder_retorno_global_flow,
+        'recorder_retornos_input_flow': recorder_retornos_input_flow,
+        'recorder_retornos_output_flow': recorder_retornos_output_flow,
+        'recorder_retornos_output_flow_deficit_frequency': recorder_retornos_output_flow_deficit_frequency,
+        'recorder_tomas_flow': recorder_tomas_flow,
+        'xl_cf': xl_cf,
+        'df_COSTES_extra_altos_APORTACIONES': df_COSTES_extra_altos_APORTACIONES,
+        'df_COSTES_extra_altos_DEMANDAS': df_COSTES_extra_altos_DEMANDAS,
+        'df_COSTES_extra_altos_CONDUCCIONES1': df_COSTES_extra_altos_CONDUCCIONES1,
+        'df_COSTES_extra_altos_CONDUCCIONES3': df_COSTES_extra_altos_CONDUCCIONES3,
+        'df_COSTES_extra_altos_RETORNOS': df_COSTES_extra_altos_RETORNOS,
+        'df_COSTES_extra_altos_ACUIFEROS': df_COSTES_extra_altos_ACUIFEROS,
+        'dic_FACTORES_ESCENARIO': dic_FACTORES_ESCENARIO,
+        'dic_demandas_costes': dic_demandas_costes,
+        'lst_costes_base': lst_costes_base,
+        'lst_volumenes_base': lst_volumenes_base
+    }
+    
+    return (plantilla)
+
+
+#******************************************************************************************************
+# FUNCTION: AplicarEscenario(p_plantilla, p_simulation_type, \
+#                            p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+#                            p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+#                            p_percent_agua_desalada=1.0, \
+#                            p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0)
+#
+# DESCRIPTION: Aplicar un escenario a una red construida con ConstruirPlantillaRed(): valores de los factores
+#              multiplicadores de los tipos de agua y costes de los nodos. Solo se modifican valores de parámetros
+#              y costes; la topología de la red y el problema del solver no cambian.
+# ARGUMENTS:
+#   p_plantilla: red construida con ConstruirPlantillaRed()
+#   Resto de argumentos: ver Planificar_Optimizar_Suministros_a_Demandas()
+# RETURNS: diccionario con los parámetros de retornos y acuíferos del escenario, necesarios para guardar los resultados.
+#******************************************************************************************************
+def AplicarEscenario(p_plantilla, p_simulation_type, \
+                     p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+                     p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+                     p_percent_agua_desalada=1.0, \
+                     p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0):
+    
+    # Elementos de la red
+    dic_aportaciones = p_plantilla['dic_aportaciones']
+    dic_demandas = p_plantilla['dic_demandas']
+    dic_conducciones1 = p_plantilla['dic_conducciones1']
+    dic_conducciones3 = p_plantilla['dic_conducciones3']
+    dic_retornos_input = p_plantilla['dic_retornos_input']
+    dic_retornos_output = p_plantilla['dic_retornos_output']
+    dic_acuiferos = p_plantilla['dic_acuiferos']
+    g_nudo_final = p_plantilla['g_nudo_final']
+    g_retorno_global = p_plantilla['g_retorno_global']
+    df_COSTES_extra_altos_APORTACIONES = p_plantilla['df_COSTES_extra_altos_APORTACIONES']
+    df_COSTES_extra_altos_DEMANDAS = p_plantilla['df_COSTES_extra_altos_DEMANDAS']
+    df_COSTES_extra_altos_CONDUCCIONES1 = p_plantilla['df_COSTES_extra_altos_CONDUCCIONES1']
+    df_COSTES_extra_altos_CONDUCCIONES3 = p_plantilla['df_COSTES_extra_altos_CONDUCCIONES3']
+    dic_demandas_costes = p_plantilla['dic_demandas_costes']
+    
+    
+    # 1. Factores multiplicadores de los tipos de agua
+    dic_valores_factores = {CFRDR_col_superficial: p_percent_agua_superficial, \
+                            CFRDR_col_subterranea: p_percent_agua_subterranea, \
+                            CFRDR_col_reutilizada: p_percent_agua_reutilizada, \
+                            CFRDR_col_trasvase: p_percent_agua_trasvase, \
+                            CFRDR_col_desalada: p_percent_agua_desalada, \
+                            FACTOR_ESCENARIO_subterranea_diario: p_percent_agua_subterranea * p_percent_agua_subterranea}
+    for tipo_agua in dic_valores_factores:
+        p_plantilla['dic_FACTORES_ESCENARIO'][tipo_agua].set_double_variables(np.array([dic_valores_factores[tipo_agua]], dtype=np.float64))
+    
+    # Parámetros de retornos y acuíferos con el factor multiplicador, para la parte de guardado de los resultados
+    df_PARAMS_RETORNOS_demanda_mensual = p_plantilla['df_PARAMS_RETORNOS_demanda_mensual'] * p_percent_agua_reutilizada
+    df_PARAMS_RETORNOS_demanda_diario = p_plantilla['df_PARAMS_RETORNOS_demanda_diario'] * p_percent_agua_reutilizada
+    df_PARAMS_ACUIFEROS_recarga_mensual = p_plantilla['df_PARAMS_ACUIFEROS_recarga_mensual'] * p_percent_agua_subterranea
+    df_PARAMS_ACUIFEROS_recarga_diario = p_plantilla['df_PARAMS_ACUIFEROS_recarga_diario'] * \
+                                         dic_valores_factores[FACTOR_ESCENARIO_subterranea_diario]
+    
+    # Costes muy altos de retornos y acuíferos: la serie completa también es 0 cuando su factor multiplicador es 0
+    df_COSTES_extra_altos_RETORNOS = p_plantilla['df_COSTES_extra_altos_RETORNOS'].copy()
+    if (p_percent_agua_reutilizada == 0): df_COSTES_extra_altos_RETORNOS[:] = COSTE_EXTRA_ALTO_1000000
+    df_COSTES_extra_altos_ACUIFEROS = p_plantilla['df_COSTES_extra_altos_ACUIFEROS'].copy()
+    if (p_percent_agua_subterranea == 0): df_COSTES_extra_altos_ACUIFEROS[:] = COSTE_EXTRA_ALTO_1000000
+    
+    
+    # 2. Costes de los nodos; partimos de los costes de la red construida
+    for nodo, coste in p_plantilla['lst_costes_base']:
+        nodo.cost = coste
+    
+    # Coste de las demandas en base a la prioridad del tipo de demanda y, en optimización, a los pesos del escenario
+    for demanda in dic_demandas_costes:
+        prioridad, impacto_co2, impacto_econ = dic_demandas_costes[demanda]
+        coste = float(prioridad)
+        if (p_simulation_type == SIMULATION_TYPE_OPTIMISATION):
+            coste *= p_peso_deficit
+            coste += (impacto_co2 * p_peso_co2)
+            coste += (impacto_econ * p_peso_economic)
+        
+        # Convertimos el coste a valor entero
+        dic_demandas[demanda].cost = int(coste)
+    
+    # El cálculo de costes parte del último coste muy alto calculado para los parámetros (el del último acuífero)
+    coste = int(df_COSTES_extra_altos_ACUIFEROS.iloc[0, -1])
+    
+    
+    # IMPORTANTE: para que el agua pueda fluir por las rutas que llegan hasta su destino, principalmente las demandas
+    # es necesario que la suma total de los costes de la ruta que llega hasta dicha demanda sea < 0.
+    #
+    # (a) Con el fin de asegurar que posibles valores positivos impidan que el agua llegue a su destino (demanda), determinamos
+    # el valor máximo del coste de entre todas las posibles rutas que terminen en una demanda (g_max_coste_ruta_demandas).
+    # Así, al establecer el coste (beneficio) de las demandas, su valor base deberá ser (-g_max_coste_ruta_demandas-1).
+    #
+    # En nuesta red, hay otras 3 posibles salidas secundarias:
+    #
+    # (b) El nodo de tipo Nudo y nombre "Nudo Final". Se trata de un nudo al cual irán a parar todos los flujos
+    # que salgan o escapen del sistema (esto es, que no se incorporen al mismo), y al que normalmente se le asignará el número
+    # conceptual 0. Esto no significa que su identificador único de nodo sea 0; de hecho, en el ejemplo de la red hidrológica
+    # del modelo SIMGES del PHDS1521, su identificador único es 106. Este indicador se define en el archivo de configuración
+    # definido en la constante CONFIG_FILE, mediante el contenido de la columna CFSIFtdf_col_nombre_nodo_final.
+    # A este nodo, una vez que se haya establecido el coste de todos los nodos a los que haya asignar un coste, le asignaremos
+    # el valor máximo del coste de entre todas las posibles rutas que terminen en  este "Nodo Final" - 1.
+    # Es decir: (-g_max_coste_ruta_nodo_final-1).
+    #
+    # (c) El nodo artificial que hemos generado por el momento para llevar todos los retornos: se trata del nodo "g_retorno_global".
+    # A este nodo, una vez que se haya establecido el coste de todos los nodos a los que haya asignar un coste, le asignaremos
+    # el valor máximo del coste de entre todas las posibles rutas que terminen en  este nodo "g_retorno_global" - 1.
+    # Es decir: (-g_max_coste_ruta_nodo_retorno_global-1).
+    #
+    # (d) Los elementos / nodos de retorno de tipo Output. Se tratan los nodos en los que se registrarán los valores retornados que,
+    # idealmente, tendrían que coincidir con las series que vayamos a definir para los elementos / nodos de retorno de tipo Input.
+    # Con el fin de asegurar que posibles valores positivos impidan que el agua llegue a su destino (retorno_output), determinamos
+    # el valor máximo del coste de entre todas las posibles rutas que terminen en un retorno (g_max_coste_ruta_retorno_output).
+    # Así, al establecer el coste (beneficio) de los retornos, su valor base deberá ser (-g_max_coste_ruta_retornos_output-1).
+    
+    
+    ## (a) Empezamos por calcular g_max_coste_ruta_demandas
+    
+    coste_ruta = 0                     # Inicialización
+    g_max_coste_ruta_demandas = np.inf # Inicialización
+    
+    # Lanzamos la búsqueda del valor g_max_coste_ruta_demandas
+    for nodo in dic_demandas:
+        mi_nodo = dic_demandas[nodo].parent
+        if (mi_nodo == None): mi_nodo = dic_demandas[nodo]
+        coste_ruta, g_max_coste_ruta_demandas = CalculateModelLargestCost(mi_nodo, coste_ruta, g_max_coste_ruta_demandas)
+            
+    # Ahora, para cada demanda, asignamos el valor (-g_max_coste_ruta_demandas-1) en su coste
+    if (g_max_coste_ruta_demandas >= 0): coste = (-g_max_coste_ruta_demandas-1)*10
+    
+    # TEMPORAL: dejamos los costes de las demandas como están
+    #for nodo in dic_demandas:
+    #    dic_demandas[nodo].cost = coste
+    
+    ## (b) Continuamos calculando g_max_coste_ruta_nodo_final
+    
+    coste_ruta = 0                        # Inicialización
+    g_max_coste_ruta_nodo_final = np.inf  # Inicialización
+    
+    '''
+    ### Determinamos el nodo "Nudo Final"
+    g_ID_nodo_final = df_tpatdff[g_col_elemento_id][df_tpatdff[g_col_elemento_nombre]==g_nombre_nodo_final].values[0]
+    g_nodo_final = dic_nudos[str(g_ID_nodo_final)]
+    
+    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_final
+    coste_ruta, g_max_coste_ruta_nodo_final = CalculateModelLargestCost(g_nodo_final, coste_ruta, g_max_coste_ruta_nodo_final)
+    '''
+    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_final
+    coste_ruta, g_max_coste_ruta_nodo_final = CalculateModelLargestCost(g_nudo_final, coste_ruta, g_max_coste_ruta_nodo_final)    
+    
+    # Ahora, para g_nudo_final, asignamos el valor (-g_max_coste_ruta_nodo_final-1) en su coste
+    # if (g_max_coste_ruta_nodo_final >= 0): coste = -g_max_coste_ruta_nodo_final-1
+    if (g_max_coste_ruta_nodo_final <= 0): coste = -g_max_coste_ruta_nodo_final
+    coste += COSTE_EXTRA_ALTO_1000000
+    g_nudo_final.cost = coste
+    
+    ## (c) Calculamos g_max_coste_ruta_nodo_retorno_global
+    
+    coste_ruta = 0                                 # Inicialización
+    g_max_coste_ruta_nodo_retorno_global = np.inf  # Inicialización
+    
+    # Lanzamos la búsqueda del valor g_max_coste_ruta_nodo_retorno_global
+    coste_ruta, g_max_coste_ruta_nodo_retorno_global = CalculateModelLargestCost(g_retorno_global, coste_ruta, g_max_coste_ruta_nodo_retorno_global)    
+    
+    # Ahora, para g_retorno_global, asignamos el valor (-g_max_coste_ruta_nodo_final-1) en su coste
+    # if (g_max_coste_ruta_nodo_retorno_global >= 0): coste = -g_max_coste_ruta_nodo_retorno_global-1
+    if (g_max_coste_ruta_nodo_retorno_global <= 0): coste = -g_max_coste_ruta_nodo_retorno_global
+    coste += COSTE_EXTRA_ALTO_1000000
+    g_retorno_global.cost = coste
+        
+    ## (d) Calculamos g_max_coste_ruta_retornos_output
+    
+    coste_ruta = 0                            # Inicialización
+    g_max_coste_ruta_retornos_output = np.inf # Inicialización
+    
+    # Lanzamos la búsqueda del valor g_max_coste_ruta_retornos_output
+    for nodo in dic_retornos_output:
+        mi_nodo = dic_retornos_output[nodo].parent
+        if (mi_nodo == None): mi_nodo = dic_retornos_output[nodo]
+        coste_ruta, g_max_coste_ruta_retornos_output = CalculateModelLargestCost(mi_nodo, coste_ruta, g_max_coste_ruta_retornos_output)
+    
+    # Ahora, para cada rertorno_output, asignamos el valor (-g_max_coste_ruta_demandas-1) en su coste
+    if (g_max_coste_ruta_retornos_output >= 0): coste = -g_max_coste_ruta_retornos_output-1
+    for nodo in dic_retornos_output:
+        dic_retornos_output[nodo].cost = coste
+        
+        # Igual el valor en su equivaente  retorno_input
+        nodo_retorno_input = IgualarValoresInicializacionRetornos_con_datos_SIMGES(dic_retornos_output[nodo], dic_retornos_input)
+    
+    # Nueva gestión de costes; para aquellos casos en los que el valor de "max_flow" de una entrada o una salida es 0
+    # par toda la serie de valores, el coste se pone a un valor muy alto (COSTE_EXTRA_ALTO_1000000)
+    # Elementos a los que añadir los costes: 
+    #+ APORTACIONES, DEMANDAS, CONDUCCIONES1, CONDUCCIONES3, RETORNOS_INPUT, RETORNOS_OUTPUT, ACUIFEROS
+    
+    # APORTACIONES
+    if (df_COSTES_extra_altos_APORTACIONES.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                              # son 0, no ejecutamos el for.
+        for aportacion in dic_aportaciones:
+            dic_aportaciones[aportacion].cost += df_COSTES_extra_altos_APORTACIONES[dic_aportaciones[aportacion].comment][0]
+    
+    # DEMANDAS
+    if (df_COSTES_extra_altos_DEMANDAS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                          # son 0, no ejecutamos el for.
+        for demanda in dic_demandas:
+            dic_demandas[demanda].cost += df_COSTES_extra_altos_DEMANDAS[dic_demandas[demanda].comment][0]
+    
+    # CONDUCCIONES1
+    if (df_COSTES_extra_altos_CONDUCCIONES1.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                               # son 0, no ejecutamos el for.
+        for conduccion1 in dic_conducciones1:
+            dic_conducciones1[conduccion1].cost += df_COSTES_extra_altos_CONDUCCIONES1[dic_conducciones1[conduccion1].comment][0]
+        
+    # CONDUCCIONES3
+    if (df_COSTES_extra_altos_CONDUCCIONES3.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                               # son 0, no ejecutamos el for.
+        for conduccion3 in dic_conducciones3:
+            dic_conducciones3[conduccion3].cost += df_COSTES_extra_altos_CONDUCCIONES3[dic_conducciones3[conduccion3].comment][0]
+    
+    # RETORNOS_INPUT y RETORNOS_OUTPUT
+    if (df_COSTES_extra_altos_RETORNOS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                          # son 0, no ejecutamos el for.
+        for retorno_input in dic_retornos_input:
+            dic_retornos_input[retorno_input].cost += df_COSTES_extra_altos_RETORNOS[dic_retornos_input[retorno_input].comment][0]
+            dic_retornos_output[retorno_input.replace('_input', '_output')].cost += df_COSTES_extra_altos_RETORNOS[dic_retornos_input[retorno_input].comment][0]
+    else:
+        for retorno_input in dic_retornos_input:
+            dic_retornos_input[retorno_input].cost += BENEFICIO_EXTRA_ALTO_1000000
+    #         dic_retornos_output[retorno_input.replace('_input', '_output')].cost += BENEFICIO_EXTRA_ALTO_1000000
+    
+    # ACUIFEROS
+    if (df_COSTES_extra_altos_ACUIFEROS.values.sum() > 0): # Sumamos si procede; es decir, si todos los valores a sumar
+                                                          # son 0, no ejecutamos el for.
+        for acuifero in dic_acuiferos:
+            dic_acuiferos[acuifero].cost += df_COSTES_extra_altos_ACUIFEROS[dic_acuiferos[acuifero].comment][0]
+    
+    
+    return ({'df_PARAMS_RETORNOS_demanda_mensual': df_PARAMS_RETORNOS_demanda_mensual, \
+             'df_PARAMS_RETORNOS_demanda_diario': df_PARAMS_RETORNOS_demanda_diario, \
+             'df_PARAMS_ACUIFEROS_recarga_mensual': df_PARAMS_ACUIFEROS_recarga_mensual, \
+             'df_PARAMS_ACUIFEROS_recarga_diario': df_PARAMS_ACUIFEROS_recarga_diario})
+
+
+# Función para iniciar los embalses de una red con los volúmenes de una simulación anterior (planificación continua):
+# p_volumenes_iniciales es un diccionario embalse -> volumen; el resto de embalses parten de su volumen inicial.
+def AplicarVolumenesIniciales(p_plantilla, p_volumenes_iniciales=None):
+    if (p_volumenes_iniciales is None): p_volumenes_iniciales = {}
+    for embalse, nodo, vol_inicial, vol_inicial_pc, vol_max in p_plantilla['lst_volumenes_base']:
+        if (embalse in p_volumenes_iniciales):
+            nodo.initial_volume = p_volumenes_iniciales[embalse]
+            nodo.initial_volume_pc = min(1.0, p_volumenes_iniciales[embalse] / vol_max)
+        else:
+            nodo.initial_volume = vol_inicial
+            nodo.initial_volume_pc = vol_inicial_pc
+
+
+# Función para obtener la red de un paso y periodo de simulación; solo se construye si no está entre las
+# plantillas de este proceso o si ha cambiado alguno de los archivos de entrada del modelo.
+def ObtenerPlantillaRed(p_simulation_step, p_date_init='', p_date_end='', p_solver='glpk'):
+    # Sin fechas, el periodo de simulación depende del día de hoy
+    clave = (p_simulation_step, p_date_init, p_date_end, p_solver, \
+             date.today() if ('' in (p_date_init, p_date_end)) else None, \
+             model_inputs.sources_hash(ArchivosDeEntrada()))
+    with _plantillas_red_lock:
+        plantilla = _plantillas_red.pop(clave, None)
+        if (plantilla is None):
+            plantilla = ConstruirPlantillaRed(p_simulation_step, p_date_init, p_date_end, p_solver)
+        _plantillas_red[clave] = plantilla
+        while (len(_plantillas_red) > N_PLANTILLAS_RED_MAX):
+            _plantillas_red.popitem(last=False)
+    return (plantilla)
+
+
+# Función auxiliar para guardar la hoja de resultados de un tipo de nodo. Con límite de memoria, el df se vuelca a
+# un archivo del directorio de resultados del proceso y se guarda el nombre del archivo en lugar del df.
+def GuardarHojaResultados(p_dic_hojas_resultados, p_nombre_hoja, p_df_resultados):
+    if (LIMITE_MEMORIA_SIMULACION > 0):
+        archivo = RESULTS_SPILL_FOLDER + str(os.getpid()) + '/' + str(len(p_dic_hojas_resultados)) + '.pkl'
+        os.makedirs(os.path.dirname(archivo), exist_ok=True)
+        p_df_resultados.to_pickle(archivo)
+        p_dic_hojas_resultados[p_nombre_hoja] = archivo
+    else:
+        p_dic_hojas_resultados[p_nombre_hoja] = p_df_resultados
+
+
+# Función auxiliar para escribir las hojas de resultados en el archivo Excel de resultados, en el orden de
+# p_lst_hojas. Las hojas volcadas a disco se leen de una en una y se borran.
+def EscribirHojasResultados(p_archivo, p_dic_hojas_resultados, p_lst_hojas):
+    with pd.ExcelWriter(p_archivo) as writer:
+        for hoja in p_lst_hojas:
+            df_resultados = p_dic_hojas_resultados.pop(hoja)
+            if isinstance(df_resultados, str):
+                archivo = df_resultados
+                df_resultados = pd.read_pickle(archivo)
+                os.unlink(archivo)
+            df_resultados.to_excel(writer, sheet_name=hoja)
+            del df_resultados
+
+
+#******************************************************************************************************
+# FUNCTION: SimularEscenario(p_plantilla, p_escenario, p_simulation_step, \
+#                            p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+#                            p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+#                            p_percent_agua_desalada=1.0)
+#
+# DESCRIPTION: Ejecutar la simulación de una red a la que se ha aplicado un escenario con AplicarEscenario()
+#              y calcular y guardar los resultados.
+# RETURNS: dataframe con los resultados para L4 y L5.
+#******************************************************************************************************
+def SimularEscenario(p_plantilla, p_escenario, p_simulation_step, \
+                     p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+                     p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+                     p_percent_agua_desalada=1.0):
+    
+    # Elementos de la red
+    df_PARAMS_CONDUCCIONES1_q_max_diario = p_plantilla['df_PARAMS_CONDUCCIONES1_q_max_diario']
+    df_PARAMS_CONDUCCIONES1_q_max_mensual = p_plantilla['df_PARAMS_CONDUCCIONES1_q_max_mensual']
+    df_PARAMS_CONDUCCIONES1_q_min_diario = p_plantilla['df_PARAMS_CONDUCCIONES1_q_min_diario']
+    df_PARAMS_CONDUCCIONES1_q_min_mensual = p_plantilla['df_PARAMS_CONDUCCIONES1_q_min_mensual']
+    df_PARAMS_CONDUCCIONES3_q_max_diario = p_plantilla['df_PARAMS_CONDUCCIONES3_q_max_diario']
+    df_PARAMS_CONDUCCIONES3_q_max_mensual = p_plantilla['df_PARAMS_CONDUCCIONES3_q_max_mensual']
+    df_PARAMS_CONDUCCIONES3_q_min_diario = p_plantilla['df_PARAMS_CONDUCCIONES3_q_min_diario']
+    df_PARAMS_CONDUCCIONES3_q_min_mensual = p_plantilla['df_PARAMS_CONDUCCIONES3_q_min_mensual']
+    df_PARAMS_DEMANDAS_diario = p_plantilla['df_PARAMS_DEMANDAS_diario']
+    df_PARAMS_DEMANDAS_mensual = p_plantilla['df_PARAMS_DEMANDAS_mensual']
+    df_PARAMS_EMBALSES_vol_max_diario = p_plantilla['df_PARAMS_EMBALSES_vol_max_diario']
+    df_PARAMS_EMBALSES_vol_max_mensual = p_plantilla['df_PARAMS_EMBALSES_vol_max_mensual']
+    df_PARAMS_EMBALSES_vol_min_diario = p_plantilla['df_PARAMS_EMBALSES_vol_min_diario']
+    df_PARAMS_EMBALSES_vol_min_mensual = p_plantilla['df_PARAMS_EMBALSES_vol_min_mensual']
+    df_aportaciones = p_plantilla['df_aportaciones']
+    df_demandas = p_plantilla['df_demandas']
+    df_pdf_aportaciones = p_plantilla['df_pdf_aportaciones']
+    df_pdf_demandas = p_plantilla['df_pdf_demandas']
+    df_tomas = p_plantilla['df_tomas']
+    dic_acuiferos = p_plantilla['dic_acuiferos']
+    dic_aportaciones = p_plantilla['dic_aportaciones']
+    dic_bombeos = p_plantilla['dic_bombeos']
+    dic_conducciones1 = p_plantilla['dic_conducciones1']
+    dic_conducciones3 = p_plantilla['dic_conducciones3']
+    dic_demandas = p_plantilla['dic_demandas']
+    dic_embalses = p_plantilla['dic_embalses']
+    dic_retornos_input = p_plantilla['dic_retornos_input']
+    dic_retornos_output = p_plantilla['dic_retornos_output']
+    dic_tomas = p_plantilla['dic_tomas']
+    g_col_coste_tipo_agua_toma_euro_por_m3 = p_plantilla['g_col_coste_tipo_agua_toma_euro_por_m3']
+    g_col_demanda_mi_id = p_plantilla['g_col_demanda_mi_id']
+    g_col_demanda_tipo = p_plantilla['g_col_demanda_tipo']
+    g_col_demanda_tipo_nombre = p_plantilla['g_col_demanda_tipo_nombre']
+    g_col_elemento_id = p_plantilla['g_col_elemento_id']
+    g_col_prioridad_tipo_agua_toma = p_plantilla['g_col_prioridad_tipo_agua_toma']
+    g_col_prioridad_tipo_demanda = p_plantilla['g_col_prioridad_tipo_demanda']
+    g_col_tipo_agua_toma = p_plantilla['g_col_tipo_agua_toma']
+    g_col_tipo_aportacion = p_plantilla['g_col_tipo_aportacion']
+    g_nudo_final = p_plantilla['g_nudo_final']
+    g_retorno_global = p_plantilla['g_retorno_global']
+    model = p_plantilla['model']
+    p_date_end = p_plantilla['p_date_end']
+    p_date_init = p_plantilla['p_date_init']
+    recorder_acuiferos_flow = p_plantilla['recorder_acuiferos_flow']
+    recorder_aportaciones_flow = p_plantilla['recorder_aportaciones_flow']
+    recorder_bombeos_flow = p_plantilla['recorder_bombeos_flow']
+    recorder_conducciones1_flow = p_plantilla['recorder_conducciones1_flow']
+    recorder_conducciones3_flow = p_plantilla['recorder_conducciones3_flow']
+    recorder_demandas_flow = p_plantilla['recorder_demandas_flow']
+    recorder_demandas_flow_deficit_frequency = p_plantilla['recorder_demandas_flow_deficit_frequency']
+    recorder_embalses_flow = p_plantilla['recorder_embalses_flow']
+    recorder_embalses_min_volume = p_plantilla['recorder_embalses_min_volume']
+    recorder_embalses_volume = p_plantilla['recorder_embalses_volume']
+    recorder_g_nudo_final_flow = p_plantilla['recorder_g_nudo_final_flow']
+    recorder_retorno_global_flow = p_plantilla['recorder_retorno_global_flow']
+    recorder_retornos_input_flow = p_plantilla['recorder_retornos_input_flow']
+    recorder_retornos_output_flow = p_plantilla['recorder_retornos_output_flow']
+    recorder_retornos_output_flow_deficit_frequency = p_plantilla['recorder_retornos_output_flow_deficit_frequency']
+    recorder_tomas_flow = p_plantilla['recorder_tomas_flow']
+    xl_cf = p_plantilla['xl_cf']
+    
+    # Parámetros del escenario
+    df_PARAMS_RETORNOS_demanda_mensual = p_escenario['df_PARAMS_RETORNOS_demanda_mensual']
+    df_PARAMS_RETORNOS_demanda_diario = p_escenario['df_PARAMS_RETORNOS_demanda_diario']
+    df_PARAMS_ACUIFEROS_recarga_mensual = p_escenario['df_PARAMS_ACUIFEROS_recarga_mensual']
+    df_PARAMS_ACUIFEROS_recarga_diario = p_escenario['df_PARAMS_ACUIFEROS_recarga_diario']
+    
+    
     # Finally we are ready to run our model:
     # Lets get this party started!
     
-    # Run the model
-    model.run()
+    # Run the model; el resultado de pywr (pasos de tiempo, tiempo empleado y estadísticas del solver) se guarda
+    # en la plantilla
+    progress.phase('run')
+    p_plantilla['resultado_modelo'] = model.run()
+    progress.phase('results')
+    
+    # Hojas de resultados de cada tipo de nodo (nombre de hoja -> df o archivo donde se ha volcado)
+    dic_hojas_resultados = {}
+    shutil.rmtree(RESULTS_SPILL_FOLDER + str(os.getpid()), ignore_errors=True)
     
     # IMPORTANTE: al terminar la simulación, los valores de:
     #
@@ -3342,12 +3673,14 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_nudo_final = df_results_nudo_final[columnas]
     df_results_nudo_final.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_nudo_final].iloc[0], df_results_nudo_final)
+    del df_results_nudo_final
     
     '''
     Calcular + guardar datos de RECORDERS de (1) Embalse <---> Storage
     '''
     
-    primer_nodo = list(dic_embalses.keys())[0]
+    lst_results_embalses = [] # Resultados de cada nodo, se unen al final del bucle
     for embalse in dic_embalses:
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
         df_results_embalse = recorder_embalses_volume[embalse].to_dataframe()
@@ -3366,38 +3699,38 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de vol_min
             df_all_values_element = df_PARAMS_EMBALSES_vol_min_mensual[[dic_embalses[embalse].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)
             df_results_embalse[df_config_out_file[CFSOF_col_init_min_vol].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de vol_max
             df_all_values_element = df_PARAMS_EMBALSES_vol_max_mensual[[dic_embalses[embalse].comment]]
     
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)
             df_results_embalse[df_config_out_file[CFSOF_col_init_max_vol].iloc[0]] = df_list_values_simulation.values
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de vol_min
             df_all_values_element = df_PARAMS_EMBALSES_vol_min_diario[[dic_embalses[embalse].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             df_results_embalse[df_config_out_file[CFSOF_col_init_min_vol].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de vol_max
             df_all_values_element = df_PARAMS_EMBALSES_vol_max_diario[[dic_embalses[embalse].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             df_results_embalse[df_config_out_file[CFSOF_col_init_max_vol].iloc[0]] = df_list_values_simulation.values
             
         # Continuamos con otros valores que no vienen de parámetros (no son series)
@@ -3405,8 +3738,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_embalse[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_embalses[embalse].cost # (Initial) cost
         
         # Actualizar el df con la info de todos los embalses
-        if (embalse == primer_nodo): df_results_embalses = df_results_embalse.copy()
-        else: df_results_embalses = pd.concat([df_results_embalses, df_results_embalse.copy()], ignore_index=True)
+        lst_results_embalses.append(df_results_embalse)
+    
+    df_results_embalses = pd.concat(lst_results_embalses, ignore_index=True)
+    del lst_results_embalses # Los df de cada nodo ya no se necesitan
         
     # Reorder columns
     columnas = [df_config_out_file[CFSOF_col_timestamp].iloc[0], \
@@ -3423,12 +3758,14 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_embalses = df_results_embalses[columnas]
     df_results_embalses.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_embalses].iloc[0], df_results_embalses)
+    del df_results_embalses
         
     '''
     Calcular + guardar datos de RECORDERS de (2) Aportacion <---> Input
     '''
     
-    primer_nodo = list(dic_aportaciones.keys())[0]
+    lst_results_aportaciones = [] # Resultados de cada nodo, se unen al final del bucle
     for aportacion in dic_aportaciones:
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
         df_results_aportacion = recorder_aportaciones_flow[aportacion].to_dataframe()
@@ -3456,7 +3793,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             file_name_aportaciones = PARAMETROS_APORTACIONES_DIRECTORIO_DIARIO + PREFIJO_ARCHIVO_CSV_APORTACIONES_DIARIO + str(columna_en_archivo_aportaciones) + '.csv'
     
         # Abrir archivo
-        df_all_values_element = pd.read_csv(file_name_aportaciones)
+        df_all_values_element = model_inputs.read_series(file_name_aportaciones)
     
         # Obtener los datos que nos interesan
         df_list_values_simulation = df_all_values_element[df_all_values_element[ARCHIVO_CSV_APORTACIONES_CAMPO_FECHA] >= p_date_init]
@@ -3475,8 +3812,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             df_results_aportacion[df_config_out_file[CFSOF_col_total_flow].iloc[0]] / df_results_aportacion[df_config_out_file[CFSOF_col_total_init_max_flow].iloc[0]]
     
         # Actualizar el df con la info de todas las aportaciones
-        if (aportacion == primer_nodo): df_results_aportaciones = df_results_aportacion.copy()
-        else: df_results_aportaciones = pd.concat([df_results_aportaciones, df_results_aportacion.copy()], ignore_index=True)
+        lst_results_aportaciones.append(df_results_aportacion)
+    
+    df_results_aportaciones = pd.concat(lst_results_aportaciones, ignore_index=True)
+    del lst_results_aportaciones # Los df de cada nodo ya no se necesitan
     
     # Calcular datos agregados totales
     df_results_aportaciones[df_config_out_file[CFSOF_col_total_flow_aportaciones_all_real].iloc[0]] = df_results_aportaciones[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -3506,13 +3845,15 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_aportaciones = df_results_aportaciones[columnas]
     df_results_aportaciones.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_aportaciones].iloc[0], df_results_aportaciones)
+    del df_results_aportaciones
                     
         
     '''
     Calcular + guardar datos de RECORDERS de (3) Demanda <---> Output")
     '''
     
-    primer_nodo = list(dic_demandas.keys())[0]
+    lst_results_demandas = [] # Resultados de cada nodo, se unen al final del bucle
     for demanda in dic_demandas:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -3551,19 +3892,19 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de demanda
             df_all_values_element = df_PARAMS_DEMANDAS_mensual[[dic_demandas[demanda].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
     
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de demanda
             df_all_values_element = df_PARAMS_DEMANDAS_diario[[dic_demandas[demanda].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                            df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                            df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
                 
         # Asignar los valores
         df_results_demanda[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
@@ -3600,8 +3941,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_demanda[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_demandas[demanda].cost # (Initial) cost
     
         # Actualizar el df con la info de todas las demandas
-        if (demanda == primer_nodo): df_results_demandas = df_results_demanda.copy()
-        else: df_results_demandas = pd.concat([df_results_demandas, df_results_demanda.copy()], ignore_index=True)
+        lst_results_demandas.append(df_results_demanda)
+    
+    df_results_demandas = pd.concat(lst_results_demandas, ignore_index=True)
+    del lst_results_demandas # Los df de cada nodo ya no se necesitan
     
     # Calcular datos agregados totales
     df_results_demandas[df_config_out_file[CFSOF_col_total_flow_demandas_all_real].iloc[0]] = df_results_demandas[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -3647,7 +3990,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     Calcular + guardar datos de recorders para (4) Toma <---> MultiSplitLink
     Nota: en esta parte, se guardarán los datos que van por el lado de 'split_demanda', es decir, factors[0]
     '''
-    primer_nodo = list(dic_tomas.keys())[0]
+    lst_results_tomas = [] # Resultados de cada nodo, se unen al final del bucle
     for toma in dic_tomas:
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
         df_results_toma = recorder_tomas_flow[toma].to_dataframe()
@@ -3675,8 +4018,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_toma[df_config_out_file[CFSOF_col_split_factor_retorno].iloc[0]] = dic_tomas[toma].factors[1] # Split retorno
         
         # Actualizar el df con la info de todas las tomas
-        if (toma == primer_nodo): df_results_tomas = df_results_toma.copy()
-        else: df_results_tomas = pd.concat([df_results_tomas, df_results_toma.copy()], ignore_index=True)
+        lst_results_tomas.append(df_results_toma)
+    
+    df_results_tomas = pd.concat(lst_results_tomas, ignore_index=True)
+    del lst_results_tomas # Los df de cada nodo ya no se necesitan
     
     # Valores agregados       
     df_results_tomas[df_config_out_file[CFSOF_col_total_flow_tomas_all_real].iloc[0]] = df_results_tomas[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()        
@@ -3702,7 +4047,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     Calcular + guardar datos de RECORDERS de (5) Conduccion1 <---> LossLink
     '''
     
-    primer_nodo = list(dic_conducciones1.keys())[0]
+    lst_results_conducciones1 = [] # Resultados de cada nodo, se unen al final del bucle
     for conduccion1 in dic_conducciones1:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -3725,45 +4070,47 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de q_min
             df_all_values_element = df_PARAMS_CONDUCCIONES1_q_min_mensual[[dic_conducciones1[conduccion1].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
             df_results_conduccion1[df_config_out_file[CFSOF_col_init_min_flow].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de q_max
             df_all_values_element = df_PARAMS_CONDUCCIONES1_q_max_mensual[[dic_conducciones1[conduccion1].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)
             df_results_conduccion1[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de q_min
             df_all_values_element = df_PARAMS_CONDUCCIONES1_q_min_diario[[dic_conducciones1[conduccion1].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             df_results_conduccion1[df_config_out_file[CFSOF_col_init_min_flow].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de q_max
             df_all_values_element = df_PARAMS_CONDUCCIONES1_q_max_diario[[dic_conducciones1[conduccion1].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)
             df_results_conduccion1[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
     
         # Seguimos. Este valor de inicialización NO es un parámetro-serie-array.
         df_results_conduccion1[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_conducciones1[conduccion1].cost # (Initial) cost
                     
         # Actualizar el df con la info de todas las conducciones1
-        if (conduccion1 == primer_nodo): df_results_conducciones1 = df_results_conduccion1.copy()
-        else: df_results_conducciones1 = pd.concat([df_results_conducciones1, df_results_conduccion1.copy()], ignore_index=True)
+        lst_results_conducciones1.append(df_results_conduccion1)
+    
+    df_results_conducciones1 = pd.concat(lst_results_conducciones1, ignore_index=True)
+    del lst_results_conducciones1 # Los df de cada nodo ya no se necesitan
     
     # Reorder columns
     columnas = [df_config_out_file[CFSOF_col_timestamp].iloc[0], \
@@ -3777,13 +4124,15 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_conducciones1 = df_results_conducciones1[columnas]        
     df_results_conducciones1.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_conducciones1].iloc[0], df_results_conducciones1)
+    del df_results_conducciones1
             
     
     '''
     Calcular + guardar datos de RECORDERS de (6) Conduccion3 <---> LossLink
     '''
     
-    primer_nodo = list(dic_conducciones3.keys())[0]
+    lst_results_conducciones3 = [] # Resultados de cada nodo, se unen al final del bucle
     for conduccion3 in dic_conducciones3:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -3806,45 +4155,47 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de q_min
             df_all_values_element = df_PARAMS_CONDUCCIONES3_q_min_mensual[[dic_conducciones3[conduccion3].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)                
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)                
             df_results_conduccion3[df_config_out_file[CFSOF_col_init_min_flow].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de q_max
             df_all_values_element = df_PARAMS_CONDUCCIONES3_q_max_mensual[[dic_conducciones3[conduccion3].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
             df_results_conduccion3[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de q_min
             df_all_values_element = df_PARAMS_CONDUCCIONES3_q_min_diario[[dic_conducciones3[conduccion3].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)                
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)                
             df_results_conduccion3[df_config_out_file[CFSOF_col_init_min_flow].iloc[0]] = df_list_values_simulation.values
     
             # Serie de valores de q_max
             df_all_values_element = df_PARAMS_CONDUCCIONES3_q_max_diario[[dic_conducciones3[conduccion3].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)                
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)                
             df_results_conduccion3[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
     
         # Seguimos. Este valor de inicialización NO es un parámetro-serie-array.
         df_results_conduccion3[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_conducciones3[conduccion3].cost # (Initial) cost
                             
         # Actualizar el df con la info de todas las conducciones3
-        if (conduccion3 == primer_nodo): df_results_conducciones3 = df_results_conduccion3.copy()
-        else: df_results_conducciones3 = pd.concat([df_results_conducciones3, df_results_conduccion3.copy()], ignore_index=True)
+        lst_results_conducciones3.append(df_results_conduccion3)
+    
+    df_results_conducciones3 = pd.concat(lst_results_conducciones3, ignore_index=True)
+    del lst_results_conducciones3 # Los df de cada nodo ya no se necesitan
     
     # Reorder columns
     columnas = [df_config_out_file[CFSOF_col_timestamp].iloc[0], \
@@ -3858,12 +4209,14 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_conducciones3 = df_results_conducciones3[columnas]        
     df_results_conducciones3.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_conducciones3].iloc[0], df_results_conducciones3)
+    del df_results_conducciones3
         
     '''
     Calcular + guardar datos de RECORDERS de (7) Bombeo <---> Link")
     '''
     
-    primer_nodo = list(dic_bombeos.keys())[0]
+    lst_results_bombeos = [] # Resultados de cada nodo, se unen al final del bucle
     for bombeo in dic_bombeos:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -3877,8 +4230,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_bombeo[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_bombeos[bombeo].cost # (Initial) cost
         
         # Actualizar el df con la info de todos los bombeos
-        if (bombeo == primer_nodo): df_results_bombeos = df_results_bombeo.copy()
-        else: df_results_bombeos = pd.concat([df_results_bombeos, df_results_bombeo.copy()], ignore_index=True)
+        lst_results_bombeos.append(df_results_bombeo)
+    
+    df_results_bombeos = pd.concat(lst_results_bombeos, ignore_index=True)
+    del lst_results_bombeos # Los df de cada nodo ya no se necesitan
             
     # Calcular datos agregados totales
     df_results_bombeos[df_config_out_file[CFSOF_col_total_flow_bombeos_all_real].iloc[0]] = df_results_bombeos[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -3893,13 +4248,15 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_bombeos = df_results_bombeos[columnas]        
     df_results_bombeos.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_bombeos].iloc[0], df_results_bombeos)
+    del df_results_bombeos
     
     
     '''
     Calcular + guardar datos de RECORDERS de (8) Retorno <---> Input
     '''
     
-    primer_nodo = list(dic_retornos_input.keys())[0]
+    lst_results_retornos_input = [] # Resultados de cada nodo, se unen al final del bucle
     for retorno_input in dic_retornos_input:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -3917,19 +4274,19 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de retorno_input
             df_all_values_element = df_PARAMS_RETORNOS_demanda_mensual[[dic_retornos_input[retorno_input].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
             
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de retorno_input
             df_all_values_element = df_PARAMS_RETORNOS_demanda_diario[[dic_retornos_input[retorno_input].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             
         # Asignar los valores
         df_results_retorno_input[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
@@ -3947,8 +4304,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_retorno_input[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_retornos_input[retorno_input].cost # (Initial) cost
             
         # Actualizar el df con la info de todos los retornos
-        if (retorno_input == primer_nodo): df_results_retornos_input = df_results_retorno_input.copy()
-        else: df_results_retornos_input = pd.concat([df_results_retornos_input, df_results_retorno_input.copy()], ignore_index=True)
+        lst_results_retornos_input.append(df_results_retorno_input)
+    
+    df_results_retornos_input = pd.concat(lst_results_retornos_input, ignore_index=True)
+    del lst_results_retornos_input # Los df de cada nodo ya no se necesitan
     
     # Calcular datos agregados totales
     df_results_retornos_input[df_config_out_file[CFSOF_col_total_flow_retornos_input_all_real].iloc[0]] = df_results_retornos_input[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -3978,13 +4337,15 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_retornos_input = df_results_retornos_input[columnas]        
     df_results_retornos_input.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_retornos_input].iloc[0], df_results_retornos_input)
+    del df_results_retornos_input
             
     
     '''
     Calcular + guardar datos de RECORDERS de (8) Retorno <---> Output
     '''
     
-    primer_nodo = list(dic_retornos_output.keys())[0]
+    lst_results_retornos_output = [] # Resultados de cada nodo, se unen al final del bucle
     for retorno_output in dic_retornos_output:
     
         # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -4003,20 +4364,20 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de retorno_output
             df_all_values_element = df_PARAMS_RETORNOS_demanda_mensual[[dic_retornos_output[retorno_output].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
             
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de retorno_output
             df_all_values_element = df_PARAMS_RETORNOS_demanda_diario[[dic_retornos_output[retorno_output].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
                 df_list_values_simulation = \
-                    pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                    df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                    pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                    df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             
         # Asignar los valores
         df_results_retorno_output[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
@@ -4054,8 +4415,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_retorno_output[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_retornos_output[retorno_output].cost # (Initial) cost
             
         # Actualizar el df con la info de todas las retornos_output
-        if (retorno_output == primer_nodo): df_results_retornos_output = df_results_retorno_output.copy()
-        else: df_results_retornos_output = pd.concat([df_results_retornos_output, df_results_retorno_output.copy()], ignore_index=True)
+        lst_results_retornos_output.append(df_results_retorno_output)
+    
+    df_results_retornos_output = pd.concat(lst_results_retornos_output, ignore_index=True)
+    del lst_results_retornos_output # Los df de cada nodo ya no se necesitan
     
     # Calcular datos agregados totales
     df_results_retornos_output[df_config_out_file[CFSOF_col_total_flow_retornos_output_all_real].iloc[0]] = df_results_retornos_output[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -4089,12 +4452,14 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_retornos_output = df_results_retornos_output[columnas] 
     df_results_retornos_output.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_retornos_output].iloc[0], df_results_retornos_output)
+    del df_results_retornos_output
     
     '''
     Calcular + guardar datos de RECORDERS de (9) Acuifero <---> Input [+ Storage]
     '''
     
-    primer_nodo = list(dic_acuiferos.keys())[0]
+    lst_results_acuiferos = [] # Resultados de cada nodo, se unen al final del bucle
     for acuifero in dic_acuiferos:
     
          # Guardar datos en dataframe (ID, nombre (descripción), timestamp y recorders data)
@@ -4112,19 +4477,19 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
             # Serie de valores de recarga de acuífero
             df_all_values_element = df_PARAMS_ACUIFEROS_recarga_mensual[[dic_acuiferos[acuifero].comment]]
             if (simul_end_month_of_year >= simul_start_month_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_month_of_year-1):simul_end_month_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_month_of_year-1):N_MESES_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_month_of_year, :]], axis=0, ignore_index=True)        
             
         else: # (p_simulation_step == SIMULATION_STEP_PASO_DIARIO):
             # Serie de valores de recarga de acuífero
             df_all_values_element = df_PARAMS_ACUIFEROS_recarga_diario[[dic_acuiferos[acuifero].comment]]
             if (simul_end_day_of_year > simul_start_day_of_year):
-                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :].copy()
+                df_list_values_simulation = df_all_values_element.iloc[(simul_start_day_of_year-1):simul_end_day_of_year, :]
             else:
-                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :].copy(), \
-                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :].copy()], axis=0, ignore_index=True)        
+                df_list_values_simulation = pd.concat([df_all_values_element.iloc[(simul_start_day_of_year-1):N_DIAS_YEAR_ESTANDAR, :], \
+                                                       df_all_values_element.iloc[0:simul_end_day_of_year-1, :]], axis=0, ignore_index=True)        
             
         # Asignamos los valores
         df_results_acuifero[df_config_out_file[CFSOF_col_init_max_flow].iloc[0]] = df_list_values_simulation.values
@@ -4141,8 +4506,10 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
         df_results_acuifero[df_config_out_file[CFSOF_col_cost].iloc[0]] = dic_acuiferos[acuifero].cost # (Initial) cost
         
         # Actualizar el df con la info de todos los acuiferos
-        if (acuifero == primer_nodo): df_results_acuiferos = df_results_acuifero.copy()
-        else: df_results_acuiferos = pd.concat([df_results_acuiferos, df_results_acuifero.copy()], ignore_index=True)
+        lst_results_acuiferos.append(df_results_acuifero)
+    
+    df_results_acuiferos = pd.concat(lst_results_acuiferos, ignore_index=True)
+    del lst_results_acuiferos # Los df de cada nodo ya no se necesitan
     
     # Calcular datos agregados totales
     df_results_acuiferos[df_config_out_file[CFSOF_col_total_flow_acuiferos_all_real].iloc[0]] = df_results_acuiferos[df_config_out_file[CFSOF_col_flow].iloc[0]].sum()
@@ -4201,6 +4568,8 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     df_results_retorno_global = df_results_retorno_global[columnas]
     df_results_retorno_global.reset_index(drop=True, inplace=True)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_retorno_global].iloc[0], df_results_retorno_global)
+    del df_results_retorno_global
     
     # Imprimir datos TOTALES
     
@@ -4409,10 +4778,17 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
 
     #/---------------------------------------------------------------------------------
 
+    # Las tomas y los acuíferos ya no se necesitan para el reparto
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_tomas].iloc[0], df_results_tomas)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_acuiferos].iloc[0], df_results_acuiferos)
+    del df_results_tomas, df_results_acuiferos
+
     # Probamos una nueva forma de hacer el reparto (para el prototipo del 23-03-2023)    
+    progress.phase('reparto')
     
-    # Obtener los json
-    json_recursos_15_days, json_recursos_7_months = my_aux_file.getResources()
+    # Obtener los json. El horizonte es el periodo de simulación, para que el resultado sea siempre el mismo
+    json_recursos_15_days, json_recursos_7_months = my_aux_file.getResources( \
+        p_simulation_days=(pd.to_datetime(p_date_end) - pd.to_datetime(p_date_init)).days + 1)
 
     # Convertir a df
     df_recursos_15_days = pd.json_normalize(json_recursos_15_days)
@@ -4461,7 +4837,7 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
 
 
     # Empezamos a repartir; trabajamos con una copia de 'df_results_demandas'
-    df_demandas_reparto = df_results_demandas.sort_values(by=['cost', 'id', 'timestamp']).copy()
+    df_demandas_reparto = df_results_demandas.sort_values(by=['cost', 'id', 'timestamp'])
 
     # Inicialización
     lstColumnas_a_inicializar = ['flow', 'flow_incert_low', 'flow_incert_high', 'mean_flow', 'flow_deficit', \
@@ -4474,68 +4850,24 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     for elemento in lstColumnas_a_inicializar:
         df_demandas_reparto[elemento] = 0.0
 
-    # Recorremos las demandas
-    for i in range(df_demandas_reparto.shape[0]):
-        
-        # (1) Check 'tipo_agua_reutilizada'
-        if (df_demandas_reparto['flow'].iloc[i] < df_demandas_reparto['init_max_flow'].iloc[i]):
-            if (CheckIfDemandTypeUsesWaterType(df_demandas_reparto['tipo_demanda_nombre'].iloc[i], 'reutilizada', \
-                                            df_pdf_demandas, g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)):
-                
-                if (df_recursos_reparto['reutilizada'].values[0] > 0.0):
-                    q_asignado = min((df_demandas_reparto['init_max_flow'].iloc[i] - df_demandas_reparto['flow'].iloc[i] ), \
-                                    df_recursos_reparto['reutilizada'].values[0])
-                    df_demandas_reparto['flow'].iloc[i] += q_asignado
-                    df_demandas_reparto['q_tipo_agua_reut'].iloc[i] += q_asignado
-                    df_recursos_reparto['reutilizada'] -= q_asignado
-
-        # (2) Check 'tipo_agua_superficial'
-        if (df_demandas_reparto['flow'].iloc[i] < df_demandas_reparto['init_max_flow'].iloc[i]):
-            if (CheckIfDemandTypeUsesWaterType(df_demandas_reparto['tipo_demanda_nombre'].iloc[i], 'superficial', \
-                                            df_pdf_demandas, g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)) :
-                
-                if (df_recursos_reparto['superficial'].values[0] > 0.0):
-                    q_asignado = min((df_demandas_reparto['init_max_flow'].iloc[i] - df_demandas_reparto['flow'].iloc[i] ), \
-                                    df_recursos_reparto['superficial'].values[0])
-                    df_demandas_reparto['flow'].iloc[i] += q_asignado
-                    df_demandas_reparto['q_tipo_agua_superf'].iloc[i] += q_asignado
-                    df_recursos_reparto['superficial'] -= q_asignado
-
-        # (3) Check 'tipo_agua_trasvase'
-        if (df_demandas_reparto['flow'].iloc[i] < df_demandas_reparto['init_max_flow'].iloc[i]):
-            if (CheckIfDemandTypeUsesWaterType(df_demandas_reparto['tipo_demanda_nombre'].iloc[i], 'trasvase', \
-                                            df_pdf_demandas, g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)):
-                
-                if (df_recursos_reparto['trasvase'].values[0] > 0.0):
-                    q_asignado = min((df_demandas_reparto['init_max_flow'].iloc[i] - df_demandas_reparto['flow'].iloc[i] ), \
-                                    df_recursos_reparto['trasvase'].values[0])
-                    df_demandas_reparto['flow'].iloc[i] += q_asignado
-                    df_demandas_reparto['q_tipo_agua_trasv'].iloc[i] += q_asignado
-                    df_recursos_reparto['trasvase'] -= q_asignado                
-
-        # (4) Check 'tipo_agua_subterranea'
-        if (df_demandas_reparto['flow'].iloc[i] < df_demandas_reparto['init_max_flow'].iloc[i]):
-            if (CheckIfDemandTypeUsesWaterType(df_demandas_reparto['tipo_demanda_nombre'].iloc[i], 'subterranea', \
-                                            df_pdf_demandas, g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)):
-                
-                if (df_recursos_reparto['subterranea'].values[0] > 0.0):
-                    q_asignado = min((df_demandas_reparto['init_max_flow'].iloc[i] - df_demandas_reparto['flow'].iloc[i] ), \
-                                    df_recursos_reparto['subterranea'].values[0])
-                    df_demandas_reparto['flow'].iloc[i] += q_asignado
-                    df_demandas_reparto['q_tipo_agua_subt'].iloc[i] += q_asignado
-                    df_recursos_reparto['subterranea'] -= q_asignado                
-
-        # (5) Check 'tipo_agua_desalada'
-        if (df_demandas_reparto['flow'].iloc[i] < df_demandas_reparto['init_max_flow'].iloc[i]):
-            if (CheckIfDemandTypeUsesWaterType(df_demandas_reparto['tipo_demanda_nombre'].iloc[i], 'desalada', \
-                                            df_pdf_demandas, g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)):
-                
-                if (df_recursos_reparto['desalada'].values[0] > 0.0):
-                    q_asignado = min((df_demandas_reparto['init_max_flow'].iloc[i] - df_demandas_reparto['flow'].iloc[i] ), \
-                                    df_recursos_reparto['desalada'].values[0])
-                    df_demandas_reparto['flow'].iloc[i] += q_asignado
-                    df_demandas_reparto['q_tipo_agua_desal'].iloc[i] += q_asignado
-                    df_recursos_reparto['desalada'] -= q_asignado
+    # Demandas que pueden recibir cada tipo de agua, en el orden de reparto. Cada tipo de demanda se comprueba
+    # una única vez en el archivo de datos físicos, en lugar de hacerlo en cada fila.
+    lst_tipos_demanda = list(df_demandas_reparto['tipo_demanda_nombre'].unique())
+    lst_recursos = []
+    for tipo_agua in TIPOS_AGUA_ORDEN_REPARTO:
+        lst_tipos_demanda_usan = [tipo_demanda for tipo_demanda in lst_tipos_demanda \
+                                  if CheckIfDemandTypeUsesWaterType(tipo_demanda, tipo_agua, df_pdf_demandas, \
+                                                                    g_col_demanda_tipo_nombre, g_col_tipo_agua_toma)]
+        lst_recursos.append((df_recursos_reparto[tipo_agua].values[0], \
+                             df_demandas_reparto['tipo_demanda_nombre'].isin(lst_tipos_demanda_usan).values))
+
+    # Repartimos los recursos entre las demandas (ordenadas por coste, id y timestamp)
+    flow, lst_q_asignado = RepartirRecursosADemandas(df_demandas_reparto['init_max_flow'].values.astype(float), \
+                                                     lst_recursos)
+    df_demandas_reparto['flow'] = flow
+    for columna, q_asignado in zip(['q_tipo_agua_reut', 'q_tipo_agua_superf', 'q_tipo_agua_trasv', 'q_tipo_agua_subt', \
+                                    'q_tipo_agua_desal'], lst_q_asignado):
+        df_demandas_reparto[columna] = q_asignado
     
     # A continuación, se calculan los porcentajes de reparto
 
@@ -4610,21 +4942,18 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
     
     
     # Write complete results to an exit Excel file
+    progress.phase('output')
     file_name_results = RESULTS_ALL_FILE
-    with pd.ExcelWriter(file_name_results) as writer:
-        df_results_nudo_final.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_nudo_final].iloc[0])
-        df_results_embalses.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_embalses].iloc[0])
-        df_results_aportaciones.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_aportaciones].iloc[0])
-        df_results_demandas.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_demandas].iloc[0])
-        df_results_tomas.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_tomas].iloc[0])
-        df_results_conducciones1.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_conducciones1].iloc[0])
-        df_results_conducciones3.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_conducciones3].iloc[0])
-        df_results_bombeos.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_bombeos].iloc[0])
-        df_results_retornos_input.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_retornos_input].iloc[0])
-        df_results_retornos_output.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_retornos_output].iloc[0])
-        df_results_acuiferos.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_acuiferos].iloc[0])
-        df_results_retorno_global.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_retorno_global].iloc[0])
-        df_totales.to_excel(writer, sheet_name=df_config_out_file[CFSOF_col_sheet_totales].iloc[0])    
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_demandas].iloc[0], df_results_demandas)
+    GuardarHojaResultados(dic_hojas_resultados, df_config_out_file[CFSOF_col_sheet_totales].iloc[0], df_totales)
+    del df_results_demandas, df_demandas_reparto
+    EscribirHojasResultados(file_name_results, dic_hojas_resultados, \
+                            [df_config_out_file[col].iloc[0] for col in \
+                             [CFSOF_col_sheet_nudo_final, CFSOF_col_sheet_embalses, CFSOF_col_sheet_aportaciones, \
+                              CFSOF_col_sheet_demandas, CFSOF_col_sheet_tomas, CFSOF_col_sheet_conducciones1, \
+                              CFSOF_col_sheet_conducciones3, CFSOF_col_sheet_bombeos, CFSOF_col_sheet_retornos_input, \
+                              CFSOF_col_sheet_retornos_output, CFSOF_col_sheet_acuiferos, CFSOF_col_sheet_retorno_global, \
+                              CFSOF_col_sheet_totales]])
     
         
     # Guardar los resultados para L4 y L5
@@ -4644,6 +4973,82 @@ def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_
 #                                                df_config_out_file[CFSOF_col_demand_tipo_agua_trasv].iloc[0], \
 #                                                df_config_out_file[CFSOF_col_demand_tipo_agua_desal].iloc[0]]].copy()    
     
-    return df_results_for_L4_L5
-    
+    # Volumen de cada embalse al final de cada paso de tiempo (índice: inicio del paso), para iniciar con ellos
+    # simulaciones posteriores (planificación continua)
+    df_results_for_L4_L5.attrs['volumenes_embalses'] = \
+        pd.DataFrame({embalse: recorder_embalses_volume[embalse].data[:, 0] for embalse in dic_embalses}, \
+                     index=df_temp.index.to_timestamp())
     
+    return df_results_for_L4_L5
+
+
+#******************************************************************************************************
+# FUNCTION: Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_step, p_date_init, p_date_end, \
+#                                                       p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+#                                                       p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+#                                                       p_percent_agua_desalada=1.0, \
+#                                                       p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0, \
+#                                                       p_solver=None, p_volumenes_iniciales=None)
+#
+# DESCRIPTION: Realizar la planificación u optimización de suministros a demandas de la CHS.
+# ARGUMENTS:
+# 	p_simulation_type: valor entero que indica si es PLANIFICACION (1) u OPTIMIZACION (2)
+#	p_simulation_step: valor entero que indica si es DIARIO (1) o MENSUAL (2)
+# 	p_date_init: string de fecha de inicio de simulación en formato '%Y-%m-%d'
+# 	p_date_end: string de fecha de fin de simulación en formato '%Y-%m-%d'
+#   p_percent_agua_superficial: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
+#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
+#                               hasta un máximo del 150% de agua superficial disponible.
+#   p_percent_agua_subterranea: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
+#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
+#                               hasta un máximo del 150% de agua superficial disponible.
+#   p_percent_agua_reutilizada: % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
+#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
+#                               hasta un máximo del 150% de agua superficial disponible.
+#   p_percent_agua_trasvase:    % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
+#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
+#                               hasta un máximo del 150% de agua superficial disponible.
+#   p_percent_agua_desalada:    % que el usuario define y que debe aplicarse sobre el agua superficial disponible. Se trata de un valor
+#                               limitado a 0.5 por debajo y a 1.5 por arriba, lo que representa utilizar desde un mínimo del 50%
+#                               hasta un máximo del 150% de agua superficial disponible.
+#   p_weight_deficit:  valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la minimización del déficit
+#                      en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit, p_peso_co2 y
+#                      p_peso_economic debe ser 1.0.
+#   p_weight_co2:      valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la minimización del co2
+#                      en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit, p_peso_co2 y
+#                      p_peso_economic debe ser 1.0.
+#   p_weight_economic: valor real (float) entre 0.0 y 1.0. Representa el peso / la importancia que se le da a la maximización del balance
+#                      económico en la función de optimización de pywr. Debe cumplirse la restricción de que la suma de p_peso_deficit,
+#                      p_peso_co2 y p_peso_economic debe ser 1.0.
+#   p_solver: nombre del solver de pywr; si no se indica, se utiliza el configurado para p_simulation_type.
+#   p_volumenes_iniciales: diccionario embalse -> volumen inicial, para iniciar la simulación con los volúmenes de una
+#                          simulación anterior (planificación continua). Si no se indica, se usan los de los datos físicos.
+#
+# RETURNS: df de resultados para L4 y L5; en df.attrs['volumenes_embalses'] se devuelve el volumen de cada embalse al
+#          final de cada paso de tiempo.
+#
+#******************************************************************************************************
+def Planificar_Optimizar_Suministros_a_Demandas(p_simulation_type, p_simulation_step, p_date_init='', p_date_end='', \
+                                                p_percent_agua_superficial=1.0, p_percent_agua_subterranea=1.0, \
+                                                p_percent_agua_reutilizada=1.0, p_percent_agua_trasvase=1.0, \
+                                                p_percent_agua_desalada=1.0, \
+                                                p_peso_deficit=1.0, p_peso_co2=0.0, p_peso_economic=0.0, \
+                                                p_solver=None, p_volumenes_iniciales=None):
+    
+    solver = ObtenerSolver(p_simulation_type, p_solver)
+    
+    # La red se construye una única vez para cada paso y periodo de simulación; cada escenario solo
+    # modifica los valores de sus parámetros y costes antes de ejecutar la simulación.
+    with _plantillas_red_lock:
+        plantilla = ObtenerPlantillaRed(p_simulation_step, p_date_init, p_date_end, solver)
+        progress.phase('scenario')
+        escenario = AplicarEscenario(plantilla, p_simulation_type, \
+                                     p_percent_agua_superficial, p_percent_agua_subterranea, \
+                                     p_percent_agua_reutilizada, p_percent_agua_trasvase, \
+                                     p_percent_agua_desalada, \
+                                     p_peso_deficit, p_peso_co2, p_peso_economic)
+        AplicarVolumenesIniciales(plantilla, p_volumenes_iniciales)
+        return SimularEscenario(plantilla, escenario, p_simulation_step, \
+                                p_percent_agua_superficial, p_percent_agua_subterranea, \
+                                p_percent_agua_reutilizada, p_percent_agua_trasvase, \
+                                p_percent_agua_desalada)
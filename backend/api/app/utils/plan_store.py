@@ -0,0 +1,160 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+import pyarrow.feather as feather
+
+
+# Columnar copy written next to every plan CSV (Arrow IPC / Feather v2)
+ARROW_EXTENSION = '.arrow'
+
+# Result files written in the folder of every simulation job
+JOB_PLAN_FILE = '/plan.csv'
+JOB_PLAN_DATA_FILE = '/plan_data.json'
+JOB_PROGRESS_FILE = '/progress.json'
+
+# Per demand unit summary written next to every plan, shared by the CO2 and hydro-economic maps
+SUMMARY_EXTENSION = '_summary.arrow'
+SUMMARY_COLUMNS = ['flow', 'init_max_flow', 'tipo_agua_superficial', 'tipo_agua_subterranea',
+                   'tipo_agua_reutilizada', 'tipo_agua_trasvase', 'tipo_agua_desalada']
+
+# Plan file and periods per year of every simulation period shown in the maps
+SIMULATION_PERIODS = {
+    'daily': ('SIMUL_S/last_daily.csv', 365),
+    'monthlyDaily': ('SIMUL_M/last_daily.csv', 12),
+    'monthlyMonthly': ('SIMUL_M/last_monthly.csv', 12)
+}
+
+# Per-process cache of the last loaded plans and summaries, least recently used first:
+# path -> (file signature, DataFrame)
+MAX_CACHED_PLANS = 4
+MAX_CACHED_SUMMARIES = 16
+_plans = OrderedDict()
+_summaries = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def arrow_file(file):
+    return os.path.splitext(file)[0] + ARROW_EXTENSION
+
+
+def summary_file(file):
+    return os.path.splitext(file)[0] + SUMMARY_EXTENSION
+
+
+def file_signature(file):
+    stat = os.stat(file)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def publish(file, link):
+    """Atomically point `link` to `file`, readers of `link` switch to the new result at once."""
+    link_tmp_file = f'{link}.{os.getpid()}.tmp'
+    if os.path.lexists(link_tmp_file):
+        os.unlink(link_tmp_file)
+    os.symlink(os.path.realpath(file), link_tmp_file)
+    os.replace(link_tmp_file, link)
+
+
+def write_plan(df, file):
+    """Write a plan as CSV (download format) plus its memory-mappable Arrow copy."""
+    df.to_csv(file, index=False)
+    # Store the frame exactly as the CSV is parsed back so both readers see the same types
+    arrow_tmp_file = f'{arrow_file(file)}.{os.getpid()}.tmp'
+    feather.write_feather(pd.read_csv(file), arrow_tmp_file,
+                          compression='uncompressed')
+    os.replace(arrow_tmp_file, arrow_file(file))
+    write_summary(read_plan(file), file)
+
+
+def summarize(df):
+    # Mean flow, demand and water origin shares of every demand unit over the whole plan
+    return df.groupby(['demanda_mi_id'], as_index=False)[SUMMARY_COLUMNS].mean()
+
+
+def write_summary(df, file):
+    summary = summarize(df)
+    # Summaries are written by the first API worker that reads them, every worker writes its own tmp file
+    summary_tmp_file = f'{summary_file(file)}.{os.getpid()}.tmp'
+    feather.write_feather(summary, summary_tmp_file, compression='uncompressed')
+    os.replace(summary_tmp_file, summary_file(file))
+    return summary
+
+
+def cached_frame(frames, file, signature):
+    # Frame of `file` if it is cached for the same file version, which becomes the most recently used
+    with _plans_lock:
+        entry = frames.get(file)
+        if entry is None or entry[0] != signature:
+            return None
+        frames.move_to_end(file)
+        return entry[1]
+
+
+def cache_frame(frames, file, signature, df, max_frames):
+    with _plans_lock:
+        frames[file] = (signature, df)
+        frames.move_to_end(file)
+        while len(frames) > max_frames:
+            frames.popitem(last=False)
+
+
+def read_plan(file):
+    """Return the plan stored in `file`, reusing the loaded frame until the file changes.
+
+    The returned DataFrame is shared between requests, callers must not modify it in place.
+    """
+    file = os.path.realpath(file)
+    signature = file_signature(file)
+    df = cached_frame(_plans, file, signature)
+    if df is not None:
+        return df
+
+    columnar_file = arrow_file(file)
+    if os.path.isfile(columnar_file) and file_signature(columnar_file)[0] >= signature[0]:
+        df = feather.read_table(columnar_file, memory_map=True).to_pandas()
+    else:
+        # Plans written before the columnar store existed only have the CSV
+        df = pd.read_csv(file)
+
+    cache_frame(_plans, file, signature, df, MAX_CACHED_PLANS)
+    return df
+
+
+def read_summary(file):
+    """Return the per demand unit summary of the plan stored in `file`, built once per plan version.
+
+    The returned DataFrame is shared between requests, callers must not modify it in place.
+    """
+    file = os.path.realpath(file)
+    signature = file_signature(file)
+    summary = cached_frame(_summaries, file, signature)
+    if summary is not None:
+        return summary
+
+    summary_columnar_file = summary_file(file)
+    if os.path.isfile(summary_columnar_file) and file_signature(summary_columnar_file)[0] >= signature[0]:
+        summary = feather.read_table(summary_columnar_file).to_pandas()
+    else:
+        # Plans written before summaries existed get theirs on first use
+        summary = write_summary(read_plan(file), file)
+
+    cache_frame(_summaries, file, signature, summary, MAX_CACHED_SUMMARIES)
+    return summary
+
+
+def read_simulation_summary(data_folder, line, period):
+    """Return the demand unit summary of the last `line` simulation of `period` and its periods per year."""
+    try:
+        if period not in SIMULATION_PERIODS:
+            raise Exception('Period not supported')
+        file, period_factor = SIMULATION_PERIODS[period]
+        summary = read_summary(data_folder + f'/{line}/OUT/{file}')
+    except Exception:
+        raise Exception(f'Error reading {line} with period {period} data')
+    return summary, period_factor
+
+
+def demand_units(summary, type):
+    # Copy of the summary rows whose demand unit code contains `type`
+    return summary[summary['demanda_mi_id'].str.contains(type)].reset_index(drop=True)
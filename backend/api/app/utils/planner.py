@@ -2,13 +2,18 @@
 import os
 import json
 import hashlib
-import logging
+import itertools
+import numpy as np
 import pandas as pd
 from flask import current_app
 from datetime import datetime
 
+from . import scenario_cache
+from . import model_inputs
 from . import modelo_L4_L5 as modelo
+from . import co2
 from . import hidroeconomic
+from .plan_store import read_plan, write_plan, publish, JOB_PLAN_FILE, JOB_PLAN_DATA_FILE
 
 
 DATA_FOLDER = current_app.config['DATA_FOLDER']
@@ -16,315 +21,358 @@ PLAN_FOLDER = DATA_FOLDER + '/L4/OUT/'
 CO2_EMISSION_FILE = DATA_FOLDER + '/L4/CO2_emission.csv'
 UDA_ECONOMIC_FILE = DATA_FOLDER + '/L4/agricultureEconomic.csv'
 UDI_ECONOMIC_FILE = DATA_FOLDER + '/L4/industryEconomic.csv'
-PIDFILE = PLAN_FOLDER + "/planner.pid"
 
+# Water origin types whose available share a scenario can change
+SCENARIO_WATER_TYPES = ['superficial', 'subterranea', 'reutilizada', 'trasvase', 'desalada']
+MAX_BATCH_SCENARIOS = 64
+# Result file written in the folder of every batch scenario job
+JOB_TOTALS_FILE = '/totals.json'
+# Reservoir volumes of the last plan of every scenario, rolling plans start from them
+ROLLING_FOLDER = PLAN_FOLDER + 'rolling/'
 
-# CO2 of each water origin type kW/m3
-water_CO2 = {
-    "superficial": 0.06,
-    "subterranea": 0.9,
-    "reutilizada": 0.78,
-    "trasvase": 1.21,
-    "desalada": 4.32
-}
-
-# t CO2 / kW
-emission_factor = 0.000354
 
+def read_type_table(file, type, monthly):
+    df = read_plan(file)
+    return process_table(df[df["tipo_demanda_nombre"] == type], "demanda_mi_id", monthly)
 
-ud_types_CO2 = {
-    "UDU": 17.432137489428,  # t CO2 / hm3,
-    "UDI": {  # t C02 / hm3
-        "UDI01": 692074,
-        "UDI02": 1211850,
-        "UDI03": 372821,
-        "UDI04": 478388,
-        "UDI05": 799353,
-        "UDI06": 386516,
-        "UDI07": 168925,
-    },
-    "UDRG": 692.67920511001,  # t CO2 / hm3
 
-    "AMBIENTAL": -395.2  # t CO2 / hm3
+def read_table(file, monthly):
+    df = read_plan(file)
+    return process_table(df, "tipo_demanda_nombre", monthly)
 
-}
 
+def group_starts(*keys):
+    # Positions where any of the (already sorted) key columns changes its value
+    n = len(keys[0])
+    change = np.zeros(n, dtype=bool)
+    if n > 0:
+        change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
 
-def compute_hash(file):
-    if not os.path.isfile(file):
-        return None
-    h = hashlib.sha1()
-    with open(file, 'rb') as file:
-        chunk = 0
-        while chunk != b'':
-            chunk = file.read(1024)
-            h.update(chunk)
-    return h.hexdigest()
 
+def group_sums(values, starts):
+    # Same reduction as Series.sum() on every group (NaN skipped, numpy summation order)
+    values = np.where(np.isnan(values), 0.0, values)
+    ends = np.append(starts[1:], len(values)) if len(starts) > 0 else starts
+    if np.all(ends - starts == 1):
+        return values[starts]
+    return np.array([values[start:end].sum() for start, end in zip(starts, ends)], dtype=float)
 
-def read_type_table(file, type, monthly):
-    df = pd.read_csv(file)
-    return process_table(df[df["tipo_demanda_nombre"] == type], "demanda_mi_id", monthly)
 
-
-def read_table(file, monthly):
-    df = pd.read_csv(file)
-    return process_table(df, "tipo_demanda_nombre", monthly)
+def uda_emissions(monthly):
+    # Per unit UDA emissions of the plan period
+    emission_df = pd.read_csv(CO2_EMISSION_FILE)
+    return emission_df.drop_duplicates("id").set_index("id")["monthly" if monthly else "daily"]
 
 
 def process_table(df, column, monthly: bool = False):
-    emission_df = pd.read_csv(CO2_EMISSION_FILE)
-    uda_hidroeconomic = pd.read_csv(UDA_ECONOMIC_FILE)
-    udi_hidroeconomic = pd.read_csv(UDI_ECONOMIC_FILE)
-
     dates = df["timestamp"].unique()
-    df = df.sort_values([column])
-    names = df[column].unique()
-    emission_column = "daily"
-    if monthly:
-        emission_column = "monthly"
+    df = df.sort_values([column, "timestamp"], kind="stable")
+
+    # Rows are grouped by name and, inside every name, by date
+    names = df[column].to_numpy()
+    name_starts = group_starts(names)
+    date_starts = group_starts(names, df["timestamp"].to_numpy())
+    name_date_starts = np.searchsorted(date_starts, name_starts)
+    name_date_ends = np.append(name_date_starts[1:], len(date_starts))
+
+    flow = df["flow"].to_numpy(dtype=float)
+    init_max_flow = df["init_max_flow"].to_numpy(dtype=float)
+    demand = group_sums(init_max_flow, name_starts)
+    planned = group_sums(flow, name_starts)
+    deficit_per_day = group_sums(flow, date_starts) - group_sums(init_max_flow, date_starts)
+    volumes = {water_type: group_sums(group_sums(volume, date_starts), name_date_starts)
+               for water_type, volume in co2.water_volumes(df).items()}
+
+    # Every row adds the water emission of its whole name group
+    water_emission = co2.water_emissions(volumes, co2.water_CO2_m3)
+    name_sizes = np.diff(np.append(name_starts, len(df)))
+    emission = group_sums(co2.total_emissions(np.repeat(water_emission, name_sizes),
+                                              *co2.demand_emissions(df, uda_emissions(monthly))), name_starts)
+    economical = group_sums(hidroeconomic.compute_income(
+        df, UDA_ECONOMIC_FILE, UDI_ECONOMIC_FILE, monthly), name_starts)
 
     data = []
-    for name in names:
-        aux_df = df[df[column] == name]
-        aux_df = aux_df.sort_values(["timestamp"])
-        demand = aux_df["init_max_flow"].sum()
-        planned = aux_df["flow"].sum()
-        aux_df_groupby = aux_df.groupby("timestamp")
-        deficitPerDay = aux_df_groupby.apply(
-            lambda x: x["flow"].sum() - x["init_max_flow"].sum()).values
-        superficial = float(aux_df_groupby.apply(
-            lambda x: (x["flow"] * x["tipo_agua_superficial"]).sum()).sum())
-        subterranea = float(aux_df_groupby.apply(
-            lambda x: (x["flow"] * x["tipo_agua_subterranea"]).sum()).sum())
-        reutilizada = float(aux_df_groupby.apply(
-            lambda x: (x["flow"] * x["tipo_agua_reutilizada"]).sum()).sum())
-        trasvase = float(aux_df_groupby.apply(
-            lambda x: (x["flow"] * x["tipo_agua_trasvase"]).sum()).sum())
-        desalada = float(aux_df_groupby.apply(
-            lambda x: (x["flow"] * x["tipo_agua_desalada"]).sum()).sum())
-        dinamic_emission = ((superficial * water_CO2["superficial"]) + (subterranea * water_CO2["subterranea"]) + (
-            reutilizada * water_CO2["reutilizada"]) + (trasvase * water_CO2["trasvase"]) + (desalada * water_CO2["desalada"])) * emission_factor
-
-        emission = aux_df.apply(lambda x: compute_CO2_uda(dinamic_emission, emission_df[emission_df["id"] == x["demanda_mi_id"]][emission_column]) if (
-            x["tipo_demanda_nombre"] == "UDA") else compute_CO2_other(dinamic_emission, x['flow'], x['demanda_mi_id'], x['tipo_demanda_nombre']), axis=1).sum()
-
-        economical = aux_df.apply(lambda x: hidroeconomic.compute(
-            x, uda_hidroeconomic, udi_hidroeconomic, monthly), axis=1).sum()
-
+    for i, name_start in enumerate(name_starts):
         data.append({
-            "name": name,
-            "demand": round(float(demand), 4),
-            "planned": round(float(planned), 4),
+            "name": names[name_start],
+            "demand": round(float(demand[i]), 4),
+            "planned": round(float(planned[i]), 4),
             "dates": list(dates),
-            "deficit": round(float(planned - demand), 4),
-            "deficitPerDay": list(map(float, deficitPerDay)),
-            "superficial": round(superficial, 4),
-            "subterranea": round(subterranea, 4),
-            "reutilizada": round(reutilizada, 4),
-            "trasvase": round(trasvase, 4),
-            "desalada": round(desalada, 4),
-            "emission": round(float(emission), 0),
-            "economical": round(float(economical), 0)
+            "deficit": round(float(planned[i] - demand[i]), 4),
+            "deficitPerDay": list(map(float, deficit_per_day[name_date_starts[i]:name_date_ends[i]])),
+            "superficial": round(float(volumes["superficial"][i]), 4),
+            "subterranea": round(float(volumes["subterranea"][i]), 4),
+            "reutilizada": round(float(volumes["reutilizada"][i]), 4),
+            "trasvase": round(float(volumes["trasvase"][i]), 4),
+            "desalada": round(float(volumes["desalada"][i]), 4),
+            "emission": round(float(emission[i]), 0),
+            "economical": round(float(economical[i]), 0)
         })
     return data
 
 
+def aggregate_by_date(df, monthly: bool = False):
+    df = df.sort_values(["timestamp"], kind="stable")
+    timestamps = df["timestamp"].to_numpy()
+    starts = group_starts(timestamps)
+
+    volumes = co2.water_volumes(df)
+    emission = co2.total_emissions(co2.water_emissions(volumes, co2.water_CO2_m3),
+                                   *co2.demand_emissions(df, uda_emissions(monthly)))
+    economic = hidroeconomic.compute_income(df, UDA_ECONOMIC_FILE, UDI_ECONOMIC_FILE, monthly)
+
+    return {
+        "date": timestamps[starts],
+        "demand": group_sums(df["init_max_flow"].to_numpy(dtype=float), starts),
+        "planned": group_sums(df["flow"].to_numpy(dtype=float), starts),
+        "incertLow": group_sums(df["flow_incert_low"].to_numpy(dtype=float), starts),
+        "incertHigh": group_sums(df["flow_incert_high"].to_numpy(dtype=float), starts),
+        "volumes": {water_type: group_sums(volume, starts) for water_type, volume in volumes.items()},
+        "CO2": group_sums(emission, starts),
+        "economic": group_sums(economic, starts)
+    }
+
+
 def read_unit_plot(file, id, monthly):
-    df = pd.read_csv(file)
+    df = read_plan(file)
     return process_plot(df[df["demanda_mi_id"] == id], monthly)
 
 
 def read_type_plot(file, type, monthly):
-    df = pd.read_csv(file)
+    df = read_plan(file)
     return process_plot(df[df["tipo_demanda_nombre"] == type], monthly)
 
 
 def read_plot(file, monthly):
-    df = pd.read_csv(file)
+    df = read_plan(file)
     return process_plot(df, monthly)
 
 
 def process_plot(df, monthly: bool = False):
-    emission = pd.read_csv(CO2_EMISSION_FILE)
-    uda_hidroeconomic = pd.read_csv(UDA_ECONOMIC_FILE)
-    udi_hidroeconomic = pd.read_csv(UDI_ECONOMIC_FILE)
-
-    dates = df["timestamp"].sort_values().unique()
-    demand = []
-    planned = []
-    incert_low = []
-    incert_high = []
-    co2 = []
-    economic = []
-    superficial = []
-    subterranea = []
-    reutilizada = []
-    trasvase = []
-    desalada = []
-
-    emission_column = "daily"
-    if monthly:
-        emission_column = "monthly"
-
-    for date in dates:
-        aux_df = df[df['timestamp'] == date].copy()
-        demand.append(float(aux_df["init_max_flow"].sum()))
-        planned_flow = float(aux_df["flow"].sum())
-        incert_low.append(float(aux_df["flow_incert_low"].sum()))
-        incert_high.append(float(aux_df["flow_incert_high"].sum()))
-        planned.append(planned_flow)
-        aux_df["superficial"] = aux_df["flow"] * \
-            aux_df["tipo_agua_superficial"]
-        aux_df["total_CO2"] = (aux_df["superficial"] *
-                               water_CO2["superficial"])
-
-        aux_df["subterranea"] = aux_df["flow"] * \
-            aux_df["tipo_agua_subterranea"]
-        aux_df["total_CO2"] = aux_df["total_CO2"] + \
-            (aux_df["subterranea"] * water_CO2["subterranea"])
-
-        aux_df["reutilizada"] = aux_df["flow"] * \
-            aux_df["tipo_agua_reutilizada"]
-        aux_df["total_CO2"] = aux_df["total_CO2"] + \
-            (aux_df["reutilizada"] * water_CO2["reutilizada"])
-
-        aux_df["trasvase"] = aux_df["flow"] * aux_df["tipo_agua_trasvase"]
-        aux_df["total_CO2"] = aux_df["total_CO2"] + \
-            (aux_df["trasvase"] * water_CO2["trasvase"])
-
-        aux_df["desalada"] = aux_df["flow"] * aux_df["tipo_agua_desalada"]
-        aux_df["total_CO2"] = aux_df["total_CO2"] + \
-            (aux_df["desalada"] * water_CO2["desalada"])
-
-        aux_df["total_CO2"] = aux_df["total_CO2"] * emission_factor
-
-        aux_df["CO2"] = aux_df.apply(lambda x: compute_CO2_uda(x["total_CO2"], emission[emission["id"] == x["demanda_mi_id"]][emission_column]) if (
-            x["tipo_demanda_nombre"] == "UDA") else compute_CO2_other(x["total_CO2"], x['flow'], x['demanda_mi_id'], x['tipo_demanda_nombre']), axis=1)
-
-        aux_df["Hidroeconomic"] = aux_df.apply(lambda x: hidroeconomic.compute(
-            x, uda_hidroeconomic, udi_hidroeconomic, monthly), axis=1)
-
-        if planned_flow != 0:
-            superficial.append(aux_df["superficial"].sum() / planned_flow)
-            subterranea.append(aux_df["subterranea"].sum() / planned_flow)
-            reutilizada.append(aux_df["reutilizada"].sum() / planned_flow)
-            trasvase.append(aux_df["trasvase"].sum() / planned_flow)
-            desalada.append(aux_df["desalada"].sum() / planned_flow)
-        else:
-            superficial.append(0)
-            subterranea.append(0)
-            reutilizada.append(0)
-            trasvase.append(0)
-            desalada.append(0)
-
-        co2.append(float(aux_df["CO2"].sum()))
-        economic.append(float(aux_df["Hidroeconomic"].sum()))
+    aggregated = aggregate_by_date(df, monthly)
+    planned = aggregated["planned"]
+
+    # Share of every water origin type over the planned flow of each date
+    shares = {}
+    for water_type, volume in aggregated["volumes"].items():
+        shares[water_type] = [float(volume[i] / planned[i]) if planned[i] != 0 else 0
+                              for i in range(len(planned))]
 
     return {
-        "date": dates.tolist(),
-        "demand": demand,
-        "planned": planned,
-        "incertLow": incert_low,
-        "incertHigh": incert_high,
-        "subterranea": subterranea,
-        "superficial": superficial,
-        "reutilizada": reutilizada,
-        "trasvase": trasvase,
-        "desalada": desalada,
-        "CO2": co2,
-        "economic": economic
+        "date": aggregated["date"].tolist(),
+        "demand": aggregated["demand"].tolist(),
+        "planned": planned.tolist(),
+        "incertLow": aggregated["incertLow"].tolist(),
+        "incertHigh": aggregated["incertHigh"].tolist(),
+        "subterranea": shares["subterranea"],
+        "superficial": shares["superficial"],
+        "reutilizada": shares["reutilizada"],
+        "trasvase": shares["trasvase"],
+        "desalada": shares["desalada"],
+        "CO2": aggregated["CO2"].tolist(),
+        "economic": aggregated["economic"].tolist()
     }
 
 
-def compute_CO2_uda(dinamic_co2, static_co2):
-    if static_co2.shape[0] == 0:
-        return dinamic_co2
-    return static_co2.iloc[0] + dinamic_co2
+def last_plan_files(monthly: bool = False, daily: bool = False):
+    # Plan and plan data files shown by default, they link to the result of the last finished job
+    if monthly:
+        if daily:
+            return PLAN_FOLDER+"/SIMUL_M/last_daily.csv", PLAN_FOLDER+"/SIMUL_M/last_daily_plan_data.json"
+        return PLAN_FOLDER+"/SIMUL_M/last_monthly.csv", PLAN_FOLDER+"/SIMUL_M/last_monthly_plan_data.json"
+    return PLAN_FOLDER+"SIMUL_S/last_daily.csv", PLAN_FOLDER+"/SIMUL_S/last_daily_plan_data.json"
 
 
-def compute_CO2_other(dinamic_co2, flow, id, type):
-    static_co2 = 0
-    if type in ud_types_CO2:
-        if type == "UDI":
-            if id in ud_types_CO2[type]:
-                static_co2 = ud_types_CO2[type][id] * flow
-        else:
-            static_co2 = ud_types_CO2[type] * flow
-    return static_co2 + dinamic_co2
+def simulation_horizon(monthly: bool = False, daily: bool = False):
+    """Simulation step and first and last day of the plans generated today."""
+    today = pd.to_datetime("today").date()
+    if monthly:
+        end = today + pd.tseries.offsets.DateOffset(months=7)
+    else:
+        end = today + pd.tseries.offsets.DateOffset(days=14)
 
+    simulation_step = 1
+    if monthly:
+        if not daily:
+            simulation_step = 2
+    return simulation_step, today, end
 
-def generate_plan(superficial: float = 1.0, subterranea: float = 1.0, reutilizada: float = 1.0,
-                  trasvase: float = 1.0, desalada: float = 1.0, monthly: bool = False, daily: bool = False):
+
+def rolling_state_file(simulation_step, percents):
+    key = hashlib.sha1(json.dumps([simulation_step, percents]).encode()).hexdigest()
+    return ROLLING_FOLDER + key + '.json'
+
+
+def rolling_volumes(state_file, start):
+    """Reservoir volumes the previous plan of the scenario reached at `start`, None if there are none to continue."""
     try:
-        # Write lock file containing process PID:
-        print(os.getpid(), file=open(PIDFILE, 'w'))
-
-        today = pd.to_datetime("today").date()
-        if monthly:
-            end = today + pd.tseries.offsets.DateOffset(months=7)
-        else:
-            end = today + pd.tseries.offsets.DateOffset(days=14)
-
-        simulation_step = 1
-        if monthly:
-            if not daily:
-                simulation_step = 2
-
-        df = modelo.Planificar_Optimizar_Suministros_a_Demandas(
-            p_simulation_type=1,
-            p_simulation_step=simulation_step,
-            p_date_init=today.strftime("%Y-%m-%d"),
-            p_date_end=end.strftime("%Y-%m-%d"),
-            p_percent_agua_superficial=float(superficial),
-            p_percent_agua_subterranea=float(subterranea),
-            p_percent_agua_reutilizada=float(reutilizada),
-            p_percent_agua_trasvase=float(trasvase),
-            p_percent_agua_desalada=float(desalada),
-        )
-
-        data = {
-            "superficial": superficial,
-            "subterranea": subterranea,
-            "reutilizada": reutilizada,
-            "trasvase": trasvase,
-            "desalada": desalada,
-            "CO2impact": 0,
-            "economicImpact": 0,
-            "waterDeficit": 1,
-            "start": today.strftime("%Y-%m-%d"),
-            "end": end.strftime("%Y-%m-%d"),
-            "creationDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-        if monthly:
-            if daily:
-                json_file = PLAN_FOLDER+"/SIMUL_M/last_daily_plan_data.json"
-            else:
-                json_file = PLAN_FOLDER+"/SIMUL_M/last_monthly_plan_data.json"
-        else:
-            json_file = PLAN_FOLDER+"/SIMUL_S/last_daily_plan_data.json"
-
-        if monthly:
-            if daily:
-                file = PLAN_FOLDER+"/SIMUL_M/last_daily.csv"
-            else:
-                file = PLAN_FOLDER+"/SIMUL_M/last_monthly.csv"
-        else:
-            file = PLAN_FOLDER+"SIMUL_S/last_daily.csv"
-
-        if monthly:
-            if not os.path.exists(PLAN_FOLDER+"/SIMUL_M/"):
-                os.makedirs(PLAN_FOLDER+"/SIMUL_M/")
-        else:
-            if not os.path.exists(PLAN_FOLDER+"/SIMUL_S/"):
-                os.makedirs(PLAN_FOLDER+"/SIMUL_S/")
-
-        with open(json_file, 'w') as f:
-            json.dump(data, f)
-
-        df.to_csv(file, index=False)
-    except Exception as e:
-        logging.error(f'An error occurred generating a plan: {e}')
-    finally:
-        os.unlink(PIDFILE)
+        with open(state_file) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Volumes only carry over while the model inputs are the ones the previous plan was simulated with
+    if state['sources'] != model_inputs.sources_hash(modelo.ArchivosDeEntrada()):
+        return None
+    # `start` has to begin a timestep of the previous plan, its volumes are the ones at the end of the timestep before
+    if start not in state['starts'][1:]:
+        return None
+    timestep = state['starts'].index(start) - 1
+    return {reservoir: volumes[timestep] for reservoir, volumes in state['volumes'].items()}
+
+
+def write_rolling_state(state_file, df):
+    volumes = df.attrs.get('volumenes_embalses')
+    # Results cached before the volumes were kept have none to continue from
+    if volumes is None:
+        return
+    state = {
+        'sources': model_inputs.sources_hash(modelo.ArchivosDeEntrada()),
+        'starts': [start.strftime("%Y-%m-%d") for start in volumes.index],
+        'volumes': {reservoir: volumes[reservoir].tolist() for reservoir in volumes.columns}
+    }
+    os.makedirs(ROLLING_FOLDER, exist_ok=True)
+    tmp_file = f'{state_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+
+def generate_plan(superficial: float = 1.0, subterranea: float = 1.0, reutilizada: float = 1.0,
+                  trasvase: float = 1.0, desalada: float = 1.0, monthly: bool = False, daily: bool = False,
+                  rolling: bool = False, result_folder: str = None):
+    """Simulate the plan of a scenario from today.
+
+    A rolling plan starts the reservoirs at the volumes the previous plan of the scenario reached today,
+    instead of the initial volumes of the model inputs, as long as those inputs did not change since.
+    """
+    simulation_step, today, end = simulation_horizon(monthly, daily)
+
+    percents = {
+        "p_percent_agua_superficial": float(superficial),
+        "p_percent_agua_subterranea": float(subterranea),
+        "p_percent_agua_reutilizada": float(reutilizada),
+        "p_percent_agua_trasvase": float(trasvase),
+        "p_percent_agua_desalada": float(desalada)
+    }
+    state_file = rolling_state_file(simulation_step, percents)
+    initial_volumes = rolling_volumes(state_file, today.strftime("%Y-%m-%d")) if rolling else None
+    rolled = {"p_volumenes_iniciales": initial_volumes} if initial_volumes is not None else {}
+
+    df = scenario_cache.simulate(
+        p_simulation_type=1,
+        p_simulation_step=simulation_step,
+        p_date_init=today.strftime("%Y-%m-%d"),
+        p_date_end=end.strftime("%Y-%m-%d"),
+        **percents,
+        **rolled
+    )
+    write_rolling_state(state_file, df)
+
+    data = {
+        "superficial": superficial,
+        "subterranea": subterranea,
+        "reutilizada": reutilizada,
+        "trasvase": trasvase,
+        "desalada": desalada,
+        "CO2impact": 0,
+        "economicImpact": 0,
+        "waterDeficit": 1,
+        "rolling": initial_volumes is not None,
+        "start": today.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "creationDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    # Every job keeps its own result, the last plan files point to the newest one
+    os.makedirs(result_folder, exist_ok=True)
+    with open(result_folder + JOB_PLAN_DATA_FILE, 'w') as f:
+        json.dump(data, f)
+    write_plan(df, result_folder + JOB_PLAN_FILE)
+
+    file, json_file = last_plan_files(monthly, daily)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    publish(result_folder + JOB_PLAN_FILE, file)
+    publish(result_folder + JOB_PLAN_DATA_FILE, json_file)
+
+
+def batch_scenarios(scenarios=None, grid=None):
+    """Scenarios of a batch: the listed ones followed by every combination of the grid values.
+
+    Water types missing from a scenario or from the grid keep all their available water (1.0).
+    """
+    batch = [{water_type: float(scenario.get(water_type, 1.0)) for water_type in SCENARIO_WATER_TYPES}
+             for scenario in scenarios or []]
+    if grid:
+        values = [[float(value) for value in grid.get(water_type, [1.0])]
+                  for water_type in SCENARIO_WATER_TYPES]
+        batch += [dict(zip(SCENARIO_WATER_TYPES, combination))
+                  for combination in itertools.product(*values)]
+    if len(batch) == 0:
+        raise ValueError('No scenarios given')
+    if len(batch) > MAX_BATCH_SCENARIOS:
+        raise ValueError(f'A batch can not have more than {MAX_BATCH_SCENARIOS} scenarios')
+    return batch
+
+
+def plan_totals(df, monthly: bool = False):
+    # Deficit, CO2 and economic totals of a whole plan
+    aggregated = aggregate_by_date(df, monthly)
+    demand = float(aggregated["demand"].sum())
+    planned = float(aggregated["planned"].sum())
+    return {
+        "demand": round(demand, 4),
+        "planned": round(planned, 4),
+        "deficit": round(planned - demand, 4),
+        "emission": round(float(aggregated["CO2"].sum()), 0),
+        "economical": round(float(aggregated["economic"].sum()), 0)
+    }
+
+
+def batch_params(scenarios: list, monthly: bool = False, daily: bool = False):
+    """Params of the job of every scenario of a batch, all of them simulate the horizon of the plans generated today."""
+    _, today, end = simulation_horizon(monthly, daily)
+    return [{'scenario': scenario, 'start': today.strftime("%Y-%m-%d"), 'end': end.strftime("%Y-%m-%d"),
+             'monthly': monthly, 'daily': daily} for scenario in scenarios]
+
+
+def generate_batch_scenario(scenario: dict, start: str, end: str, monthly: bool = False, daily: bool = False,
+                            result_folder: str = None):
+    """Simulate a scenario of a batch and write its totals.
+
+    Every scenario is a job of its own, so the scenarios of a batch spread over the worker pool. Workers
+    keep the network the model builds for the plan period, and the next scenario a worker takes only
+    changes its scenario parameters.
+    """
+    simulation_step, _, _ = simulation_horizon(monthly, daily)
+    df = scenario_cache.simulate(
+        p_simulation_type=1,
+        p_simulation_step=simulation_step,
+        p_date_init=start,
+        p_date_end=end,
+        p_percent_agua_superficial=float(scenario["superficial"]),
+        p_percent_agua_subterranea=float(scenario["subterranea"]),
+        p_percent_agua_reutilizada=float(scenario["reutilizada"]),
+        p_percent_agua_trasvase=float(scenario["trasvase"]),
+        p_percent_agua_desalada=float(scenario["desalada"]),
+    )
+
+    os.makedirs(result_folder, exist_ok=True)
+    with open(result_folder + JOB_TOTALS_FILE, 'w') as f:
+        json.dump({**scenario, **plan_totals(df, monthly)}, f)
+
+
+def batch_comparison(result_folders, start, end, creation_date):
+    """Comparison table of a batch from the totals written by the jobs of its scenarios."""
+    comparison = []
+    for result_folder in result_folders:
+        with open(result_folder + JOB_TOTALS_FILE) as f:
+            comparison.append(json.load(f))
+    return {
+        "scenarios": comparison,
+        "start": start,
+        "end": end,
+        "creationDate": creation_date.strftime("%Y-%m-%d %H:%M:%S")
+    }
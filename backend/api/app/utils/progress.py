@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import psutil
+import logging
+import resource
+
+
+# Seconds between two publications of the timestep counters
+PUBLISH_INTERVAL = 1.0
+
+# Progress of the simulation run by this process, None when it is not published
+_file = None
+_progress = None
+_phase_started = None
+_published = 0.0
+
+# Memory ceiling (bytes) of the simulation, None for no ceiling, and peak resident memory of the process
+# when the current phase started
+_memory_limit = None
+_process = None
+_phase_max_rss = 0
+
+
+def start(file, memory_limit=None):
+    """Publish the progress of the simulation run by this process to `file` until finish() is called.
+    The simulation fails with MemoryError as soon as the process uses more than `memory_limit` bytes."""
+    global _file, _progress, _phase_started, _memory_limit, _process
+    _file = file
+    _progress = {'phase': None, 'phases': [], 'timestep': 0, 'timesteps': 0, 'started': time.time()}
+    _phase_started = None
+    _memory_limit = memory_limit
+    _process = psutil.Process()
+    publish()
+
+
+def phase(name):
+    # The current phase ends when the next one starts
+    global _phase_started, _phase_max_rss
+    if _progress is None:
+        return
+    close_phase()
+    _progress['phase'] = name
+    _progress['phases'].append({'name': name, 'elapsed': None, 'peak_rss': 0})
+    _phase_started = time.perf_counter()
+    _phase_max_rss = max_rss()
+    sample_memory()
+    publish()
+
+
+def step(timestep, timesteps):
+    # Timestep counters are published at most once per interval, and always on the last timestep
+    if _progress is None:
+        return
+    sample_memory()
+    _progress['timestep'] = timestep
+    _progress['timesteps'] = timesteps
+    if timestep == timesteps or time.time() - _published >= PUBLISH_INTERVAL:
+        publish()
+
+
+def finish():
+    global _file, _progress, _memory_limit, _process
+    if _progress is None:
+        return
+    close_phase()
+    _progress['phase'] = None
+    publish()
+    # Per phase timing and memory of every simulation, to know which stage is worth optimizing
+    logging.info('Simulation phases: ' + ', '.join(
+        f"{phase['name']} {phase['elapsed']:.1f}s {phase['peak_rss'] / 2 ** 20:.0f}MB"
+        for phase in _progress['phases']))
+    _file = None
+    _progress = None
+    _memory_limit = None
+    _process = None
+
+
+def close_phase():
+    if _progress['phases'] and _progress['phases'][-1]['elapsed'] is None:
+        current = _progress['phases'][-1]
+        current['elapsed'] = round(time.perf_counter() - _phase_started, 3)
+        # A new high-water mark of the process was reached during the phase, even if no sample caught it
+        if max_rss() > _phase_max_rss:
+            current['peak_rss'] = max(current['peak_rss'], max_rss())
+
+
+def max_rss():
+    # Peak resident memory of the process in bytes (ru_maxrss is in kilobytes on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def sample_memory():
+    rss = _process.memory_info().rss
+    if _progress['phases']:
+        current = _progress['phases'][-1]
+        current['peak_rss'] = max(current['peak_rss'], rss)
+    if _memory_limit and rss > _memory_limit:
+        raise MemoryError(f'Simulation exceeded the worker memory limit of {_memory_limit // 2 ** 20}MB '
+                          f'({rss // 2 ** 20}MB in phase {_progress["phase"]})')
+
+
+def publish():
+    global _published
+    _published = time.time()
+    _progress['updated'] = _published
+    os.makedirs(os.path.dirname(_file), exist_ok=True)
+    tmp_file = f'{_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(_progress, f)
+    os.replace(tmp_file, _file)
+
+
+def read(file):
+    """Last progress published to `file`, None if nothing has been published."""
+    try:
+        with open(file) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -0,0 +1,84 @@
+import os
+import glob
+import json
+import hashlib
+import pandas as pd
+from flask import current_app
+
+from . import modelo_L4_L5 as modelo
+from . import model_inputs, compute_rec, compute_rec_dem_anual
+from .model_inputs import file_hash, compute_hash
+
+
+DATA_FOLDER = current_app.config['DATA_FOLDER']
+CACHE_FOLDER = DATA_FOLDER + '/L4/OUT/cache/'
+CACHE_SIZE = current_app.config['SCENARIO_CACHE_SIZE'] * 1024 * 1024
+
+# Version of the model code run by this process, results of other versions are never reused
+MODEL_VERSION = hashlib.sha1(''.join(
+    compute_hash(module.__file__) for module in [modelo, model_inputs, compute_rec, compute_rec_dem_anual]
+).encode()).hexdigest()
+
+
+def scenario_key(params):
+    """Content address of a simulation: its parameters, solver, model code and the hashes of every model input file."""
+    inputs = {os.path.relpath(file, DATA_FOLDER): file_hash(file)
+              for file in modelo.ArchivosDeEntrada()}
+    # Solvers may pick different optima of the same problem
+    solver = modelo.ObtenerSolver(params['p_simulation_type'], params.get('p_solver'))
+    scenario = json.dumps({'params': params, 'solver': solver, 'model': MODEL_VERSION, 'inputs': inputs},
+                          sort_keys=True)
+    return hashlib.sha1(scenario.encode()).hexdigest()
+
+
+def cache_file(key):
+    return CACHE_FOLDER + key + '.pkl'
+
+
+def read_result(key):
+    file = cache_file(key)
+    try:
+        df = pd.read_pickle(file)
+    except (FileNotFoundError, EOFError):
+        return None
+    # File modification time is the last use of the entry
+    os.utime(file)
+    return df
+
+
+def write_result(key, df):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    tmp_file = f'{cache_file(key)}.{os.getpid()}.tmp'
+    df.to_pickle(tmp_file)
+    os.replace(tmp_file, cache_file(key))
+    evict()
+
+
+def evict():
+    # Remove the least recently used results until the cache fits its disk budget
+    entries = []
+    for file in glob.glob(CACHE_FOLDER + '*.pkl'):
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file))
+    size = sum(entry[1] for entry in entries)
+    for _, file_size, file in sorted(entries):
+        if size <= CACHE_SIZE:
+            break
+        try:
+            os.unlink(file)
+        except FileNotFoundError:
+            pass
+        size -= file_size
+
+
+def simulate(**params):
+    """Run Planificar_Optimizar_Suministros_a_Demandas, reusing the result of an identical earlier scenario."""
+    key = scenario_key(params)
+    df = read_result(key)
+    if df is None:
+        df = modelo.Planificar_Optimizar_Suministros_a_Demandas(**params)
+        write_result(key, df)
+    return df
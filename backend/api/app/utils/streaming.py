@@ -0,0 +1,102 @@
+import io
+import csv
+import json
+import logging
+import itertools
+import pyarrow as pa
+from flask import Response
+
+
+# Rows of every Arrow record batch and size of the text chunks sent to the client
+ARROW_BATCH_SIZE = 10000
+CHUNK_BYTES = 64 * 1024
+
+# Streaming formats of the time series endpoints and their content type
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+
+def ndjson_chunks(records, columns):
+    buffer = io.StringIO()
+    for record in records:
+        row = {column: record.get(column) for column in columns}
+        # Times as epoch milliseconds, like the JSON responses
+        if row.get('_time') is not None:
+            row['_time'] = int(row['_time'].timestamp() * 1000)
+        buffer.write(json.dumps(row) + '\n')
+        if buffer.tell() >= CHUNK_BYTES:
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+def csv_chunks(records, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([record.get(column) for column in columns])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+def arrow_chunks(records, columns):
+    buffer = io.BytesIO()
+    writer = schema = None
+    batch = {column: [] for column in columns}
+    for record in records:
+        for column in columns:
+            batch[column].append(record.get(column))
+        if len(batch[columns[0]]) == ARROW_BATCH_SIZE:
+            writer, schema = write_batch(buffer, writer, schema, batch)
+            yield flush(buffer)
+            batch = {column: [] for column in columns}
+    # The stream always has a schema, even without rows
+    if batch[columns[0]] or writer is None:
+        writer, schema = write_batch(buffer, writer, schema, batch)
+    writer.close()
+    yield flush(buffer)
+
+
+def write_batch(buffer, writer, schema, batch):
+    # The schema of the stream is the one of its first batch
+    record_batch = pa.RecordBatch.from_pydict(batch, schema=schema)
+    if writer is None:
+        writer = pa.ipc.new_stream(buffer, record_batch.schema)
+    writer.write_batch(record_batch)
+    return writer, record_batch.schema
+
+
+def flush(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def checked(records):
+    # The first record is read before the response starts, so a failing query raises to the caller instead of
+    # cutting a 200 response
+    records = iter(records)
+    first = next(records, None)
+    return itertools.chain([first] if first is not None else [], logged(records))
+
+
+def logged(records):
+    # Errors after the response started can only close the connection, the body ends without its last chunk
+    try:
+        yield from records
+    except Exception as e:
+        logging.error(f'Stream interrupted: {e}')
+        raise
+
+
+def stream_response(records, columns, format):
+    """Response streaming the `columns` of the Flux `records` in `format`, one chunk at a time.
+
+    Streams run on a thread of the threaded API workers, so an export is not bound by the worker timeout."""
+    chunks = {'ndjson': ndjson_chunks, 'csv': csv_chunks, 'arrow': arrow_chunks}[format]
+    return Response(chunks(checked(records), columns), mimetype=FORMATS[format])
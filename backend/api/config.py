@@ -1,6 +1,7 @@
 import os
 import logging
 import sqlalchemy
+from multiprocessing import cpu_count
 from dotenv import load_dotenv
 
 # Load .env
@@ -42,8 +43,25 @@ class Config(object):
         os.environ.get('TIMEOUT') or '30') + '000'
     SAIH_BUCKET = os.environ.get('SAIH_BUCKET') or 'SAIH'
     SIMUL_BUCKET = os.environ.get('SIMUL_BUCKET') or 'SIMUL'
+    # Values of a Flux set filter sent in one query, and queries run in parallel for larger selections
+    INFLUX_QUERY_CHUNK_SIZE = int(os.getenv('INFLUX_QUERY_CHUNK_SIZE') or 50)
+    INFLUX_QUERY_WORKERS = int(os.getenv('INFLUX_QUERY_WORKERS') or 4)
+    # Points per variable of the SAIH values requested without an aggregation window
+    SAIH_POINT_BUDGET = int(os.getenv('SAIH_POINT_BUDGET') or 1000)
     OWS_URL = os.environ.get('OWS_URL') or 'http://ows:8000/'
     DATA_FOLDER = os.getenv('DATA_FOLDER', default='/geodata/')
+    # Simulations (L4 plans and L5 optimizations) run at the same time by the simulations service (flask jobs worker)
+    SIMULATION_WORKERS = int(os.getenv('SIMULATION_WORKERS') or cpu_count())
+    # Seconds a simulation worker waits for a new job, keeping its loaded networks, before exiting
+    SIMULATION_WORKER_IDLE_TIMEOUT = int(os.getenv('SIMULATION_WORKER_IDLE_TIMEOUT') or 600)
+    # Memory ceiling (MB) of every simulation worker, 0 for no ceiling. Workers over the ceiling fail their job, and
+    # no new worker is started while the host has less free memory than the ceiling
+    SIMULATION_WORKER_MEMORY_LIMIT = int(os.getenv('SIMULATION_WORKER_MEMORY_LIMIT') or 0)
+    # LP solver of the pywr model of L4 plans and L5 optimizations (glpk, glpk-edge or lpsolve)
+    PLANNING_SOLVER = os.getenv('PLANNING_SOLVER') or 'glpk'
+    OPTIMISATION_SOLVER = os.getenv('OPTIMISATION_SOLVER') or 'glpk'
+    # Disk budget (MB) of the simulation results kept for repeated scenarios
+    SCENARIO_CACHE_SIZE = int(os.getenv('SCENARIO_CACHE_SIZE') or 2048)
     
     DC_CONFIG = {
         'db_database':ODC_DB_NAME,
@@ -6,8 +6,10 @@ DEBUG = environ.get('DEBUG', default='False').upper() in ['TRUE','YES','1']
 # General
 bind = '0.0.0.0:' + environ.get('PORT', '5000')
 workers = cpu_count() * 2 + 1
-# threads = cpu_count() * 2
-worker_class = 'sync'
+# Threaded workers keep answering the arbiter while a thread streams an export, so streams are not bound by
+# the worker timeout. Simulations run in the simulations service, API workers never fork.
+threads = int(environ.get('THREADS', 4))
+worker_class = 'gthread'
 worker_connections = 1000
 timeout = environ.get('TIMEOUT', 30)
 keepalive = 2
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from app.utils import co2
+from .plans import plan_frame, write_emission_file, row_emission, row_water_emission
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('monthly', [False, True])
+def test_emissions_match_row_loop(tmp_path, seed, monthly):
+    emission_column = 'monthly' if monthly else 'daily'
+    emission_df = pd.read_csv(write_emission_file(tmp_path))
+    df = plan_frame(seed)
+
+    uda_emission = emission_df.drop_duplicates('id').set_index('id')[emission_column]
+    emissions = co2.total_emissions(co2.water_emissions(co2.water_volumes(df), co2.water_CO2_m3),
+                                    *co2.demand_emissions(df, uda_emission))
+    expected = [row_emission(x, row_water_emission(x), emission_df, emission_column) for _, x in df.iterrows()]
+
+    assert emissions.tolist() == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+
+def test_water_emissions_units():
+    # The map layers use kW/hm3 and the plans kW/m3 of the same energy use
+    volumes = {water_type: pd.Series([1.0, 2.0]).to_numpy() for water_type in co2.water_CO2}
+    assert (co2.water_emissions(volumes) / 1000000).tolist() == pytest.approx(
+        co2.water_emissions(volumes, co2.water_CO2_m3).tolist())
+
+
+def test_calculate_industry_emissions():
+    df = pd.DataFrame({'code': ['UDI01', 'UDI07'], 'flow': [2.0, 0.5],
+                       'tipo_agua_superficial': [1.0, 0.0], 'tipo_agua_subterranea': [0.0, 0.0],
+                       'tipo_agua_reutilizada': [0.0, 0.0], 'tipo_agua_trasvase': [0.0, 0.0],
+                       'tipo_agua_desalada': [0.0, 1.0]})
+    df = co2.calculate_industry_emissions(df)
+
+    assert df['demand'].tolist() == pytest.approx([692074 * 2.0, 168925 * 0.5])
+    assert df['water'].tolist() == pytest.approx([2.0 * 60000 * 0.000354, 0.5 * 4320000 * 0.000354])
+    assert df['total'].tolist() == pytest.approx((df['demand'] + df['water']).tolist())
@@ -8,3 +8,11 @@ def client():
     app = create_app('testing')
     with app.test_client() as client:
         yield client
+
+
+@pytest.fixture
+def app():
+    # Modules reading the app config on import are imported inside this context
+    app = create_app('testing')
+    with app.app_context():
+        yield app
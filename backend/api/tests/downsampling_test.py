@@ -0,0 +1,165 @@
+import uuid
+import types
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def downsampling(app, monkeypatch):
+    from app.utils import downsampling
+    monkeypatch.setattr(downsampling, 'POINT_BUDGET', 1000)
+    return downsampling
+
+
+def with_tiers(downsampling, monkeypatch, tiers):
+    # Tiers available to the queries, each one since its coverage date
+    monkeypatch.setattr(downsampling, 'available_tiers',
+                        lambda: {window: pd.Timestamp(since, tz='UTC') for window, since in tiers.items()})
+
+
+@pytest.mark.parametrize('tier, window, expected', [
+    ('1h', '3h', True),
+    ('1h', '1h', True),
+    ('1h', '90m', False),
+    ('1h', '1d12h', True),
+    ('1d', '1w', True),
+    ('1d', '36h', False),
+    ('1h', '1mo', False),
+    ('1mo', '3mo', True),
+    ('1mo', '30d', False)
+])
+def test_divides(downsampling, tier, window, expected):
+    assert downsampling.divides(tier, window) == expected
+
+
+def test_duration(downsampling):
+    assert downsampling.duration('90m') == pd.Timedelta(minutes=90)
+    assert downsampling.duration('1d12h') == pd.Timedelta(hours=36)
+    assert downsampling.duration('1mo') is None
+    assert downsampling.duration('1h30') is None
+
+
+def test_resolve_tier_window(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    # Tier rows are stamped with their window start and read aggregated again by the window
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'max', '1d') == \
+        (downsampling.tier_bucket('1d'), 'max', '1d', 'max')
+
+
+def test_resolve_reaggregates_multiple_of_tier(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'sum', '3h') == \
+        (downsampling.tier_bucket('1h'), 'sum', '3h', 'sum')
+    # The coarsest tier holding the window
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'min', '2d') == \
+        (downsampling.tier_bucket('1d'), 'min', '2d', 'min')
+
+
+def test_resolve_mean_not_reaggregated(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'mean', '3h') == \
+        (downsampling.BUCKET, 'value', '3h', 'mean')
+
+
+def test_resolve_other_aggregation(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'median', '1h') == \
+        (downsampling.BUCKET, 'value', '1h', 'median')
+
+
+def test_resolve_short_span_raw(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    assert downsampling.resolve('2021-01-01', '2021-01-03') == (downsampling.BUCKET, 'value', None, None)
+
+
+def test_resolve_long_span_within_budget(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2020-01-01', '1d': '2020-01-01', '1mo': '2020-01-01'})
+    # A month of hours fits in the budget, a year only fits in days
+    assert downsampling.resolve('2021-01-01', '2021-02-01') == (downsampling.tier_bucket('1h'), 'mean', '1h', 'mean')
+    assert downsampling.resolve('2021-01-01', '2022-01-01', 'max') == \
+        (downsampling.tier_bucket('1d'), 'max', '1d', 'max')
+
+
+def test_resolve_tier_not_covering_start(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {'1h': '2021-06-01', '1d': '2021-06-01'})
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'max', '1d') == \
+        (downsampling.BUCKET, 'value', '1d', 'max')
+    assert downsampling.resolve('2021-01-01', '2022-01-01') == (downsampling.BUCKET, 'value', '1d', 'mean')
+
+
+def test_resolve_without_tiers(downsampling, monkeypatch):
+    with_tiers(downsampling, monkeypatch, {})
+    assert downsampling.resolve('2021-01-01', '2021-02-01', 'sum', '3h') == \
+        (downsampling.BUCKET, 'value', '3h', 'sum')
+    assert downsampling.resolve('2010-01-01', '2021-01-01') == (downsampling.BUCKET, 'value', '1mo', 'mean')
+
+
+def test_tier_windows_stamped_at_start(downsampling):
+    script = downsampling.aggregation_script('1h', '-2d')
+    assert script.count('timeSrc: "_start"') == len(downsampling.AGGREGATIONS)
+    assert f'to(bucket: "{downsampling.tier_bucket("1h")}")' in script
+
+
+def test_coverage(downsampling):
+    since = pd.Timestamp('2021-03-01', tz='UTC')
+    bucket = types.SimpleNamespace(description=downsampling.coverage_description('1d', since))
+    assert downsampling.coverage(bucket) == since
+    # Buckets whose windows were stamped with their stop
+    bucket = types.SimpleNamespace(description=f'Aggregations of {downsampling.BUCKET} by 1d since {since.isoformat()}')
+    assert downsampling.coverage(bucket) is None
+    assert downsampling.coverage(types.SimpleNamespace(description=None)) is None
+
+
+def test_values_query(downsampling):
+    query = downsampling.values_query(downsampling.tier_bucket('1h'), 'sum', '3h', 'sum')
+    assert f'from(bucket: "{downsampling.tier_bucket("1h")}")' in query
+    assert 'r["_field"] == "sum"' in query
+    assert 'aggregateWindow(every: 3h, fn: sum, createEmpty: false)' in query
+    assert 'aggregateWindow' not in downsampling.values_query(downsampling.BUCKET, 'value')
+
+
+@pytest.fixture
+def influx(downsampling, monkeypatch):
+    # Raw and tier buckets of a throwaway SAIH bucket, on the Influx the app is configured with
+    from app import influx_client
+    try:
+        influx_client.ping()
+    except Exception:
+        pytest.skip('Influx is not reachable')
+    monkeypatch.setattr(downsampling, 'BUCKET', f'SAIH_test_{uuid.uuid4().hex[:8]}')
+    buckets_api = influx_client.buckets_api()
+    buckets = [buckets_api.create_bucket(bucket_name=name, org=influx_client.org)
+               for name in [downsampling.BUCKET] + [downsampling.tier_bucket(window) for window in ['1h', '1d']]]
+    yield influx_client
+    for bucket in buckets:
+        buckets_api.delete_bucket(bucket)
+
+
+def test_tier_reads_match_raw_aggregation(downsampling, influx, monkeypatch):
+    from influxdb_client import Point
+    from influxdb_client.client.write_api import SYNCHRONOUS
+    from app.utils import flux
+
+    # Four days of raw values of two variables, with a gap
+    start, stop = pd.Timestamp('2022-01-01', tz='UTC'), pd.Timestamp('2022-01-05', tz='UTC')
+    times = pd.date_range(start, stop, freq='5min', inclusive='left')
+    rng = np.random.default_rng(0)
+    points = [Point('saih').tag('variableCode', code).field('value', float(value)).time(time)
+              for code in ['V1', 'V2'] for time, value in zip(times, rng.uniform(0, 100, len(times)))
+              if not pd.Timestamp('2022-01-02T05:00Z') <= time < pd.Timestamp('2022-01-02T09:00Z')]
+    influx.write_api(write_options=SYNCHRONOUS).write(bucket=downsampling.BUCKET, org=influx.org, record=points)
+    for window in ['1h', '1d']:
+        influx.query_api().query(downsampling.aggregation_script(
+            window, f'time(v: "{start.isoformat()}")', f'time(v: "{stop.isoformat()}")'))
+    with_tiers(downsampling, monkeypatch, {'1h': start, '1d': start})
+
+    def values(bucket, field, window, aggregation):
+        df = flux.query_data_frame(downsampling.values_query(bucket, field, window, aggregation), 'variables',
+                                   ['V1', 'V2'], {'start_date': start.isoformat(), 'end_date': stop.isoformat()})
+        return df.sort_values(['variableCode', '_time']).reset_index(drop=True)
+
+    for aggregation, window in [('sum', '3h'), ('min', '3h'), ('max', '2d'), ('mean', '1h'), ('sum', '1d')]:
+        resolved = downsampling.resolve(start.isoformat(), stop.isoformat(), aggregation, window)
+        assert resolved[0] != downsampling.BUCKET
+        pd.testing.assert_frame_equal(values(*resolved), values(downsampling.BUCKET, 'value', window, aggregation))
@@ -0,0 +1,87 @@
+import threading
+import pandas as pd
+import pytest
+
+
+class QueryApi:
+    # Records the queries and answers every one with a row per value of the array parameter
+    def __init__(self, set_param, as_list=False):
+        self.set_param = set_param
+        self.as_list = as_list
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def query_data_frame(self, query, params=None):
+        with self.lock:
+            self.calls.append((query, params))
+        values = params[self.set_param]
+        df = pd.DataFrame({'result': '_result', 'table': 0, 'variableCode': values,
+                           '_value': [float(len(value)) for value in values]})
+        if self.as_list:
+            return [df.iloc[:1], df.iloc[1:]]
+        return df
+
+
+class InfluxClient:
+    def __init__(self, query_api):
+        self._query_api = query_api
+
+    def query_api(self):
+        return self._query_api
+
+
+@pytest.fixture
+def flux(app, monkeypatch):
+    from app.utils import flux
+    monkeypatch.setattr(flux, 'CHUNK_SIZE', 2)
+    return flux
+
+
+def test_set_filter(flux):
+    assert flux.set_filter('variableCode', 'variables') == \
+        'filter(fn: (r) => contains(value: r["variableCode"], set: params.variables))'
+
+
+def test_query_data_frame_chunks(flux, monkeypatch):
+    query_api = QueryApi('variables')
+    monkeypatch.setattr(flux, 'influx_client', InfluxClient(query_api))
+
+    df = flux.query_data_frame('query', 'variables', ['a', 'bb', 'ccc', 'dddd', 'e'], {'start': 'x'})
+
+    assert sorted(params['variables'] for _, params in query_api.calls) == [['a', 'bb'], ['ccc', 'dddd'], ['e']]
+    assert all(query == 'query' and params['start'] == 'x' for query, params in query_api.calls)
+    # Chunks are merged in order and the table columns of the Influx client dropped
+    assert df['variableCode'].tolist() == ['a', 'bb', 'ccc', 'dddd', 'e']
+    assert df['_value'].tolist() == [1.0, 2.0, 3.0, 4.0, 1.0]
+    assert 'result' not in df.columns and 'table' not in df.columns
+    assert df.index.tolist() == list(range(5))
+
+
+def test_query_data_frame_single_chunk(flux, monkeypatch):
+    query_api = QueryApi('variables')
+    monkeypatch.setattr(flux, 'influx_client', InfluxClient(query_api))
+
+    df = flux.query_data_frame('query', 'variables', ['a', 'b'])
+
+    assert query_api.calls == [('query', {'variables': ['a', 'b']})]
+    assert df['variableCode'].tolist() == ['a', 'b']
+
+
+def test_query_data_frame_table_list(flux, monkeypatch):
+    query_api = QueryApi('variables', as_list=True)
+    monkeypatch.setattr(flux, 'influx_client', InfluxClient(query_api))
+
+    df = flux.query_data_frame('query', 'variables', ['a', 'b', 'c'])
+
+    assert df['variableCode'].tolist() == ['a', 'b', 'c']
+    assert df.index.tolist() == list(range(3))
+
+
+def test_query_data_frame_empty(flux, monkeypatch):
+    query_api = QueryApi('variables')
+    monkeypatch.setattr(flux, 'influx_client', InfluxClient(query_api))
+
+    df = flux.query_data_frame('query', 'variables', [])
+
+    assert query_api.calls == [('query', {'variables': []})]
+    assert df.empty
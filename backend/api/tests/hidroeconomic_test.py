@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .plans import plan_frame, write_economic_files, row_income
+
+
+@pytest.fixture
+def hidroeconomic(app):
+    from app.utils import hidroeconomic
+    return hidroeconomic
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('monthly', [False, True])
+def test_compute_income_matches_row_loop(hidroeconomic, tmp_path, seed, monthly):
+    uda_file, udi_file = write_economic_files(tmp_path)
+    df = plan_frame(seed)
+
+    income = hidroeconomic.compute_income(df, uda_file, udi_file, monthly)
+    uda_hidroeconomic, udi_hidroeconomic = pd.read_csv(uda_file), pd.read_csv(udi_file)
+    expected = [row_income(x, uda_hidroeconomic, udi_hidroeconomic, monthly) for _, x in df.iterrows()]
+
+    # Demand types without income model are NaN
+    assert np.isnan(income[[value is None for value in expected]]).all()
+    assert income[[value is not None for value in expected]] == pytest.approx(
+        [value for value in expected if value is not None], rel=1e-12, abs=1e-6)
+
+
+def test_interpolation_knots_follow_file(hidroeconomic, tmp_path):
+    uda_file, _ = write_economic_files(tmp_path)
+    knots = hidroeconomic.interpolation_knots(uda_file, 'uda', 'hm3')
+    assert list(knots) == ['UDA01', 'UDA02', 'UDA03']
+    assert knots['UDA02'][0].tolist() == [1.0, 4.0]
+
+    # A changed file is parsed again
+    pd.DataFrame({'uda': ['UDA05'] * 2, 'hm3': [0.0, 1.0], 'cost': [0.0, 1.0]}).to_csv(uda_file, index=False)
+    assert list(hidroeconomic.interpolation_knots(uda_file, 'uda', 'hm3')) == ['UDA05']
+
+
+def test_wetland_income(hidroeconomic):
+    df = pd.DataFrame({'demanda_mi_id': ['HUM01', 'HUM02', 'HUM03']})
+    income = hidroeconomic.calculate_wetland_income(df, {'HUM01': 100.0, 'HUM03': 2.5}, 365)
+    assert income.tolist() == pytest.approx([915 * 100.0 * 1.21 / 365, 0.0, 915 * 2.5 * 1.21 / 365])
@@ -0,0 +1,176 @@
+import types
+import itertools
+import pytest
+
+
+@pytest.fixture
+def jobs(app, monkeypatch):
+    from app.utils import jobs
+    monkeypatch.setattr(jobs, 'MAX_WORKERS', 3)
+    monkeypatch.setattr(jobs, 'WORKER_MEMORY_LIMIT', 0)
+    return jobs
+
+
+class Jobs:
+    # Job table of the pool tests: running jobs by pid and number of queued jobs
+    QUEUED = 'queued'
+    FAILED = 'failed'
+
+    def __init__(self, running=(), queued=0):
+        self.running = [types.SimpleNamespace(id=f'job-{pid}', type='planner', pid=pid) for pid in running]
+        self.queued = queued
+        self.updates = []
+
+    def get_running(self):
+        return self.running
+
+    def count_queued(self):
+        return self.queued
+
+    def update(self, id, **values):
+        self.updates.append((id, values))
+
+
+class Process:
+    pids = itertools.count(1000)
+
+    def __init__(self, name=None, target=None):
+        self.pid = None
+        self.alive = False
+        self.joined = False
+
+    def start(self):
+        self.pid = next(Process.pids)
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        self.joined = True
+
+
+def pool(*alive):
+    workers = {}
+    for is_alive in alive:
+        process = Process()
+        process.start()
+        process.alive = is_alive
+        workers[process.pid] = process
+    return workers
+
+
+@pytest.mark.parametrize('queued, idle, workers, expected', [
+    (0, 0, 0, 0),
+    (2, 0, 0, 2),
+    (5, 0, 0, 3),
+    (2, 1, 1, 1),
+    (1, 2, 2, 0),
+    (4, 0, 3, 0),
+    (4, 1, 2, 1)
+])
+def test_new_workers(jobs, queued, idle, workers, expected):
+    assert jobs.new_workers(queued, idle, workers) == expected
+
+
+def test_dispatch_starts_workers_for_queued_jobs(jobs, monkeypatch):
+    table = Jobs(queued=2)
+    monkeypatch.setattr(jobs, 'SimulationJobModel', table)
+    monkeypatch.setattr(jobs, 'Process', Process)
+
+    workers = {}
+    jobs.dispatch(workers)
+    assert len(workers) == 2
+    assert all(pid == process.pid and process.alive for pid, process in workers.items())
+
+
+def test_dispatch_leaves_queued_jobs_to_idle_workers(jobs, monkeypatch):
+    workers = pool(True, True)
+    busy = list(workers)[0]
+    monkeypatch.setattr(jobs, 'SimulationJobModel', Jobs(running=[busy], queued=1))
+    monkeypatch.setattr(jobs, 'Process', Process)
+
+    jobs.dispatch(workers)
+    assert len(workers) == 2
+
+
+def test_dispatch_bounded_by_pool(jobs, monkeypatch):
+    workers = pool(True, True)
+    monkeypatch.setattr(jobs, 'SimulationJobModel', Jobs(running=list(workers), queued=5))
+    monkeypatch.setattr(jobs, 'Process', Process)
+
+    jobs.dispatch(workers)
+    assert len(workers) == 3
+
+
+def test_dispatch_waits_for_memory(jobs, monkeypatch):
+    workers = pool(True)
+    monkeypatch.setattr(jobs, 'SimulationJobModel', Jobs(running=list(workers), queued=2))
+    monkeypatch.setattr(jobs, 'Process', Process)
+    monkeypatch.setattr(jobs, 'WORKER_MEMORY_LIMIT', 1024)
+    monkeypatch.setattr(jobs.psutil, 'virtual_memory', lambda: types.SimpleNamespace(available=512))
+
+    jobs.dispatch(workers)
+    assert len(workers) == 1
+
+
+def test_reap_fails_jobs_of_dead_workers(jobs, monkeypatch):
+    workers = pool(True, False, False)
+    alive, dead, exited = list(workers)
+    table = Jobs(running=[alive, dead])
+    monkeypatch.setattr(jobs, 'SimulationJobModel', table)
+
+    processes = dict(workers)
+    jobs.reap(workers)
+    # Workers that exited are joined, only the job of the one that died while running it fails
+    assert list(workers) == [alive]
+    assert processes[dead].joined and processes[exited].joined
+    assert [id for id, _ in table.updates] == [f'job-{dead}']
+    assert table.updates[0][1]['status'] == Jobs.FAILED
+
+
+@pytest.fixture
+def job_table(jobs):
+    # Jobs of the database of the app, tests only run on a database without pending jobs
+    from app.models.simulation_job import SimulationJobModel
+    try:
+        jobs.job_table()
+    except Exception:
+        pytest.skip('The database is not reachable')
+    if SimulationJobModel.count_queued() > 0 or SimulationJobModel.get_running():
+        pytest.skip('The database has pending jobs')
+    created = []
+    yield SimulationJobModel, created
+    for id in created:
+        SimulationJobModel.update(id, status=SimulationJobModel.FAILED)
+
+
+def test_claim_next(job_table):
+    SimulationJobModel, created = job_table
+    ids = [SimulationJobModel.create('planner', {'test': i}, '/tmp/jobs/').id for i in range(3)]
+    created += ids
+
+    # The oldest queued jobs are claimed first, up to the running bound
+    first = SimulationJobModel.claim_next(2, 101)
+    second = SimulationJobModel.claim_next(2, 102)
+    assert [first.id, second.id] == ids[:2]
+    assert SimulationJobModel.claim_next(2, 103) is None
+
+    job = SimulationJobModel.get_job(ids[0])
+    assert job.status == SimulationJobModel.RUNNING and job.pid == 101 and job.started is not None
+
+    # A finished job frees its slot
+    SimulationJobModel.update(ids[0], status=SimulationJobModel.FINISHED)
+    third = SimulationJobModel.claim_next(2, 103)
+    assert third.id == ids[2] and third.pid == 103
+    assert SimulationJobModel.count_queued() == 0
+
+
+def test_submit_only_queues(jobs, job_table, monkeypatch):
+    SimulationJobModel, created = job_table
+    monkeypatch.setattr(jobs, 'Process', None)
+
+    job = jobs.submit('planner', {'superficial': 1.0})
+    created.append(job.id)
+    assert jobs.get_job(job.id).status == SimulationJobModel.QUEUED
+    assert jobs.job_status(job)['position'] == 0
@@ -0,0 +1,59 @@
+import os
+import json
+import types
+from datetime import datetime
+import pytest
+
+
+@pytest.fixture
+def batch(client, monkeypatch, tmp_path):
+    # Jobs of the batch asked by the comparison, their totals written in tmp_path
+    from app.utils import jobs, planner
+    batch = []
+    monkeypatch.setattr(jobs, 'get_batch', lambda id: batch if id == 'batch' else [])
+
+    def add(status, superficial=1.0, error=None):
+        result_folder = str(tmp_path / f'job{len(batch)}')
+        params = {'scenario': {'superficial': superficial}, 'start': '2022-01-01', 'end': '2022-01-15'}
+        if status == 'finished':
+            os.makedirs(result_folder, exist_ok=True)
+            with open(result_folder + planner.JOB_TOTALS_FILE, 'w') as f:
+                json.dump({'superficial': superficial, 'deficit': -superficial}, f)
+        batch.append(types.SimpleNamespace(status=status, params=json.dumps(params), result_folder=result_folder,
+                                           error=error, finished=datetime(2022, 1, 1, len(batch))))
+    return add
+
+
+def comparison(client, id='batch'):
+    response = client.get(f'/api/line4/batch-comparison?id={id}')
+    return response.status_code, json.loads(response.get_data())
+
+
+def test_batch_not_found(client, batch):
+    assert comparison(client, 'other')[0] == 404
+
+
+def test_batch_waits_for_every_scenario(client, batch):
+    batch('finished')
+    batch('running')
+    batch('queued')
+    status, body = comparison(client)
+    assert status == 201 and body['detail'].startswith('1 of 3 scenarios')
+
+
+def test_batch_failed_scenario(client, batch):
+    batch('finished')
+    batch('failed', error='Solver failed')
+    batch('running')
+    status, body = comparison(client)
+    assert status == 500 and body['detail'] == 'Solver failed'
+
+
+def test_batch_comparison(client, batch):
+    batch('finished', 0.5)
+    batch('finished', 1.0)
+    status, body = comparison(client)
+    assert status == 200
+    assert body['data']['scenarios'] == [{'superficial': 0.5, 'deficit': -0.5}, {'superficial': 1.0, 'deficit': -1.0}]
+    assert body['data']['start'] == '2022-01-01' and body['data']['end'] == '2022-01-15'
+    assert body['data']['creationDate'] == '2022-01-01 01:00:00'
@@ -0,0 +1,171 @@
+import pandas as pd
+import pytest
+
+from .plans import WATER_TYPES, water_CO2, emission_factor, plan_frame, write_emission_file, \
+    write_economic_files, row_emission, row_income
+
+
+def row_process_table(df, column, files, monthly):
+    # Plan table of the name by name loop process_table replaces
+    emission_df, uda_hidroeconomic, udi_hidroeconomic = [pd.read_csv(file) for file in files]
+    emission_column = 'monthly' if monthly else 'daily'
+
+    dates = df['timestamp'].unique()
+    df = df.sort_values([column])
+    data = []
+    for name in df[column].unique():
+        aux_df = df[df[column] == name].sort_values(['timestamp'])
+        demand = aux_df['init_max_flow'].sum()
+        planned = aux_df['flow'].sum()
+        aux_df_groupby = aux_df.groupby('timestamp')
+        deficitPerDay = aux_df_groupby.apply(lambda x: x['flow'].sum() - x['init_max_flow'].sum()).values
+        volumes = {water_type: float(aux_df_groupby.apply(
+            lambda x: (x['flow'] * x['tipo_agua_' + water_type]).sum()).sum()) for water_type in WATER_TYPES}
+        # Every row adds the water emission of its whole name group
+        dinamic_emission = sum(volumes[water_type] * water_CO2[water_type]
+                               for water_type in WATER_TYPES) * emission_factor
+        emission = aux_df.apply(lambda x: row_emission(x, dinamic_emission, emission_df, emission_column),
+                                axis=1).sum()
+        economical = aux_df.apply(lambda x: row_income(x, uda_hidroeconomic, udi_hidroeconomic, monthly),
+                                  axis=1).sum()
+        data.append({
+            'name': name,
+            'demand': round(float(demand), 4),
+            'planned': round(float(planned), 4),
+            'dates': list(dates),
+            'deficit': round(float(planned - demand), 4),
+            'deficitPerDay': list(map(float, deficitPerDay)),
+            **{water_type: round(volume, 4) for water_type, volume in volumes.items()},
+            'emission': round(float(emission), 0),
+            'economical': round(float(economical), 0)
+        })
+    return data
+
+
+def row_process_plot(df, files, monthly):
+    # Plan plot of the date by date loop process_plot replaces
+    emission_df, uda_hidroeconomic, udi_hidroeconomic = [pd.read_csv(file) for file in files]
+    emission_column = 'monthly' if monthly else 'daily'
+
+    dates = df['timestamp'].sort_values().unique()
+    result = {key: [] for key in ['demand', 'planned', 'incertLow', 'incertHigh', 'CO2', 'economic'] + WATER_TYPES}
+    for date in dates:
+        aux_df = df[df['timestamp'] == date].copy()
+        planned_flow = float(aux_df['flow'].sum())
+        result['demand'].append(float(aux_df['init_max_flow'].sum()))
+        result['planned'].append(planned_flow)
+        result['incertLow'].append(float(aux_df['flow_incert_low'].sum()))
+        result['incertHigh'].append(float(aux_df['flow_incert_high'].sum()))
+        aux_df['total_CO2'] = 0.0
+        for water_type in WATER_TYPES:
+            aux_df[water_type] = aux_df['flow'] * aux_df['tipo_agua_' + water_type]
+            aux_df['total_CO2'] = aux_df['total_CO2'] + aux_df[water_type] * water_CO2[water_type]
+        aux_df['total_CO2'] = aux_df['total_CO2'] * emission_factor
+        co2 = aux_df.apply(lambda x: row_emission(x, x['total_CO2'], emission_df, emission_column), axis=1)
+        economic = aux_df.apply(lambda x: row_income(x, uda_hidroeconomic, udi_hidroeconomic, monthly), axis=1)
+        for water_type in WATER_TYPES:
+            result[water_type].append(aux_df[water_type].sum() / planned_flow if planned_flow != 0 else 0)
+        result['CO2'].append(float(co2.sum()))
+        result['economic'].append(float(economic.sum()))
+    return {'date': dates.tolist(), **result}
+
+
+@pytest.fixture
+def files(tmp_path):
+    # Emission and income tables of the demand units, in the order the row loops read them
+    return [write_emission_file(tmp_path), *write_economic_files(tmp_path)]
+
+
+@pytest.fixture
+def planner(app, monkeypatch, files):
+    from app.utils import planner
+    for name, file in zip(['CO2_EMISSION_FILE', 'UDA_ECONOMIC_FILE', 'UDI_ECONOMIC_FILE'], files):
+        monkeypatch.setattr(planner, name, file)
+    return planner
+
+
+def assert_same_table(data, expected):
+    assert [row['name'] for row in data] == [row['name'] for row in expected]
+    for row, expected_row in zip(data, expected):
+        assert row['dates'] == expected_row['dates']
+        assert row['deficitPerDay'] == pytest.approx(expected_row['deficitPerDay'])
+        for key in ['demand', 'planned', 'deficit'] + WATER_TYPES:
+            assert row[key] == pytest.approx(expected_row[key], abs=1e-4)
+        # Rounded to units, a last digit of the summation order can move them by one
+        for key in ['emission', 'economical']:
+            assert row[key] == pytest.approx(expected_row[key], rel=1e-9, abs=1)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('monthly', [False, True])
+def test_process_table_by_type_matches_row_loop(planner, files, seed, monthly):
+    df = plan_frame(seed)
+    assert_same_table(planner.process_table(df, 'tipo_demanda_nombre', monthly),
+                      row_process_table(df, 'tipo_demanda_nombre', files, monthly))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('type', ['UDA', 'UDI', 'UDU'])
+def test_process_table_by_unit_matches_row_loop(planner, files, seed, type):
+    df = plan_frame(seed)
+    df = df[df['tipo_demanda_nombre'] == type]
+    assert_same_table(planner.process_table(df, 'demanda_mi_id'),
+                      row_process_table(df, 'demanda_mi_id', files, False))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('monthly', [False, True])
+def test_process_plot_matches_row_loop(planner, files, seed, monthly):
+    df = plan_frame(seed)
+    plot = planner.process_plot(df, monthly)
+    expected = row_process_plot(df, files, monthly)
+
+    assert plot['date'] == expected['date']
+    for key in ['demand', 'planned', 'incertLow', 'incertHigh', 'CO2', 'economic'] + WATER_TYPES:
+        assert plot[key] == pytest.approx(expected[key], rel=1e-9, abs=1e-9)
+
+
+def test_aggregate_by_date_unit(planner, files):
+    df = plan_frame(0)
+    df = df[df['demanda_mi_id'] == 'UDA02'].sort_values('timestamp')
+    aggregated = planner.aggregate_by_date(df)
+    expected = row_process_plot(df, files, False)
+
+    assert aggregated['date'].tolist() == expected['date']
+    assert aggregated['CO2'].tolist() == pytest.approx(expected['CO2'])
+    assert aggregated['economic'].tolist() == pytest.approx(expected['economic'])
+    for water_type in WATER_TYPES:
+        assert aggregated['volumes'][water_type].tolist() == pytest.approx(
+            (df['flow'] * df['tipo_agua_' + water_type]).tolist())
+
+
+def test_batch_scenarios_share_horizon(planner):
+    scenarios = planner.batch_scenarios(grid={'superficial': [0.5, 1.0], 'desalada': [0.0, 1.0]})
+    params = planner.batch_params(scenarios, monthly=True)
+    assert [job['scenario'] for job in params] == scenarios
+    assert len({(job['start'], job['end'], job['monthly'], job['daily']) for job in params}) == 1
+
+
+def test_batch_comparison_gathers_scenario_totals(planner, monkeypatch, tmp_path):
+    simulations = []
+
+    def simulate(**params):
+        simulations.append(params)
+        # Scenarios with less surface water meet less demand
+        return plan_frame(0).assign(flow=lambda df: df['flow'] * params['p_percent_agua_superficial'])
+
+    monkeypatch.setattr(planner.scenario_cache, 'simulate', simulate)
+    scenarios = planner.batch_scenarios([{'superficial': 0.5}, {'superficial': 1.0}])
+    result_folders = []
+    for i, job in enumerate(planner.batch_params(scenarios)):
+        result_folders.append(str(tmp_path / f'job{i}'))
+        planner.generate_batch_scenario(**job, result_folder=result_folders[-1])
+
+    assert [params['p_date_init'] for params in simulations] == [job['start'] for job in planner.batch_params(scenarios)]
+    comparison = planner.batch_comparison(result_folders, '2022-01-01', '2022-01-06', pd.Timestamp('2022-01-01 10:00'))
+    assert comparison['creationDate'] == '2022-01-01 10:00:00'
+    assert [scenario['superficial'] for scenario in comparison['scenarios']] == [0.5, 1.0]
+    half, full = comparison['scenarios']
+    assert half['demand'] == full['demand']
+    assert half['planned'] == pytest.approx(full['planned'] / 2, abs=1e-3)
+    assert full == {**scenarios[1], **planner.plan_totals(plan_frame(0))}
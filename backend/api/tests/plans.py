@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+
+WATER_TYPES = ['superficial', 'subterranea', 'reutilizada', 'trasvase', 'desalada']
+
+# Emission and income models of the row by row calculators the frame kernels replace
+water_CO2 = {'superficial': 0.06, 'subterranea': 0.9, 'reutilizada': 0.78, 'trasvase': 1.21, 'desalada': 4.32}
+emission_factor = 0.000354
+ud_types_CO2 = {
+    'UDU': 17.432137489428,
+    'UDI': {'UDI01': 692074, 'UDI02': 1211850, 'UDI03': 372821, 'UDI04': 478388, 'UDI05': 799353,
+            'UDI06': 386516, 'UDI07': 168925},
+    'UDRG': 692.67920511001,
+    'AMBIENTAL': -395.2
+}
+WATER_COST = {'superficial': 3000, 'subterranea': 250000, 'reutilizada': 0, 'trasvase': 150000, 'desalada': 600000}
+
+# Demand units of the test plans: UDA03 has no emission, UDA04 no income curve and UDI09 no income curve nor emission
+UNITS = [('UDA01', 'UDA'), ('UDA02', 'UDA'), ('UDA03', 'UDA'), ('UDA04', 'UDA'), ('UDI01', 'UDI'), ('UDI02', 'UDI'),
+         ('UDI07', 'UDI'), ('UDI09', 'UDI'), ('UDU01', 'UDU'), ('UDU02', 'UDU'), ('UDRG01', 'UDRG'),
+         ('AMB01', 'AMBIENTAL')]
+
+
+def plan_frame(seed, n_dates=6):
+    # Random simulation frame of the test units
+    rng = np.random.default_rng(seed)
+    rows = []
+    for date in pd.date_range('2022-01-01', periods=n_dates).strftime('%Y-%m-%d'):
+        for id, type in UNITS:
+            init_max_flow = [0.0, rng.uniform(0.1, 5)][rng.random() > 0.15]
+            # Unmet, partially met and fully met demands
+            flow = [0.0, init_max_flow * rng.uniform(0.2, 1), init_max_flow][rng.integers(3)]
+            shares = rng.dirichlet(np.ones(len(WATER_TYPES))) if flow > 0 else np.zeros(len(WATER_TYPES))
+            rows.append({
+                'timestamp': date, 'demanda_mi_id': id, 'tipo_demanda_nombre': type, 'flow': flow,
+                'init_max_flow': init_max_flow, 'flow_incert_low': flow * 0.9, 'flow_incert_high': flow * 1.1,
+                **{'tipo_agua_' + water_type: share for water_type, share in zip(WATER_TYPES, shares)}
+            })
+    # Plans are not sorted by unit nor by date
+    return pd.DataFrame(rows).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def write_emission_file(folder):
+    # Per unit UDA emissions, UDA02 listed twice
+    emission_file = folder / 'CO2_emission.csv'
+    pd.DataFrame({'id': ['UDA01', 'UDA02', 'UDA02', 'UDA04'], 'daily': [1.5, 2.25, 9.0, 0.75],
+                  'monthly': [45.0, 67.5, 270.0, 22.5]}).to_csv(emission_file, index=False)
+    return str(emission_file)
+
+
+def write_economic_files(folder):
+    # Income curves of the test units, the UDA ones by hm3 and the UDI ones by supplied proportion
+    uda_file = folder / 'agricultureEconomic.csv'
+    pd.DataFrame({'uda': ['UDA01'] * 3 + ['UDA02'] * 2 + ['UDA03'] * 3,
+                  'hm3': [0.0, 2.0, 6.0, 1.0, 4.0, 0.0, 0.5, 3.0],
+                  'cost': [0.0, 5e6, 8e6, 1e6, 2.5e6, 0.0, 1e5, 9e5]}).to_csv(uda_file, index=False)
+    udi_file = folder / 'industryEconomic.csv'
+    pd.DataFrame({'udi': ['UDI01'] * 3 + ['UDI02'] * 2,
+                  'proportion': [0.0, 0.5, 1.0, 0.2, 1.0],
+                  'cost': [0.0, 4e6, 6e6, 1e6, 3e6]}).to_csv(udi_file, index=False)
+    return str(uda_file), str(udi_file)
+
+
+def compute_CO2_uda(dinamic_co2, static_co2):
+    if static_co2.shape[0] == 0:
+        return dinamic_co2
+    return static_co2.iloc[0] + dinamic_co2
+
+
+def compute_CO2_other(dinamic_co2, flow, id, type):
+    static_co2 = 0
+    if type in ud_types_CO2:
+        if type == 'UDI':
+            if id in ud_types_CO2[type]:
+                static_co2 = ud_types_CO2[type][id] * flow
+        else:
+            static_co2 = ud_types_CO2[type] * flow
+    return static_co2 + dinamic_co2
+
+
+def row_emission(x, dinamic_co2, emission_df, emission_column):
+    # Emission of a single row adding the emission of the water it receives, `dinamic_co2`
+    if x['tipo_demanda_nombre'] == 'UDA':
+        return compute_CO2_uda(dinamic_co2, emission_df[emission_df['id'] == x['demanda_mi_id']][emission_column])
+    return compute_CO2_other(dinamic_co2, x['flow'], x['demanda_mi_id'], x['tipo_demanda_nombre'])
+
+
+def row_water_emission(x):
+    return sum(x['flow'] * x['tipo_agua_' + water_type] * water_CO2[water_type]
+               for water_type in WATER_TYPES) * emission_factor
+
+
+def row_water_cost(x):
+    return x['flow'] * sum(x['tipo_agua_' + water_type] * WATER_COST[water_type] for water_type in WATER_TYPES)
+
+
+def row_income(x, uda_hidroeconomic, udi_hidroeconomic, monthly):
+    # Income of a single row, None for demand types without income model
+    period_factor = 12 if monthly else 365
+    type, flow, init_max_flow = x['tipo_demanda_nombre'], x['flow'], x['init_max_flow']
+    if type == 'UDA':
+        curve = uda_hidroeconomic[uda_hidroeconomic['uda'] == x['demanda_mi_id']]
+        if flow == 0 or curve.shape[0] == 0 or init_max_flow == 0:
+            return 0
+        water_demand = (flow / init_max_flow) * curve.iloc[-1]['hm3']
+        return np.interp([water_demand], curve['hm3'], curve['cost'])[0] * 1.141 / period_factor - row_water_cost(x)
+    if type == 'UDRG':
+        return flow * 1000000 * 9.3 * 1.362 - row_water_cost(x)
+    if type == 'UDU':
+        e = -0.15
+        P = 3.16 * 1000000
+        income = 0
+        if init_max_flow != 0 and flow != 0:
+            income = P * (e - 1) / e * flow + 0.5 * P / e / init_max_flow * flow ** 2 * 1.061
+        return income - row_water_cost(x)
+    if type == 'UDI':
+        if x['demanda_mi_id'] == 'UDI07':
+            return flow * 0.68548718 * 1000 * 1000000 * 1.088 - row_water_cost(x)
+        curve = udi_hidroeconomic[udi_hidroeconomic['udi'] == x['demanda_mi_id']]
+        if flow == 0 or curve.shape[0] == 0:
+            return 0
+        income = 0
+        if init_max_flow != 0:
+            income = np.interp([flow / init_max_flow], curve['proportion'], curve['cost'])[0] * 1.141 / period_factor
+        return income - row_water_cost(x)
+    return None
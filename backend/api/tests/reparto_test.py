@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+
+def reparto_por_filas(init_max_flow, recursos):
+    # Row by row allocation of the model before RepartirRecursosADemandas: every demand takes, in order,
+    # what it still lacks from each water type it uses while the type has any resource left
+    flow = np.zeros(len(init_max_flow))
+    q_asignado = [np.zeros(len(init_max_flow)) for _ in recursos]
+    restante = [recurso for recurso, _ in recursos]
+    for i in range(len(init_max_flow)):
+        for j, (_, usa_tipo_agua) in enumerate(recursos):
+            if flow[i] < init_max_flow[i] and usa_tipo_agua[i] and restante[j] > 0.0:
+                q = min(init_max_flow[i] - flow[i], restante[j])
+                flow[i] += q
+                q_asignado[j][i] += q
+                restante[j] -= q
+    return flow, q_asignado
+
+
+def assert_same_reparto(init_max_flow, recursos):
+    from app.utils.modelo_L4_L5 import RepartirRecursosADemandas
+
+    flow, lst_q_asignado = RepartirRecursosADemandas(init_max_flow, recursos)
+    expected_flow, expected_q_asignado = reparto_por_filas(init_max_flow, recursos)
+
+    assert np.allclose(flow, expected_flow)
+    assert len(lst_q_asignado) == len(expected_q_asignado)
+    for q_asignado, expected in zip(lst_q_asignado, expected_q_asignado):
+        assert np.allclose(q_asignado, expected)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_reparto_matches_row_loop(app, seed):
+    rng = np.random.default_rng(seed)
+    n = 40
+    init_max_flow = rng.uniform(0, 5, n) * (rng.random(n) > 0.1)
+    # From scarce to plentiful resources, some water types used by no demand
+    recursos = [(rng.uniform(0, 60), rng.random(n) > rng.uniform(0, 1)) for _ in range(5)]
+    assert_same_reparto(init_max_flow, recursos)
+
+
+def test_reparto_without_resources(app):
+    init_max_flow = np.array([1.0, 2.0, 0.0, 3.0])
+    recursos = [(0.0, np.ones(4, dtype=bool)) for _ in range(5)]
+    assert_same_reparto(init_max_flow, recursos)
+
+
+def test_reparto_with_demands_met(app):
+    init_max_flow = np.array([1.0, 2.0, 0.5])
+    usa_tipo_agua = np.ones(3, dtype=bool)
+    # The first type covers every demand, nothing is taken from the others
+    recursos = [(10.0, usa_tipo_agua), (4.0, usa_tipo_agua), (4.0, usa_tipo_agua)]
+    assert_same_reparto(init_max_flow, recursos)
+
+
+def test_reparto_exhausts_resource(app):
+    init_max_flow = np.array([2.0, 2.0, 2.0, 2.0])
+    usa_tipo_agua = np.array([True, False, True, True])
+    # The third demand gets what is left of the first type and the rest from the second one
+    recursos = [(3.0, usa_tipo_agua), (5.0, np.ones(4, dtype=bool))]
+    assert_same_reparto(init_max_flow, recursos)
@@ -0,0 +1,52 @@
+import types
+import pandas as pd
+import pytest
+
+
+COLUMN_NAMES = {'02Q02E01': 'PH', '02Q02E03': 'Conductividad', '02Q02E07': 'SAC'}
+
+
+@pytest.fixture
+def saica(app, monkeypatch):
+    # Flux queries of the SAICA controller, answered with the pivoted hourly means of two of the variables
+    from app.controllers import saica
+    queries = []
+    frames = [pd.DataFrame({
+        'result': '_result', 'table': 0,
+        '_time': pd.date_range('2023-01-01', periods=3, freq='h', tz='UTC'),
+        '02Q02E03': [510.0, 512.5, 511.0],
+        '02Q02E01': [7.9, 8.0, 8.1]
+    })]
+
+    def query_data_frame(query, params=None):
+        queries.append((query, params))
+        return frames.pop(0) if frames else pd.DataFrame()
+
+    monkeypatch.setattr(saica, 'influx_client', types.SimpleNamespace(
+        query_api=lambda: types.SimpleNamespace(query_data_frame=query_data_frame)))
+    monkeypatch.setattr(saica, 'queries', queries, raising=False)
+    return saica
+
+
+def test_station_in_single_query(saica):
+    df = saica.query_data(COLUMN_NAMES, '2023-01-01T00:00:00Z', '2023-01-01T03:00:00Z')
+
+    assert len(saica.queries) == 1
+    query, params = saica.queries[0]
+    assert params == {'variables': list(COLUMN_NAMES), 'start': '2023-01-01T00:00:00Z', 'end': '2023-01-01T03:00:00Z'}
+    assert 'contains(value: r["variableCode"], set: params.variables)' in query
+    assert 'pivot(rowKey: ["_time"], columnKey: ["variableCode"]' in query
+
+    # One column per variable in the order of the station, the ones without data empty
+    assert list(df.columns) == ['PH', 'Conductividad', 'SAC']
+    assert df['PH'].tolist() == [7.9, 8.0, 8.1]
+    assert df['SAC'].isna().all()
+    assert df.index.name == 'time' and df.index.tz is None
+    assert df.index[0] == pd.Timestamp('2023-01-01 00:00')
+
+
+def test_station_without_data(saica):
+    saica.query_data(COLUMN_NAMES, '2023-01-01T00:00:00Z', '2023-01-01T03:00:00Z')
+    df = saica.query_data(COLUMN_NAMES, '2023-02-01T00:00:00Z', '2023-02-01T03:00:00Z')
+    assert list(df.columns) == ['PH', 'Conductividad', 'SAC']
+    assert df.empty
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone, timedelta
+import pytest
+
+
+VARIABLES = ['TEST_LAST_VALUE_1', 'TEST_LAST_VALUE_2']
+
+
+@pytest.fixture
+def last_values(app):
+    # Last values of the database of the app, test variables are removed after every test
+    from app import db
+    from app.models.saih_last_value import SAIHLastValueModel
+    try:
+        SAIHLastValueModel.create_table()
+    except Exception:
+        pytest.skip('The database is not reachable')
+    yield SAIHLastValueModel
+    SAIHLastValueModel.query.filter(SAIHLastValueModel.variable_code.in_(VARIABLES)).delete()
+    db.session.commit()
+
+
+def stored(model, variable):
+    from app import db
+    db.session.expire_all()
+    return model.query.get(variable)
+
+
+def value(variable, hour, value):
+    return {'variable_code': variable, 'time': datetime(2023, 1, 1, hour, tzinfo=timezone.utc), 'value': value}
+
+
+def test_write_values_keeps_newest(last_values):
+    last_values.write_values([value(VARIABLES[0], 10, 1.0)])
+    # An older value written later does not replace it, a newer one does
+    last_values.write_values([value(VARIABLES[0], 9, 2.0)])
+    assert stored(last_values, VARIABLES[0]).value == 1.0
+    last_values.write_values([value(VARIABLES[0], 11, 3.0)])
+    assert stored(last_values, VARIABLES[0]).value == 3.0
+
+
+def test_write_values_requires_values(last_values):
+    with pytest.raises(Exception):
+        last_values.write_values([])
+
+
+def test_missing_replaced_by_values(last_values):
+    checked = datetime.now(timezone.utc)
+    last_values.write_values([value(VARIABLES[0], 10, 1.0)])
+    last_values.write_missing(VARIABLES, checked)
+
+    # Variables with a value keep it
+    assert stored(last_values, VARIABLES[0]).value == 1.0
+    missing = stored(last_values, VARIABLES[1])
+    assert missing.time is None and missing.value is None
+    assert abs(missing.checked - checked) < timedelta(seconds=1)
+
+    last_values.write_values([value(VARIABLES[1], 8, 4.0)])
+    assert stored(last_values, VARIABLES[1]).value == 4.0
@@ -0,0 +1,132 @@
+import json
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def queries(client, monkeypatch):
+    # Flux queries of the SAIH values, answered without rows
+    from app.utils import flux, downsampling
+    queries = []
+
+    def query_data_frame(query, set_param, values, params=None):
+        queries.append(query)
+        return pd.DataFrame()
+
+    def query_stream(query, set_param, values, params=None):
+        queries.append(query)
+        return iter([])
+
+    monkeypatch.setattr(flux, 'query_data_frame', query_data_frame)
+    monkeypatch.setattr(flux, 'query_stream', query_stream)
+    monkeypatch.setattr(downsampling, 'available_tiers', lambda: {
+        window: pd.Timestamp('2000-01-01', tz='UTC') for window in downsampling.TIERS})
+    return queries
+
+
+@pytest.fixture
+def bucket(client):
+    from app.utils import downsampling
+    return downsampling.BUCKET
+
+
+def get_values(client, **body):
+    return client.post('/api/saih/get-variable-values', json={
+        'variables': ['V1'], 'start_date': '2021-01-01T00:00:00Z', 'end_date': '2021-02-01T00:00:00Z', **body})
+
+
+def test_values_resolved_to_tier(client, queries, bucket):
+    response = get_values(client)
+    assert json.loads(response.get_data())['ok']
+    assert f'from(bucket: "{bucket}_1h")' in queries[0]
+
+
+def test_values_raw(client, queries, bucket):
+    get_values(client, resolution='raw')
+    assert f'from(bucket: "{bucket}")' in queries[0]
+    assert 'aggregateWindow' not in queries[0]
+
+
+def test_values_raw_window(client, queries, bucket):
+    get_values(client, resolution='raw', aggregation='max', window='1d')
+    assert f'from(bucket: "{bucket}")' in queries[0]
+    assert 'aggregateWindow(every: 1d, fn: max' in queries[0]
+
+
+def test_export_raw(client, queries, bucket):
+    # Exports read the raw values unless they ask for the resolution of the span
+    response = get_values(client, format='csv')
+    assert response.get_data(as_text=True) == '_time,_value,variableCode\r\n'
+    assert f'from(bucket: "{bucket}")' in queries[0]
+    get_values(client, format='csv', resolution='auto')
+    assert f'from(bucket: "{bucket}_1h")' in queries[1]
+
+
+def test_values_unsupported_resolution(client, queries):
+    response = get_values(client, resolution='hourly')
+    assert response.status_code == 400
+    assert queries == []
+
+
+class LastValues:
+    # Last value table of the controller tests
+    def __init__(self, rows):
+        self.rows = rows
+        self.written = []
+        self.missing = []
+
+    def create_table(self):
+        pass
+
+    def get_values(self, variables):
+        return [row for row in self.rows if row.variable_code in variables]
+
+    def write_values(self, values):
+        self.written += values
+
+    def write_missing(self, variables, checked):
+        self.missing += variables
+
+
+@pytest.fixture
+def last_values(client, monkeypatch):
+    import types
+    from app.controllers import saih
+    from app.utils import flux
+    now = pd.Timestamp.now(tz='UTC')
+    table = LastValues([
+        types.SimpleNamespace(variable_code='V1', time=now - pd.Timedelta(hours=1), value=1.0, checked=None),
+        types.SimpleNamespace(variable_code='OLD', time=now - pd.Timedelta(days=90), value=2.0, checked=None),
+        types.SimpleNamespace(variable_code='EMPTY', time=None, value=None, checked=now - pd.Timedelta(minutes=5)),
+        types.SimpleNamespace(variable_code='EXPIRED', time=None, value=None, checked=now - pd.Timedelta(days=1))
+    ])
+    table.scanned = []
+
+    def query_data_frame(query, set_param, values, params=None):
+        table.scanned += values
+        # Only EXPIRED has values in the bucket now
+        return pd.DataFrame([{'_time': now, '_value': 3.0, 'variableCode': variable}
+                             for variable in values if variable == 'EXPIRED'])
+
+    monkeypatch.setattr(saih, 'SAIHLastValueModel', table)
+    monkeypatch.setattr(saih, '_last_value_table_created', True)
+    monkeypatch.setattr(flux, 'query_data_frame', query_data_frame)
+    return table
+
+
+def test_last_values_scan_only_unknown_variables(client, last_values):
+    response = client.post('/api/saih/get-variable-last-values',
+                           json={'variables': ['V1', 'OLD', 'EMPTY', 'EXPIRED', 'NEW']})
+    data = json.loads(response.get_data())['data']
+
+    assert sorted(last_values.scanned) == ['EXPIRED', 'NEW']
+    assert sorted(value['variableCode'] for value in data) == ['EXPIRED', 'V1']
+    assert [value['variable_code'] for value in last_values.written] == ['EXPIRED']
+    # Variables without values are kept so they are not scanned on every call
+    assert last_values.missing == ['NEW']
+
+
+def test_last_values_without_scan(client, last_values):
+    response = client.post('/api/saih/get-variable-last-values', json={'variables': ['V1', 'EMPTY']})
+    assert [value['variableCode'] for value in json.loads(response.get_data())['data']] == ['V1']
+    assert last_values.scanned == [] and last_values.missing == []
@@ -0,0 +1,88 @@
+import os
+import pandas as pd
+import pytest
+
+
+PARAMS = {'p_simulation_type': 'planning', 'p_start_date': '2022-01-01', 'p_end_date': '2022-12-31',
+          'p_superficial': 1.0}
+
+
+@pytest.fixture
+def cache(app, tmp_path, monkeypatch):
+    # Cache of a model with two input files, run by `cache.runs`
+    from app.utils import scenario_cache, modelo_L4_L5 as modelo
+    inputs = [tmp_path / 'config.json', tmp_path / 'physical.xlsx']
+    for file in inputs:
+        file.write_text(file.name)
+    monkeypatch.setattr(scenario_cache, 'DATA_FOLDER', str(tmp_path))
+    monkeypatch.setattr(scenario_cache, 'CACHE_FOLDER', str(tmp_path / 'cache') + '/')
+    monkeypatch.setattr(scenario_cache, 'CACHE_SIZE', 1024 * 1024)
+    monkeypatch.setattr(modelo, 'ArchivosDeEntrada', lambda: [str(file) for file in inputs])
+    monkeypatch.setattr(modelo, 'ObtenerSolver', lambda simulation_type, solver=None: solver or 'glpk')
+
+    runs = []
+
+    def simulate(**params):
+        runs.append(params)
+        return pd.DataFrame({'flow': [params['p_superficial']] * 3})
+
+    monkeypatch.setattr(modelo, 'Planificar_Optimizar_Suministros_a_Demandas', simulate)
+    monkeypatch.setattr(scenario_cache, 'inputs', inputs, raising=False)
+    monkeypatch.setattr(scenario_cache, 'runs', runs, raising=False)
+    return scenario_cache
+
+
+def test_key_ignores_param_order(cache):
+    assert cache.scenario_key(PARAMS) == cache.scenario_key(dict(reversed(list(PARAMS.items()))))
+
+
+@pytest.mark.parametrize('change', [{'p_superficial': 0.5}, {'p_end_date': '2022-06-30'}, {'p_solver': 'lpsolve'}])
+def test_key_follows_params_and_solver(cache, change):
+    assert cache.scenario_key(PARAMS) != cache.scenario_key({**PARAMS, **change})
+
+
+def test_key_follows_inputs(cache):
+    key = cache.scenario_key(PARAMS)
+    cache.inputs[1].write_text('physical data changed')
+    assert cache.scenario_key(PARAMS) != key
+
+
+def test_key_follows_model_version(cache, monkeypatch):
+    key = cache.scenario_key(PARAMS)
+    monkeypatch.setattr(cache, 'MODEL_VERSION', 'other')
+    assert cache.scenario_key(PARAMS) != key
+
+
+def test_simulate_reuses_results(cache):
+    first = cache.simulate(**PARAMS)
+    assert cache.simulate(**PARAMS).equals(first)
+    assert len(cache.runs) == 1
+
+    cache.simulate(**{**PARAMS, 'p_superficial': 0.5})
+    assert len(cache.runs) == 2
+
+    # Results of the previous inputs are not reused
+    cache.inputs[0].write_text('configuration changed')
+    cache.simulate(**PARAMS)
+    assert len(cache.runs) == 3
+
+
+def test_evict_least_recently_used(cache, monkeypatch):
+    keys = ['a', 'b', 'c']
+    for i, key in enumerate(keys):
+        cache.write_result(key, pd.DataFrame({'flow': range(100)}))
+        os.utime(cache.cache_file(key), (1000 + i, 1000 + i))
+    size = os.path.getsize(cache.cache_file('a'))
+
+    # Reading an entry makes it the most recently used one
+    assert cache.read_result('a') is not None
+    monkeypatch.setattr(cache, 'CACHE_SIZE', 2 * size)
+    cache.evict()
+    assert [os.path.exists(cache.cache_file(key)) for key in keys] == [True, False, True]
+    assert cache.read_result('b') is None
+
+
+def test_evict_within_budget(cache):
+    for key in ['a', 'b']:
+        cache.write_result(key, pd.DataFrame({'flow': range(100)}))
+    assert all(os.path.exists(cache.cache_file(key)) for key in ['a', 'b'])
@@ -0,0 +1,65 @@
+import io
+import csv
+import json
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+
+COLUMNS = ['_time', '_value', 'variableCode']
+
+
+@pytest.fixture
+def streaming(app, monkeypatch):
+    from app.utils import streaming
+    # Small chunks and batches, so a few records span several of them
+    monkeypatch.setattr(streaming, 'CHUNK_BYTES', 256)
+    monkeypatch.setattr(streaming, 'ARROW_BATCH_SIZE', 7)
+    return streaming
+
+
+def records(n):
+    return [{'_time': pd.Timestamp('2021-01-01', tz='UTC') + pd.Timedelta(hours=i), '_value': i * 0.5,
+             'variableCode': f'V{i % 3}', 'result': '_result'} for i in range(n)]
+
+
+def test_ndjson_chunks(streaming):
+    chunks = list(streaming.ndjson_chunks(records(50), COLUMNS))
+    assert len(chunks) > 1
+    rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    assert rows[1] == {'_time': 1609462800000, '_value': 0.5, 'variableCode': 'V1'}
+    assert [row['_value'] for row in rows] == [i * 0.5 for i in range(50)]
+
+
+def test_csv_chunks(streaming):
+    chunks = list(streaming.csv_chunks(records(50), COLUMNS))
+    assert len(chunks) > 1
+    rows = list(csv.reader(io.StringIO(''.join(chunks))))
+    assert rows[0] == COLUMNS
+    assert len(rows) == 51
+    assert rows[2][1:] == ['0.5', 'V1']
+
+
+@pytest.mark.parametrize('n', [0, 7, 50])
+def test_arrow_chunks(streaming, n):
+    chunks = list(streaming.arrow_chunks(records(n), COLUMNS))
+    table = pa.ipc.open_stream(b''.join(chunks)).read_all()
+    assert table.column_names == COLUMNS
+    assert table.num_rows == n
+    assert table.column('_value').to_pylist() == [i * 0.5 for i in range(n)]
+    # One chunk per full batch, plus the last one
+    assert len(chunks) == n // 7 + 1
+
+
+def test_checked_raises_before_the_response(streaming):
+    def failing():
+        raise RuntimeError('query failed')
+        yield
+
+    with pytest.raises(RuntimeError):
+        streaming.checked(failing())
+
+
+def test_checked_keeps_every_record(streaming):
+    assert list(streaming.checked(iter(range(5)))) == list(range(5))
+    assert list(streaming.checked(iter([]))) == []
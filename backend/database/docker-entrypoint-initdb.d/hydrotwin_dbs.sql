@@ -286,6 +286,40 @@ CREATE TABLE public.system_unit (
 
 ALTER TABLE public.system_unit OWNER TO :db_admin;
 
+--
+-- Name: simulation_job; Type: TABLE; Schema: public; Owner: db_admin
+--
+
+CREATE TABLE public.simulation_job (
+    id character varying NOT NULL,
+    type character varying,
+    status character varying,
+    params text,
+    pid integer,
+    result_folder character varying,
+    error character varying,
+    created timestamp without time zone,
+    started timestamp without time zone,
+    finished timestamp without time zone
+);
+
+
+ALTER TABLE public.simulation_job OWNER TO :db_admin;
+
+
+--
+-- Name: saih_last_value; Type: TABLE; Schema: public; Owner: db_admin
+--
+
+CREATE TABLE public.saih_last_value (
+    variable_code character varying NOT NULL,
+    "time" timestamp with time zone,
+    value double precision
+);
+
+
+ALTER TABLE public.saih_last_value OWNER TO :db_admin;
+
 
 --
 -- Data for Name: aquifer; Type: TABLE DATA; Schema: public; Owner: db_admin
@@ -386,6 +420,20 @@ COPY public.system_unit (zone, name, geometry, ha) FROM '/docker-entrypoint-init
 ALTER TABLE ONLY public.aquifer
     ADD CONSTRAINT aquifer_pkey PRIMARY KEY (code);
 
+--
+-- Name: simulation_job simulation_job_pkey; Type: CONSTRAINT; Schema: public; Owner: db_admin
+--
+
+ALTER TABLE ONLY public.simulation_job
+    ADD CONSTRAINT simulation_job_pkey PRIMARY KEY (id);
+
+--
+-- Name: saih_last_value saih_last_value_pkey; Type: CONSTRAINT; Schema: public; Owner: db_admin
+--
+
+ALTER TABLE ONLY public.saih_last_value
+    ADD CONSTRAINT saih_last_value_pkey PRIMARY KEY (variable_code);
+
 --
 -- Name: demand_unit code; Type: CONSTRAINT; Schema: public; Owner: db_admin
 --
@@ -123,6 +123,27 @@ def write_data(data: pd.DataFrame, bucket: str, measurement: str, tags: dict):
         raise Exception(f'Error writing data for measurement {measurement} in bucket {bucket}: {str(e)}')
 
 
+@retry(tries=3, delay=10, backoff=1.5, logger=None)
+def put_last_values(values: list):
+    resp = requests.put(url=f'{API_URL}/saih/post-last-values', json={'values': values})
+    if resp.status_code != 200:
+        raise Exception(f'The following error occurred trying to post last values to DB: {resp.json()}')
+
+
+def post_last_values(data: pd.DataFrame):
+    # the API keeps the last value of every variable, to serve it without scanning the bucket; it is only
+    # a cache, the API falls back to the bucket for the variables it misses
+    if data.empty:
+        return
+    last_values = data.rename_axis('time').reset_index().sort_values('time').groupby('variableCode').last()
+    values = [{'variable_code': code, 'time': row['time'].isoformat(), 'value': float(row['value'])}
+              for code, row in last_values.iterrows()]
+    try:
+        put_last_values(values)
+    except Exception as e:
+        logging.warning(f'Last values of {len(values)} variables not updated: {e}')
+
+
 @retry(tries=3, delay=10)
 def delete_data(start_time, stop_time, measurement, measurement_point_code, typology, bucket):
     delete_api = influx_client.delete_api()
@@ -212,6 +233,7 @@ def reingest():
     saih_data.set_index('_time', inplace=True)
     saih_data.sort_index(inplace=True)
     write_data(saih_data, BUCKET, MEASUREMENT, ['variableCode'])
+    post_last_values(saih_data)
     # remove data from raw_data bucket
     logging.info(f'Removing data from bucket {RAW_DATA_BUCKET}...')
     removal_data = raw_data.dropna()
@@ -223,7 +245,7 @@ def ingest():
     global DATA_PATH
     logging.info('### STARTING INGESTION PROCESS ###')
     # get last record date from DB
-    last_record_date = DATA_SINCE if DATA_SINCE else get_last_record(BUCKET)
+    last_record_date = DATA_SINCE if DATA_SINCE else get_last_record_from_api(BUCKET)
     # get all variable codes from DB
     all_vars_df = get_all_variables()
     
@@ -264,6 +286,7 @@ def ingest():
             # insert data into DB
             saih_data = csv_data.drop(columns=['measurementPointCode', 'typology', 'unit']).dropna()
             write_data(saih_data, BUCKET, MEASUREMENT, ['variableCode'])
+            post_last_values(saih_data)
             saih_raw_data = csv_data.loc[(csv_data['variableCode'].notna() == False)].drop(columns=['variableCode', 'unit'])
             write_data(saih_raw_data, RAW_DATA_BUCKET, MEASUREMENT, ['measurementPointCode', 'typology'])
     
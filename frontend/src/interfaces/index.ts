@@ -243,6 +243,27 @@ export interface PlannerConfigDataResponse extends ResponseData {
     data: PlannerConfigData;
 }
 
+/**
+ * Simulation jobs
+ */
+export interface JobProgress {
+    phase: string | null;
+    timestep: number;
+    timesteps: number;
+}
+
+export interface JobStatus {
+    id: string;
+    status: "queued" | "running" | "finished" | "failed";
+    error: string | null;
+    position: number;
+    progress: JobProgress | null;
+}
+
+export interface JobStatusResponse extends ResponseData {
+    data: JobStatus;
+}
+
 /**
  * Optimizer
  */
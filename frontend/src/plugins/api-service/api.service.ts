@@ -359,6 +359,13 @@ export class APIService {
         );
     }
 
+    getSimulationIndicators<T>(line: string, period: string) {
+        return this.execute<T>(
+            "get",
+            `/demand-unit/get-simulation-indicators?line=${line}&period=${period}`
+        );
+    }
+
     getForecast<T>(
         variable: string,
         forecasting = 1,
@@ -435,6 +442,22 @@ export class APIService {
         return this.execute<T>("get", `/line4/check-plan-generated?id=${id}`);
     }
 
+    planProgress<T>(id: string) {
+        return this.execute<T>("get", `/line4/get-job?id=${id}`);
+    }
+
+    generateBatch<T>(monthly: boolean, daily: boolean, scenarios, grid) {
+        return this.execute<T>(
+            "post",
+            `/line4/generate-batch?monthly=${monthly}&daily=${daily}`,
+            { scenarios, grid }
+        );
+    }
+
+    getBatchComparison<T>(id: string) {
+        return this.execute<T>("get", `/line4/batch-comparison?id=${id}`);
+    }
+
     getAvailableResources<T>() {
         return this.execute<T>("get", "/line4/get-resources");
     }
@@ -516,6 +539,10 @@ export class APIService {
         );
     }
 
+    optimizedPlanProgress<T>(id: string) {
+        return this.execute<T>("get", `/line5/get-job?id=${id}`);
+    }
+
     getOptimizerTableData<T>(category, monthly, daily) {
         if (category) {
             return this.execute<T>(